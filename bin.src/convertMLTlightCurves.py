@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import argparse
+
+# Convert the .npz file of MLT flare light curves into a directory of
+# uncompressed .npy files that MLTflaringMixin can memory-map, so that
+# all of the processes simulating flares share one copy of the light
+# curves.  By default, the directory is written next to the .npz file
+# (with the same name minus '.npz'), which is where MLTflaringMixin
+# looks for it.
+
+if __name__ == '__main__':
+
+    # Hide imports here so documentation builds
+    from lsst.sims.catUtils.mixins import MLTflaringMixin
+    from lsst.sims.catUtils.mixins import convert_mlt_light_curves
+
+    parser = argparse.ArgumentParser(description="Convert MLT flare light curves "
+                                     "into a memory-mappable directory")
+    parser.add_argument("--npz_file", type=str, default=MLTflaringMixin._mlt_lc_file,
+                        help="the .npz file of light curves to convert")
+    parser.add_argument("--out_dir", type=str, default=None,
+                        help="the directory to write (defaults to the name "
+                        "of npz_file without '.npz')")
+
+    args = parser.parse_args()
+
+    out_dir = convert_mlt_light_curves(args.npz_file, out_dir=args.out_dir)
+    print('wrote %s' % out_dir)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import argparse
+import os
+
+# Convert the text file of parametrized (Kepler-derived) light curve
+# models into a directory of memory-mappable .npy columns.  By default,
+# the directory is written next to the text file (with the same name
+# minus '.txt.gz'), which is where ParametrizedLightCurveMixin looks
+# for it, so that loading the models no longer requires parsing the
+# text file.
+
+if __name__ == '__main__':
+
+    # Hide imports here so documentation builds
+    from lsst.utils import getPackageDir
+    from lsst.sims.catUtils.mixins import convert_parametrized_light_curves
+
+    parser = argparse.ArgumentParser(description="Convert parametrized light "
+                                     "curve models into a memory-mappable directory")
+    parser.add_argument("--lc_file", type=str, default=None,
+                        help="the text file of light curve models to convert "
+                        "(defaults to kplr_lc_params.txt.gz in sims_data)")
+    parser.add_argument("--out_dir", type=str, default=None,
+                        help="the directory to write (defaults to the name "
+                        "of lc_file without '.txt.gz')")
+
+    args = parser.parse_args()
+
+    if args.lc_file is None:
+        args.lc_file = os.path.join(getPackageDir('sims_data'), 'catUtilsData',
+                                    'kplr_lc_params.txt.gz')
+
+    out_dir = convert_parametrized_light_curves(args.lc_file, out_dir=args.out_dir)
+    print('wrote %s' % out_dir)
@@ -9,17 +9,16 @@ from lsst.sims.catUtils.utils import AgnAlertDBObj
 from lsst.sims.catUtils.utils import AlertAgnVariabilityCatalog
 
 
-import multiprocessing as mproc
-
 import time
 import gc
 import argparse
 
 
-def query_htmid(alert_gen, htmid_list, out_dir, out_prefix,
-                log_file_name, lock,
-                write_every, chunk_size, dmag_cutoff):
-
+def connect_to_db():
+    """
+    Connect to the database; called once by each worker process
+    of AlertDataGenerator.alert_data_from_htmid_list
+    """
     try:
         db = AgnAlertDBObj(database='LSSTCATSIM',
                            host='fatboy.phys.washington.edu',
@@ -27,27 +26,7 @@ def query_htmid(alert_gen, htmid_list, out_dir, out_prefix,
                            cache_connection=False)
     except RuntimeError:
         db = AgnAlertDBObj(cache_connection=False)
-
-    for i_htmid, htmid in enumerate(htmid_list):
-        t_start = time.time()
-        print('passing in %s' % str(htmid))
-        n_rows = alert_gen.alert_data_from_htmid(htmid, db, chunk_size=chunk_size,
-                                                 write_every=write_every,
-                                                 output_dir=out_dir,
-                                                 output_prefix=out_prefix,
-                                                 dmag_cutoff=dmag_cutoff,
-                                                 photometry_class=AlertAgnVariabilityCatalog,
-                                                 lock=lock,
-                                                 log_file_name=log_file_name)
-
-        lock.acquire()
-        with open(log_file_name, 'a') as out_file:
-            elapsed = (time.time()-t_start)/3600.0
-            out_file.write('htmid %d nobs %d n_rows %d time %.2e hrs; per_row %.2e -- n_htmid %d of %d\n' %
-                           (htmid, alert_gen.n_obs(htmid), n_rows, elapsed,
-                            elapsed/n_rows, i_htmid, len(htmid_list)))
-
-        lock.release()
+    return db
 
 if __name__ == "__main__":
 
@@ -117,44 +96,17 @@ if __name__ == "__main__":
             out_file.write('htmid %d n_obs %d\n' % (htmid, alert_gen.n_obs(htmid)))
         out_file.write('n_htmid %d n_obs(total) %d\n' % (len(alert_gen.htmid_list), n_tot_obs))
 
-    # subdivide the trixels into n_proc lists, trying to make sure
-    # each process has an equal number of observations to simulate
-    htmid_list = []
-    n_htmid_list = []
-    for i_p in range(args.n_proc):
-        htmid_list.append([])
-        n_htmid_list.append(0)
-
-    for htmid in alert_gen.htmid_list:
-        n_obs = alert_gen.n_obs(htmid)
-        n_min = -1
-        i_min = -1
-        for i_htmid, n_htmid in enumerate(n_htmid_list):
-            if i_min<0 or n_htmid<n_min:
-                n_min = n_htmid
-                i_min = i_htmid
-        htmid_list[i_min].append(htmid)
-        n_htmid_list[i_min] += n_obs
-
-    print('htmid_list %s' % str(htmid_list))
-    lock = mproc.Lock()
-
-    # start the independent processes
+    # simulate the trixels with a pool of n_proc processes
     t_start = time.time()
-    p_list = []
-    for i_p in range(len(htmid_list)):
-        p = mproc.Process(target=query_htmid,
-                          args = (alert_gen, htmid_list[i_p],
-                                  args.out_dir, args.out_prefix,
-                                  args.log_file, lock,
-                                  args.write_every,
-                                  args.chunk_size, args.dmag_cutoff))
-
-        p.start()
-        p_list.append(p)
-
-    for p in p_list:
-        p.join()
+    alert_gen.alert_data_from_htmid_list(alert_gen.htmid_list, connect_to_db,
+                                         n_processes=args.n_proc,
+                                         chunk_size=args.chunk_size,
+                                         write_every=args.write_every,
+                                         output_dir=args.out_dir,
+                                         output_prefix=args.out_prefix,
+                                         dmag_cutoff=args.dmag_cutoff,
+                                         photometry_class=AlertAgnVariabilityCatalog,
+                                         log_file_name=args.log_file)
 
     with open(args.log_file, 'a') as out_file:
         elapsed = (time.time()-t_start)/3600.0
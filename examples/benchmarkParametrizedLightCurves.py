@@ -0,0 +1,113 @@
+"""
+This script benchmarks the ways in which ParametrizedLightCurveMixin can
+evaluate the Fourier sums of its light curve models:
+
+    outer -- the original per-light-curve evaluation, which builds
+    np.outer(expmjd, omega) and takes separate cos/sin/dot passes
+
+    direct -- the batched evaluation in _calc_dmag_batch() with the
+    default 'direct' kernel
+
+    recurrence -- the batched evaluation with the 'recurrence' kernel,
+    which replaces most of the cos/sin calls with angle-addition
+    recurrences (only possible on uniformly spaced times)
+
+A library of fake light curve models is generated so that the script
+does not require the Kepler light curve file from sims_data.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+
+from lsst.sims.catUtils.mixins import ParametrizedLightCurveMixin
+from lsst.sims.catUtils.mixins import create_variability_cache
+
+
+def write_fake_models(file_name, n_lc, rng):
+    """
+    Write n_lc fake light curve models with up to 30 components
+    to file_name
+    """
+    with open(file_name, 'w') as out_file:
+        out_file.write('# fake light curve models\n')
+        for i_lc in range(n_lc):
+            n_c = rng.randint(1, 31)
+            out_file.write('kplr%d_lc.txt 100 1.0e+02 %d ' % (i_lc, n_c))
+            for i_c in range(n_c):
+                out_file.write('%e ' % (1.0/(i_c+1)))
+            out_file.write('%e ' % (1.0e4*(1.0+rng.random_sample())))
+            for i_c in range(n_c):
+                out_file.write('%.15e %.15e %.15e %.15e %.15e ' %
+                               (rng.normal()*50.0, rng.normal()*50.0,
+                                rng.normal()*5.0, rng.random_sample()*2.0,
+                                rng.random_sample()*100.0))
+            out_file.write('\n')
+
+
+def outer_dmag(plc, lc_id_arr, lc_time, variability_cache):
+    """
+    Evaluate the light curves one light curve ID at a time, the way
+    singleBandParametrizedLightCurve used to
+    """
+    d_mag = np.zeros(lc_time.shape)
+    for lc_id in np.unique(lc_id_arr):
+        use_this_lc = np.where(lc_id_arr == lc_id)[0]
+        (quiescent_flux, omega,
+         cos_coeff, sin_coeff) = plc._get_parametrized_lc_coeffs(lc_id, variability_cache)
+        omega_t = np.outer(lc_time[use_this_lc].flatten(), omega)
+        d_flux = np.dot(np.cos(omega_t), cos_coeff)
+        d_flux += np.dot(np.sin(omega_t), sin_coeff)
+        d_mag[use_this_lc] = -2.5*np.log10(1.0+d_flux/quiescent_flux).reshape(len(use_this_lc), -1)
+    return d_mag
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_lc', type=int, default=2000,
+                        help='the number of light curve models')
+    parser.add_argument('--n_obj', type=int, default=2000,
+                        help='the number of objects to simulate')
+    parser.add_argument('--n_t', type=int, default=1000,
+                        help='the number of time steps')
+    parser.add_argument('--dt', type=float, default=0.02,
+                        help='the time step in days')
+    parser.add_argument('--seed', type=int, default=81)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+
+    lc_file_name = tempfile.mktemp(prefix='benchmark_parametrized_lc', suffix='.txt')
+    write_fake_models(lc_file_name, args.n_lc, rng)
+
+    plc = ParametrizedLightCurveMixin()
+    variability_cache = create_variability_cache()
+    plc.load_parametrized_light_curves(lc_file_name, variability_cache=variability_cache)
+
+    lc_id_arr = rng.randint(0, args.n_lc, size=args.n_obj)
+    t0_arr = rng.random_sample(args.n_obj)*1000.0
+    expmjd = 59580.0 + np.arange(args.n_t)*args.dt
+    lc_time = expmjd[None, :] - t0_arr[:, None]
+
+    print('%d objects; %d light curve models; %d time steps of %.3f days\n'
+          % (args.n_obj, args.n_lc, args.n_t, args.dt))
+
+    t_start = time.time()
+    d_mag_outer = outer_dmag(plc, lc_id_arr, lc_time, variability_cache)
+    t_outer = time.time()-t_start
+    print('outer       %.3f seconds' % t_outer)
+
+    for kernel in ('direct', 'recurrence'):
+        t_start = time.time()
+        d_mag = plc._calc_dmag_batch(lc_id_arr, lc_time, variability_cache,
+                                     kernel=kernel)
+        t_kernel = time.time()-t_start
+        print('%-11s %.3f seconds (speed-up %.1f); max |d_mag - outer| %.2e'
+              % (kernel, t_kernel, t_outer/t_kernel, np.abs(d_mag-d_mag_outer).max()))
+
+    if os.path.exists(lc_file_name):
+        os.unlink(lc_file_name)
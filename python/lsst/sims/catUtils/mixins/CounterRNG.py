@@ -0,0 +1,308 @@
+"""
+This module defines CounterRNG, the source of random numbers for the
+stochastic models in catUtils (the AGN random walks, the supernova
+parameters drawn from their hosts and the detection of solar system
+objects).
+
+The models used to seed a separate np.random.RandomState for every
+object (or the global np.random state once), so that the random
+numbers assigned to an object depended on the order in which they
+were drawn.  CounterRNG instead evaluates the Philox4x64-10
+counter-based generator (Salmon et al. 2011, "Parallel random numbers:
+as easy as 1, 2, 3") directly: the draw_index'th random number of
+object stream_id in model model_name is a pure function of
+
+    (seed, model_name, stream_id, draw_index)
+
+so any subset of objects and draws can be evaluated in bulk, in any
+order and in any process, and always gives the same numbers.
+
+The Philox key is (stream_id, a 64 bit digest of model_name and the
+seed) and the counter is (draw_index, 0, 0, 0).  This is the same
+generator as np.random.Philox, i.e. the draw_index'th block of four
+random words of a stream is
+
+    np.random.Philox(key=stream_id + (digest << 64),
+                     counter=2**256-1).random_raw(4*(draw_index+1))[-4:]
+
+CounterRNG(legacy=True) instead reproduces the outputs of earlier
+versions: every stream is the np.random.RandomState seeded with
+stream_id.
+"""
+
+from builtins import object
+import hashlib
+import numpy as np
+
+__all__ = ["CounterRNG", "philox4x64"]
+
+
+_MASK_32 = np.uint64(0xFFFFFFFF)
+_SHIFT_32 = np.uint64(32)
+
+# the Philox4x64 multipliers and Weyl sequence constants
+_PHILOX_M0 = np.uint64(0xD2E7470EE14C6C93)
+_PHILOX_M1 = np.uint64(0xCA5A826395121157)
+_PHILOX_W0 = np.uint64(0x9E3779B97F4A7C15)
+_PHILOX_W1 = np.uint64(0xBB67AE8584CAA73B)
+
+
+def _mulhilo64(a, b):
+    """
+    Return the high and low 64 bit words of the 128 bit product
+    of the uint64 arrays a and b
+    """
+    a_lo = a & _MASK_32
+    a_hi = a >> _SHIFT_32
+    b_lo = b & _MASK_32
+    b_hi = b >> _SHIFT_32
+
+    lo_lo = a_lo*b_lo
+    # none of these sums can overflow 64 bits
+    mid = a_hi*b_lo + (lo_lo >> _SHIFT_32)
+    mid_lo = (mid & _MASK_32) + a_lo*b_hi
+    hi = a_hi*b_hi + (mid >> _SHIFT_32) + (mid_lo >> _SHIFT_32)
+    return hi, a*b
+
+
+def philox4x64(counter, key, rounds=10):
+    """
+    Evaluate the Philox4x64 block cipher
+
+    Parameters
+    ----------
+    counter -- an array of uint64 whose last axis has length 4
+
+    key -- an array of uint64 whose last axis has length 2
+    (broadcast against counter)
+
+    rounds -- the number of Philox rounds (default 10)
+
+    Returns
+    -------
+    an array of uint64 with the broadcast shape of counter and key
+    whose last axis contains the four random words
+    """
+    counter = np.asarray(counter, dtype=np.uint64)
+    key = np.asarray(key, dtype=np.uint64)
+    shape = np.broadcast_shapes(counter.shape[:-1], key.shape[:-1])
+
+    c0, c1, c2, c3 = [np.broadcast_to(counter[..., i], shape) for i in range(4)]
+    k0 = np.broadcast_to(key[..., 0], shape)
+    k1 = np.broadcast_to(key[..., 1], shape)
+
+    with np.errstate(over='ignore'):
+        for i_round in range(rounds):
+            if i_round > 0:
+                k0 = k0 + _PHILOX_W0
+                k1 = k1 + _PHILOX_W1
+            hi0, lo0 = _mulhilo64(_PHILOX_M0, c0)
+            hi1, lo1 = _mulhilo64(_PHILOX_M1, c2)
+            c0, c1, c2, c3 = hi1 ^ c1 ^ k0, lo1, hi0 ^ c3 ^ k1, lo0
+
+    return np.stack([c0, c1, c2, c3], axis=-1)
+
+
+class CounterRNG(object):
+    """
+    A counter-based source of random numbers.  Every model draws from
+    its own set of streams (one per object, identified by an integer
+    stream_id such as the object's seed or ID) and every draw from a
+    stream is identified by its integer draw_index.
+
+    The drawing methods (random_raw, uniform and normal) broadcast
+    stream_id against draw_index, so, e.g.
+
+        rng.normal('agn', seed_arr[:, None], np.arange(n_steps)[None, :])
+
+    draws the first n_steps normal deviates of every AGN at once.
+    stream() wraps one stream in an object with the sequential
+    interface of np.random.RandomState.
+    """
+
+    def __init__(self, seed=0, legacy=False):
+        """
+        Parameters
+        ----------
+        seed -- an integer distinguishing independent realizations
+        of every model (default 0; ignored in legacy mode)
+
+        legacy -- if True, reproduce the outputs of earlier versions,
+        in which every stream was a np.random.RandomState seeded with
+        stream_id.  Drawing from these streams in bulk is only efficient
+        for the first few draws of each stream.
+        """
+        self._seed = int(seed)
+        self._legacy = bool(legacy)
+        self._model_keys = {}
+
+    def __repr__(self):
+        return 'CounterRNG(seed=%d, legacy=%s)' % (self._seed, self._legacy)
+
+    def __eq__(self, other):
+        return (isinstance(other, CounterRNG) and
+                self._seed == other._seed and
+                self._legacy == other._legacy)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self._seed, self._legacy))
+
+    def __getstate__(self):
+        return {'_seed': self._seed, '_legacy': self._legacy}
+
+    def __setstate__(self, state):
+        self._seed = state['_seed']
+        self._legacy = state['_legacy']
+        self._model_keys = {}
+
+    @property
+    def seed(self):
+        return self._seed
+
+    @property
+    def legacy(self):
+        return self._legacy
+
+    def _model_key(self, model_name):
+        """
+        Return the 64 bit digest of model_name and self.seed that
+        forms the second word of the Philox key
+        """
+        if model_name not in self._model_keys:
+            hasher = hashlib.sha1()
+            hasher.update(('%s:%d' % (model_name, self._seed)).encode('utf-8'))
+            digest = int(hasher.hexdigest()[:16], 16)
+            self._model_keys[model_name] = np.uint64(digest)
+        return self._model_keys[model_name]
+
+    def key(self, model_name, stream_id):
+        """
+        Return the Philox keys (an array of uint64 whose last axis
+        has length 2) of the streams stream_id of model_name
+        """
+        stream_id = np.asarray(stream_id).astype(np.uint64)
+        key = np.empty(stream_id.shape+(2,), dtype=np.uint64)
+        key[..., 0] = stream_id
+        key[..., 1] = self._model_key(model_name)
+        return key
+
+    def random_raw(self, model_name, stream_id, draw_index):
+        """
+        Return the block of four random uint64 words for each
+        (stream_id, draw_index) pair; the last axis of the output
+        iterates over the words.
+
+        Not available in legacy mode.
+        """
+        if self._legacy:
+            raise RuntimeError("CounterRNG.random_raw is not "
+                               "available in legacy mode")
+        draw_index = np.asarray(draw_index).astype(np.uint64)
+        counter = np.zeros(draw_index.shape+(4,), dtype=np.uint64)
+        counter[..., 0] = draw_index
+        return philox4x64(counter, self.key(model_name, stream_id))
+
+    def _legacy_draws(self, method_name, stream_id, draw_index):
+        """
+        Reproduce the draws of np.random.RandomState(stream_id).method_name()
+        """
+        stream_id, draw_index = np.broadcast_arrays(np.asarray(stream_id),
+                                                    np.asarray(draw_index))
+        out = np.empty(stream_id.shape, dtype=float)
+        flat_stream = stream_id.ravel()
+        flat_draw = draw_index.ravel().astype(int)
+        flat_out = out.reshape(-1)
+        unq_stream, stream_inverse = np.unique(flat_stream, return_inverse=True)
+        stream_inverse = stream_inverse.ravel()
+        for i_stream, stream in enumerate(unq_stream):
+            rows = np.where(stream_inverse == i_stream)[0]
+            draws = flat_draw[rows]
+            rng = np.random.RandomState(stream)
+            flat_out[rows] = getattr(rng, method_name)(size=draws.max()+1)[draws]
+        return out
+
+    def uniform(self, model_name, stream_id, draw_index, low=0.0, high=1.0):
+        """
+        Return uniform deviates in [low, high) for each
+        (stream_id, draw_index) pair
+        """
+        if self._legacy:
+            unit = self._legacy_draws('random_sample', stream_id, draw_index)
+        else:
+            words = self.random_raw(model_name, stream_id, draw_index)
+            unit = (words[..., 0] >> np.uint64(11))*(1.0/9007199254740992.0)
+        if isinstance(unit, np.ndarray) and unit.ndim == 0:
+            unit = unit[()]
+        return low + (high-low)*unit
+
+    def normal(self, model_name, stream_id, draw_index, loc=0.0, scale=1.0):
+        """
+        Return normal deviates for each (stream_id, draw_index) pair.
+
+        In counter mode, these come from the Box-Muller transform of
+        the first two words of the block.
+        """
+        if self._legacy:
+            unit = self._legacy_draws('standard_normal', stream_id, draw_index)
+        else:
+            words = self.random_raw(model_name, stream_id, draw_index)
+            # u_1 is in (0, 1] so that its log is finite
+            u_1 = ((words[..., 0] >> np.uint64(11))+np.uint64(1))*(1.0/9007199254740992.0)
+            u_2 = (words[..., 1] >> np.uint64(11))*(1.0/9007199254740992.0)
+            unit = np.sqrt(-2.0*np.log(u_1))*np.cos(2.0*np.pi*u_2)
+        if isinstance(unit, np.ndarray) and unit.ndim == 0:
+            unit = unit[()]
+        return loc + scale*unit
+
+    def stream(self, model_name, stream_id):
+        """
+        Return one stream of model_name as an object which draws
+        random numbers sequentially through the normal(), uniform()
+        and random_sample() methods of np.random.RandomState.
+        In legacy mode, this is np.random.RandomState(stream_id).
+        """
+        if self._legacy:
+            return np.random.RandomState(stream_id)
+        return _CounterStream(self, model_name, stream_id)
+
+
+class _CounterStream(object):
+    """
+    The sequential interface to one stream of a CounterRNG
+    (see CounterRNG.stream).  The n'th random number drawn from
+    this object is the one at draw_index n in the CounterRNG.
+    """
+
+    def __init__(self, rng, model_name, stream_id):
+        self._rng = rng
+        self._model_name = model_name
+        self._stream_id = stream_id
+        self.draw_index = 0
+
+    def _next_draws(self, size):
+        """
+        Return the draw indexes of the next size draws
+        (a number if size is None)
+        """
+        if size is None:
+            draw_index = self.draw_index
+            self.draw_index += 1
+            return draw_index
+        n_draws = int(np.prod(size))
+        draw_index = np.arange(self.draw_index, self.draw_index+n_draws).reshape(size)
+        self.draw_index += n_draws
+        return draw_index
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        return self._rng.uniform(self._model_name, self._stream_id,
+                                 self._next_draws(size), low=low, high=high)
+
+    def random_sample(self, size=None):
+        return self.uniform(size=size)
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        return self._rng.normal(self._model_name, self._stream_id,
+                                self._next_draws(size), loc=loc, scale=scale)
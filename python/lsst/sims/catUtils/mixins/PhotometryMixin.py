@@ -17,6 +17,7 @@ import os
 import numpy as np
 from collections import OrderedDict
 from lsst.utils import getPackageDir
+from lsst.sims.catUtils.mixins.CounterRNG import CounterRNG
 from lsst.sims.photUtils import Sed, Bandpass, LSSTdefaults, calcGamma, \
                                 calcMagError_m5, calcSNR_m5, PhotometricParameters, magErrorFromSNR, \
                                 BandpassDict
@@ -43,6 +44,9 @@ class PhotometryBase(object):
     #defaults to LSST values
     photParams = PhotometricParameters()
 
+    #the source of the random numbers used by calculateVisibility;
+    #in legacy mode, the global np.random state is used (as in earlier versions)
+    visibility_rng = CounterRNG(legacy=True)
 
     def _cacheGamma(self, m5_names, bandpassDict):
         """
@@ -171,12 +175,20 @@ class PhotometryBase(object):
         @ param [in] pre_generate_randoms is an option (default False) to pre-generate a series of 12,000,000 random numbers
            for use throughout the visibility calculation [the random numbers used are randoms[objId]].
 
+        If self.visibility_rng is not in legacy mode, randomSeed and pre_generate_randoms are not used
+        to seed np.random; instead, the random number of each object is drawn from the stream
+        objId of self.visibility_rng at the draw index randomSeed (or 0 if randomSeed is None).
+
         @ param [out] visibility (None/1).
         """
         if len(magFilter) == 0:
             return np.array([])
         # Calculate the completeness at the magnitude of each object.
         completeness = 1.0 / (1 + np.exp((magFilter - self.obs_metadata.m5[self.obs_metadata.bandpass])/sigma))
+        if not self.visibility_rng.legacy:
+            draw_index = 0 if randomSeed is None else randomSeed
+            probability = self.visibility_rng.uniform('visibility', self.column_by_name('objId'), draw_index)
+            return np.where(probability <= completeness, 1, None)
         # Seed numpy if desired and not previously done.
         if (randomSeed is not None) and (not hasattr(self, 'ssm_random_seeded')):
             np.random.seed(randomSeed)
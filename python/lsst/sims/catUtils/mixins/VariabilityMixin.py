@@ -58,6 +58,14 @@ CatSim database.  varParamStr should look like
 method_name is the register_method() key referring
 to the variabilty model. p1, p2, etc. are the parameters
 expected by the variability model.
+
+Optionally, a variability model can be accompanied by a method
+marked with the decorator @register_max_dmag(key) (with the same
+key) which accepts valid_dexes and params (as above) and returns
+a numpy array with one entry per astrophysical object.  Each entry
+is an upper bound on |delta magnitude| of the object in any band at
+any time.  applyVariability() uses these bounds to skip objects that
+can never vary by more than a requested dmag_cutoff.
 """
 
 from builtins import range
@@ -69,12 +77,19 @@ import os
 import gzip
 import copy
 import numbers
+import inspect
+import sys
+from collections import OrderedDict
 import multiprocessing
+import weakref
+import types
 import json as json
+import hashlib
 from lsst.utils import getPackageDir
 from lsst.sims.catalogs.decorators import register_method, compound
 from lsst.sims.photUtils import Sed, BandpassDict
 from lsst.sims.utils.CodeUtilities import sims_clean_up
+from lsst.sims.catUtils.mixins.CounterRNG import CounterRNG
 from scipy.interpolate import InterpolatedUnivariateSpline
 from scipy.interpolate import UnivariateSpline
 from scipy.interpolate import interp1d
@@ -85,31 +100,293 @@ __all__ = ["Variability", "VariabilityStars", "VariabilityGalaxies",
            "VariabilityAGN", "StellarVariabilityModels",
            "ExtraGalacticVariabilityModels", "MLTflaringMixin",
            "ParametrizedLightCurveMixin",
+           "VariabilityParamTable", "LightCurveCache", "LightCurveCacheBudget",
+           "MLTLightCurveStore", "convert_mlt_light_curves",
+           "get_mlt_dust_lookup",
+           "ParametrizedLightCurveStore", "convert_parametrized_light_curves",
+           "register_variability_model", "register_max_dmag",
            "create_variability_cache"]
 
 
-def create_variability_cache():
+# the default memory budget (in bytes) shared by all of the
+# LightCurveCaches in a process
+_DEFAULT_LC_CACHE_MAX_BYTES = 2**30
+
+
+def _approx_nbytes(obj, _seen=None):
+    """
+    Estimate the memory (in bytes) held by obj, counting the numpy
+    arrays it contains (including those inside dicts, lists, tuples
+    and the attributes of objects like scipy interpolators).
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, np.memmap):
+        # file-backed; shared through the page cache
+        return 0
+    if isinstance(obj, np.ndarray):
+        if obj.base is not None and isinstance(obj.base, np.ndarray):
+            return 0 if id(obj.base) in _seen else obj.nbytes
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sum(_approx_nbytes(vv, _seen) for vv in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(_approx_nbytes(vv, _seen) for vv in obj)
+    if hasattr(obj, '__dict__') and not isinstance(obj, type):
+        return sum(_approx_nbytes(vv, _seen) for vv in vars(obj).values())
+    return sys.getsizeof(obj)
+
+
+class LightCurveCacheBudget(object):
+    """
+    A memory budget shared by several LightCurveCaches.
+
+    The budget keeps track of the (approximate) memory held by all of
+    the caches that share it, and of the order in which their entries
+    were last used.  When adding an entry to any of those caches pushes
+    the total over max_bytes, the least recently used entries of all of
+    the caches are evicted.  A cache that is garbage collected releases
+    its share of the budget.
+
+    Parameters
+    ----------
+    max_bytes is the memory budget in bytes (None means unbounded).
+    It may be changed at any time; the caches are brought back within
+    the budget the next time an entry is added.
+    """
+
+    def __init__(self, max_bytes=_DEFAULT_LC_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        # (id(cache), key) -> size, least recently used first
+        self._lru = OrderedDict()
+        self._caches = {}
+
+    def _register(self, cache):
+        self._caches[id(cache)] = weakref.ref(cache)
+        weakref.finalize(cache, self._release, id(cache))
+
+    def _release(self, cache_id):
+        for lru_key in [kk for kk in self._lru if kk[0] == cache_id]:
+            self.nbytes -= self._lru.pop(lru_key)
+        del self._caches[cache_id]
+
+    def _add(self, cache, key, size):
+        self._lru[(id(cache), key)] = size
+        self.nbytes += size
+        if self.max_bytes is None:
+            return
+        # never evict the entry that was just added
+        while self.nbytes > self.max_bytes and len(self._lru) > 1:
+            cache_id, oldest = next(iter(self._lru))
+            owner = self._caches[cache_id]()
+            owner._remove(oldest)
+            owner.evictions += 1
+
+    def _touch(self, cache, key):
+        self._lru.move_to_end((id(cache), key))
+
+    def _discard(self, cache, key):
+        self.nbytes -= self._lru.pop((id(cache), key))
+
+    def __reduce_ex__(self, protocol):
+        # the process-wide budget is unpickled as the process-wide
+        # budget of the process doing the unpickling
+        if self is _GLOBAL_LC_CACHE_BUDGET:
+            return (_get_global_lc_cache_budget, ())
+        return object.__reduce_ex__(self, protocol)
+
+    def __getstate__(self):
+        # the weak references to the caches cannot be pickled; the caches
+        # re-register their entries when they are unpickled (see
+        # LightCurveCache.__setstate__)
+        return {'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_bytes'])
+
+    def __repr__(self):
+        return ('LightCurveCacheBudget(%d caches; %d entries; %d bytes of %s)'
+                % (len(self._caches), len(self._lru), self.nbytes, self.max_bytes))
+
+
+# the budget shared by the light curve caches of every Variability
+# instance and of the variability caches from create_variability_cache()
+_GLOBAL_LC_CACHE_BUDGET = LightCurveCacheBudget()
+
+
+def _get_global_lc_cache_budget():
+    return _GLOBAL_LC_CACHE_BUDGET
+
+
+class LightCurveCache(object):
+    """
+    A dict-like cache of light curve data with a memory budget.
+
+    When adding an entry would push the (approximate) memory held by the
+    cache over its budget, the least recently used entries are evicted.
+    The budget may be shared with other caches (see LightCurveCacheBudget),
+    in which case the entries evicted may belong to any of them.
+    Callers should therefore always be prepared to reload an entry,
+    i.e. use
+
+        value = cache.get(key)
+        if value is None:
+            value = load(key)
+            cache[key] = value
+
+    rather than assuming that something stored earlier is still there.
+
+    The attributes hits, misses and evictions count lookups that found
+    their key, lookups that did not, and entries of this cache evicted to
+    stay within the budget.  nbytes is the approximate memory currently
+    held by this cache.
+
+    Parameters
+    ----------
+    max_bytes is the memory budget in bytes of a cache with a budget of
+    its own (None means unbounded)
+
+    budget is a LightCurveCacheBudget to share with other caches
+    (optional; if given, max_bytes is ignored)
+    """
+
+    def __init__(self, max_bytes=_DEFAULT_LC_CACHE_MAX_BYTES, budget=None):
+        if budget is None:
+            budget = LightCurveCacheBudget(max_bytes)
+        self.budget = budget
+        budget._register(self)
+        self._data = OrderedDict()
+        self._sizes = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_bytes(self):
+        return self.budget.max_bytes
+
+    def __getstate__(self):
+        return {'budget': self.budget,
+                'entries': list(self._data.items()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+    def __setstate__(self, state):
+        # a cache that shared the process-wide budget shares that of
+        # the process in which it is unpickled; caches that shared any
+        # other budget (and were pickled together) share a fresh copy
+        self.__init__(budget=state['budget'])
+        for key, value in state['entries']:
+            self[key] = value
+        self.hits = state['hits']
+        self.misses = state['misses']
+        self.evictions += state['evictions']
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        return iter(list(self._data.keys()))
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __getitem__(self, key):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        self._data.move_to_end(key)
+        self.budget._touch(self, key)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        if key in self._data:
+            self._remove(key)
+        size = _approx_nbytes(value)
+        self._data[key] = value
+        self._sizes[key] = size
+        self.nbytes += size
+        self.budget._add(self, key, size)
+
+    def __delitem__(self, key):
+        if key not in self._data:
+            raise KeyError(key)
+        self._remove(key)
+
+    def _remove(self, key):
+        del self._data[key]
+        self.nbytes -= self._sizes.pop(key)
+        self.budget._discard(self, key)
+
+    def clear(self):
+        for key in list(self._data):
+            self._remove(key)
+
+    def __repr__(self):
+        return ('LightCurveCache(%d entries; %d bytes of %s; '
+                '%d hits; %d misses; %d evictions)'
+                % (len(self._data), self.nbytes, self.max_bytes,
+                   self.hits, self.misses, self.evictions))
+
+
+def create_variability_cache(lc_cache_budget=None):
     """
     Create a blank variability cache
+
+    lc_cache_budget is the LightCurveCacheBudget shared by the light curve
+    caches it contains (optional; if None, they share the budget of every
+    other light curve cache in this process)
     """
+    if lc_cache_budget is None:
+        lc_cache_budget = _GLOBAL_LC_CACHE_BUDGET
+
     cache = {'parallelizable': False,
 
+             '_LC_CACHE_BUDGET': lc_cache_budget,
+
              '_MLT_LC_NPZ' : None,  # this will be loaded from a .npz file
                                         # (.npz files are the result of numpy.savez())
 
              '_MLT_LC_NPZ_NAME' : None,  # the name of the .npz file to beloaded
 
-             '_MLT_LC_TIME_CACHE' : {},  # a dict for storing loaded time grids
+             '_MLT_LC_TIME_CACHE' : LightCurveCache(budget=lc_cache_budget),  # for storing loaded time grids
+
+             '_MLT_LC_DURATION_CACHE' : LightCurveCache(budget=lc_cache_budget),  # for storing the simulated length
+                                                                                  # of the time grids
 
-             '_MLT_LC_DURATION_CACHE' : {},  # a dict for storing the simulated length
-                                                 # of the time grids
+             '_MLT_LC_MAX_TIME_CACHE'  : LightCurveCache(budget=lc_cache_budget),  # for storing the t_max of a light curve
 
-             '_MLT_LC_MAX_TIME_CACHE'  : {},  # a dict for storing the t_max of a light curve
+             '_MLT_LC_FLUX_CACHE' : LightCurveCache(budget=lc_cache_budget),  # for storing loaded flux grids
 
-             '_MLT_LC_FLUX_CACHE' : {},  # a dict for storing loaded flux grids
+             '_MLT_LC_FLUX_RANGE_CACHE' : {},  # for storing the (min, max) of each flux grid
 
              '_PARAMETRIZED_LC_MODELS' : {},  # a dict for storing the parametrized light curve models
 
+             '_PARAMETRIZED_LC_STORES' : [],  # ParametrizedLightCurveStores from which models were loaded
+
+             '_PARAMETRIZED_LC_COEFF_CACHE' : LightCurveCache(budget=lc_cache_budget),  # for storing the
+                                                                                        # coefficients derived
+                                                                                        # from those models
+
              '_PARAMETRIZED_MODELS_LOADED' : []  # a list of all of the files from which models were loaded
             }
 
@@ -118,6 +395,634 @@ def create_variability_cache():
 _GLOBAL_VARIABILITY_CACHE = create_variability_cache()
 
 
+def _simulate_agn_batch(expmjd, walk_start_date, tau_arr, time_dilation_arr,
+                        sf_u_arr, seed_arr, max_bytes=2**26, rng=None):
+    """
+    Simulate the u-band light curves for a batch of AGN at once.
+
+    All of the AGN are stepped through their damped random walks
+    together, so that each time step costs one set of numpy operations
+    over the whole batch, rather than one python iteration per object.
+    The random numbers are drawn from the 'agn' streams of rng (keyed
+    on the AGN seeds, with one draw per time step) and the floating
+    point operations are performed in the same order as in
+    ExtraGalacticVariabilityModels._simulate_agn, so the results
+    are identical to simulating the AGN one at a time.
+
+    Parameters
+    ----------
+    expmjd -- a number or numpy array of dates for the light curves
+
+    walk_start_date -- the MJD at which the random walks start
+
+    tau_arr -- the characteristic timescales of the AGN in days
+
+    time_dilation_arr -- (1+z) for the AGN
+
+    sf_u_arr -- the u-band structure functions of the AGN
+
+    seed_arr -- the seeds for the random number generators
+
+    max_bytes -- the approximate number of bytes to be used for
+    storing the random walks in memory at any one time
+
+    rng -- the CounterRNG from which to draw the random walks
+    (default CounterRNG(legacy=True))
+
+    Returns
+    -------
+    a numpy array of delta_magnitude in the u-band.  If expmjd is a number,
+    the array has shape (n_obj,); otherwise it has shape (n_obj, len(expmjd))
+    """
+    mjd_is_number = isinstance(expmjd, numbers.Number)
+
+    tau_arr = np.asarray(tau_arr, dtype=float)
+    time_dilation_arr = np.asarray(time_dilation_arr, dtype=float)
+    sf_u_arr = np.asarray(sf_u_arr, dtype=float)
+    n_obj = len(tau_arr)
+
+    if mjd_is_number:
+        mjd_arr = np.array([expmjd], dtype=float)
+        duration_observer_frame = expmjd - walk_start_date
+    else:
+        mjd_arr = np.asarray(expmjd, dtype=float)
+        duration_observer_frame = max(expmjd) - walk_start_date
+
+    d_m_out = np.zeros((n_obj, len(mjd_arr)))
+    if n_obj == 0 or len(mjd_arr) == 0:
+        if mjd_is_number:
+            return d_m_out[:, 0]
+        return d_m_out
+
+    dt_arr = tau_arr/100.
+    dt_over_tau = dt_arr/tau_arr
+    sqrt_dt_over_tau = np.sqrt(dt_over_tau)
+    duration_rest_frame = duration_observer_frame/time_dilation_arr
+    nbins_arr = np.ceil(duration_rest_frame/dt_arr).astype(int)+1
+
+    # the index of the time step at which each (object, expmjd) pair
+    # will be read off of the random walk
+    time_dexes = np.round((mjd_arr[None, :]-walk_start_date) /
+                          (time_dilation_arr*dt_arr)[:, None]).astype(int)
+
+    # step the AGN through their random walks in order of descending nbins
+    # so that the objects whose walks are still active at any given time
+    # step are always the first n_active objects in the batch
+    obj_order = np.argsort(-1*nbins_arr, kind='mergesort')
+    nbins_sorted = nbins_arr[obj_order]
+    neg_dt_over_tau = -1.0*dt_over_tau[obj_order]
+    dt_sorted = dt_arr[obj_order]
+    sf_u_sorted = sf_u_arr[obj_order]
+    sqrt_sorted = sqrt_dt_over_tau[obj_order]
+    if rng is None:
+        rng = CounterRNG(legacy=True)
+    if rng.legacy:
+        # legacy streams can only be drawn sequentially
+        rng_list = [rng.stream('agn', seed_arr[i_obj]) for i_obj in obj_order]
+    else:
+        seed_sorted = np.asarray(seed_arr)[obj_order]
+
+    # sort all of the (object, expmjd) pairs by the time step at which
+    # they need to be evaluated; ignore pairs that the walk never reaches
+    # (exactly as _simulate_agn would)
+    rank = np.empty(n_obj, dtype=int)
+    rank[obj_order] = np.arange(n_obj, dtype=int)
+    ev_obj, ev_time = np.where(np.logical_and(time_dexes >= 0,
+                                              time_dexes < nbins_arr[:, None]))
+    ev_dex = time_dexes[ev_obj, ev_time]
+    ev_sort = np.argsort(ev_dex, kind='mergesort')
+    ev_obj = ev_obj[ev_sort]
+    ev_time = ev_time[ev_sort]
+    ev_dex = ev_dex[ev_sort]
+
+    max_nbins = nbins_sorted[0]
+    block_size = max(1, min(max_nbins, max_bytes//(24*n_obj)))
+
+    dx_prev = np.zeros(n_obj)
+    x_prev = np.zeros(n_obj)
+
+    for i_start in range(0, max_nbins, block_size):
+        i_end = min(i_start+block_size, max_nbins)
+        n_steps = i_end-i_start
+        n_active = np.searchsorted(-1*nbins_sorted, -1*i_start, side='left')
+
+        # draw the random numbers needed for this block of time steps;
+        # drawing them in pieces does not change the stream produced
+        # for each AGN
+        if rng.legacy:
+            noise = np.zeros((n_steps, n_active))
+            for i_obj in range(n_active):
+                n_draw = min(nbins_sorted[i_obj], i_end)-i_start
+                if n_draw > 0:
+                    es = rng_list[i_obj].normal(0., 1., n_draw)*sqrt_sorted[i_obj]
+                    noise[:n_draw, i_obj] = sf_u_sorted[i_obj]*es
+        else:
+            # draws past the end of a walk are never read
+            es = rng.normal('agn', seed_sorted[None, :n_active],
+                            np.arange(i_start, i_end)[:, None])*sqrt_sorted[:n_active]
+            noise = sf_u_sorted[:n_active]*es
+
+        # dx_traj[j] and x_traj[j] are the values of dx2 and x2 after
+        # time step i_start+j-1
+        dx_traj = np.zeros((n_steps+1, n_active))
+        dx_traj[0] = dx_prev[:n_active]
+        local_neg = neg_dt_over_tau[:n_active]
+        for j_step in range(n_steps):
+            #The second term differs from Zeljko's equation by sqrt(2.)
+            #because he assumes stdev = sf_u/sqrt(2)
+            dx1 = dx_traj[j_step]
+            dx2 = dx_traj[j_step+1]
+            np.multiply(dx1, local_neg, out=dx2)
+            dx2 += noise[j_step]
+            dx2 += dx1
+
+        x_traj = np.empty((n_steps+1, n_active))
+        x_traj[0] = x_prev[:n_active]
+        x_traj[1:] = dt_sorted[:n_active]
+        x_traj = np.cumsum(x_traj, axis=0)
+
+        dx_prev[:n_active] = dx_traj[-1]
+        x_prev[:n_active] = x_traj[-1]
+
+        ev_start = np.searchsorted(ev_dex, i_start, side='left')
+        ev_end = np.searchsorted(ev_dex, i_end, side='left')
+        if ev_end == ev_start:
+            continue
+
+        local_obj = ev_obj[ev_start:ev_end]
+        local_time = ev_time[ev_start:ev_end]
+        local_rank = rank[local_obj]
+        local_step = ev_dex[ev_start:ev_end]-i_start
+
+        dx1 = dx_traj[local_step, local_rank]
+        dx2 = dx_traj[local_step+1, local_rank]
+        x1 = x_traj[local_step, local_rank]
+        x2 = x_traj[local_step+1, local_rank]
+        time_dilation = time_dilation_arr[local_obj]
+
+        if mjd_is_number:
+            dm_val = ((expmjd-walk_start_date)*(dx1-dx2)/time_dilation+dx2*x1-dx1*x2)/(x1-x2)
+        else:
+            local_end = (mjd_arr[local_time]-walk_start_date)/time_dilation
+            dm_val = (local_end*(dx1-dx2)+dx2*x1-dx1*x2)/(x1-x2)
+
+        d_m_out[local_obj, local_time] = dm_val
+
+    if mjd_is_number:
+        return d_m_out[:, 0]
+    return d_m_out
+
+
+# _simulate_agn_sparse draws the AGN random walks on a grid of time
+# steps of tau/_AGN_SPARSE_STEPS_PER_TAU (the time step of the dense
+# random walk) in the rest frame of each AGN.  The walk is drawn
+# sequentially at every 2**_AGN_SPARSE_LEVELS-th step and by bisection
+# in between.
+_AGN_SPARSE_STEPS_PER_TAU = 100
+_AGN_SPARSE_LEVELS = 10
+
+
+def _simulate_agn_sparse(expmjd, walk_start_date, tau_arr, time_dilation_arr,
+                         sf_u_arr, seed_arr, rng=None):
+    """
+    Simulate the u-band light curves for a batch of AGN by sampling
+    their damped random walks only near the requested dates.
+
+    The damped random walk is treated as the Ornstein-Uhlenbeck
+    process it approximates, i.e. a process with mean zero, variance
+    sf_u**2/2 and correlation time tau, starting from zero at
+    walk_start_date.  Each AGN's walk is a single realization of that
+    process on a grid of time steps dt = tau/_AGN_SPARSE_STEPS_PER_TAU
+    (in the rest frame of the AGN), and each date is linearly
+    interpolated between the grid steps on either side of it, as in
+    _simulate_agn_batch.
+
+    The grid is built without visiting every step.  The walk at every
+    n_coarse = 2**_AGN_SPARSE_LEVELS-th step is drawn from its exact
+    conditional distribution given the previous such step
+
+        x(t+T) = x(t)*exp(-T/tau) + sqrt(1-exp(-2*T/tau))*sf_u/sqrt(2)*N(0,1)
+
+    and the steps between them are drawn by bisection, each midpoint
+    from the exact distribution of the process given the two ends of
+    its interval.  The normal deviate used at grid step i is the i-th
+    draw of the AGN's 'agn' stream, so the light curve at any date does
+    not depend on which other dates are requested, and the cost scales
+    with the number of dates (times _AGN_SPARSE_LEVELS) plus the length
+    of the light curve divided by n_coarse*dt, rather than divided by dt.
+    The resulting light curves are statistically (but not numerically)
+    equivalent to those produced by _simulate_agn_batch.
+
+    Parameters
+    ----------
+    expmjd -- a number or numpy array of dates for the light curves
+
+    walk_start_date -- the MJD at which the random walks start
+
+    tau_arr -- the characteristic timescales of the AGN in days
+
+    time_dilation_arr -- (1+z) for the AGN
+
+    sf_u_arr -- the u-band structure functions of the AGN
+
+    seed_arr -- the seeds for the random number generators
+
+    rng -- the CounterRNG from which to draw the random walks
+    (default CounterRNG(legacy=True)).  The draws of the legacy
+    np.random.RandomState streams can only be reached sequentially,
+    so a legacy rng is replaced by CounterRNG(seed=rng.seed).
+
+    Returns
+    -------
+    a numpy array of delta_magnitude in the u-band.  If expmjd is a number,
+    the array has shape (n_obj,); otherwise it has shape (n_obj, len(expmjd))
+    """
+    mjd_is_number = isinstance(expmjd, numbers.Number)
+
+    tau_arr = np.asarray(tau_arr, dtype=float)
+    time_dilation_arr = np.asarray(time_dilation_arr, dtype=float)
+    sf_u_arr = np.asarray(sf_u_arr, dtype=float)
+    n_obj = len(tau_arr)
+
+    if rng is None:
+        rng = CounterRNG(legacy=True)
+    if rng.legacy:
+        rng = CounterRNG(seed=rng.seed)
+
+    if mjd_is_number:
+        mjd_arr = np.array([expmjd], dtype=float)
+    else:
+        mjd_arr = np.asarray(expmjd, dtype=float)
+    n_time = len(mjd_arr)
+
+    d_m_out = np.zeros((n_obj, n_time))
+    if n_obj > 0 and n_time > 0:
+        seed_arr = np.asarray(seed_arr)
+        seed_col = seed_arr[:, None]
+        var_col = 0.5*sf_u_arr[:, None]**2
+
+        # the (fractional) grid step of every (object, date) pair
+        dt_arr = tau_arr/_AGN_SPARSE_STEPS_PER_TAU
+        grid_step = (mjd_arr[None, :]-walk_start_date)/(time_dilation_arr*dt_arr)[:, None]
+        i_step = np.floor(grid_step).astype(np.int64)
+        frac = grid_step-i_step
+
+        # walk through the coarse steps up to the last one needed
+        n_coarse = 2**_AGN_SPARSE_LEVELS
+        i_coarse = i_step//n_coarse
+        n_walk = i_coarse.max()+2
+        decay = np.exp(-1.0*n_coarse/_AGN_SPARSE_STEPS_PER_TAU)
+        normals = rng.normal('agn', seed_col, n_coarse*np.arange(1, n_walk)[None, :])
+        innovation = np.sqrt(var_col*(1.0-decay*decay))*normals
+        coarse_walk = np.zeros((n_obj, n_walk))
+        for i_walk in range(1, n_walk):
+            coarse_walk[:, i_walk] = coarse_walk[:, i_walk-1]*decay + innovation[:, i_walk-1]
+        del normals
+        del innovation
+
+        obj_rows = np.arange(n_obj)[:, None]
+        i_left = i_coarse*n_coarse
+        x_left = coarse_walk[obj_rows, i_coarse]
+        x_right = coarse_walk[obj_rows, i_coarse+1]
+        del coarse_walk
+
+        # bisect the coarse steps down to the grid steps around each date;
+        # dates close together share their first few midpoints, so only
+        # the distinct (object, grid step) pairs are drawn
+        pair_obj = np.broadcast_to(obj_rows, i_step.shape).ravel()
+        half_width = n_coarse
+        for i_level in range(_AGN_SPARSE_LEVELS):
+            half_width //= 2
+            i_mid = i_left+half_width
+            i_mid_flat = i_mid.ravel()
+            _, unq_dex, unq_inverse = np.unique(pair_obj*(i_mid_flat.max()+1)+i_mid_flat,
+                                                return_index=True, return_inverse=True)
+            normals = rng.normal('agn', seed_arr[pair_obj[unq_dex]],
+                                 i_mid_flat[unq_dex])[unq_inverse]
+            decay = np.exp(-1.0*half_width/_AGN_SPARSE_STEPS_PER_TAU)
+            x_mid = decay*(x_left+x_right)/(1.0+decay*decay)
+            x_mid += (np.sqrt(var_col*(1.0-decay*decay)/(1.0+decay*decay)) *
+                      normals.reshape(i_step.shape))
+            go_right = i_step >= i_mid
+            x_left = np.where(go_right, x_mid, x_left)
+            x_right = np.where(go_right, x_right, x_mid)
+            i_left = np.where(go_right, i_mid, i_left)
+
+        d_m_out = x_left + frac*(x_right-x_left)
+
+    if mjd_is_number:
+        return d_m_out[:, 0]
+    return d_m_out
+
+
+def _agn_pool_worker(task):
+    """
+    Simulate one task's worth of AGN light curves in a worker process
+    of ExtraGalacticVariabilityModels' AGN pool, writing the results
+    into the shared memory buffer named in the task.
+
+    Returns the number of AGN simulated.
+    """
+    from multiprocessing import shared_memory
+
+    (shm_name, shape, expmjd, walk_start_date, rows,
+     tau_arr, time_dilation_arr, sf_u_arr, seed_arr, rng) = task
+
+    d_m = _simulate_agn_batch(expmjd, walk_start_date, tau_arr,
+                              time_dilation_arr, sf_u_arr, seed_arr,
+                              rng=rng)
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        d_m_out = np.ndarray(shape, dtype=float, buffer=shm.buf)
+        d_m_out[rows] = d_m.reshape((len(rows), shape[1]))
+        del d_m_out
+    finally:
+        shm.close()
+
+    return len(rows)
+
+
+class VariabilityParamTable(object):
+    """
+    A chunk of varParamStr values parsed once into numpy columns grouped
+    by variability method.
+
+    applyVariability() accepts either an array of varParamStr or an
+    instance of this class.  Building the table once and passing it in
+    (or letting applyVariability cache it) means the json parsing only
+    happens once per chunk, no matter how many times the chunk is
+    evaluated.
+
+    Parameters
+    ----------
+    varParams_arr is an array/list of json-ized varParamStr as read
+    in from the CatSim database
+
+    Attributes
+    ----------
+    dexes is a dict keyed on variability method names.  The values are
+    the output of numpy.where() indicating which objects in the chunk
+    use that method.
+
+    params is a dict keyed on variability method names.  The values
+    are dicts keyed on the names of the method's parameters.  Each
+    parameter is a numpy array with one entry per object in the chunk.
+    Objects that do not use the method have None for its parameters
+    (variability models rely on this), so a parameter only has a numeric
+    dtype if every object in the chunk uses the method.
+    """
+
+    def __init__(self, varParams_arr):
+        self._n_obj = len(varParams_arr)
+
+        # for each method, the list of row indexes and the list
+        # of parameter dicts for the objects using that method
+        method_rows = {}
+
+        for ix, varCmd in enumerate(varParams_arr):
+            if str(varCmd) == 'None':
+                continue
+
+            varCmd = json.loads(varCmd)
+
+            # find the key associated with the name of
+            # the specific variability model to be applied
+            if 'varMethodName' in varCmd:
+                meth_key = 'varMethodName'
+            else:
+                meth_key = 'm'
+
+            # find the key associated with the list of
+            # parameters to be supplied to the variability
+            # model
+            if 'pars' in varCmd:
+                par_key = 'pars'
+            else:
+                par_key = 'p'
+
+            method_name = varCmd[meth_key]
+            if method_name == 'None':
+                continue
+
+            if method_name not in method_rows:
+                method_rows[method_name] = ([], [])
+            method_rows[method_name][0].append(ix)
+            method_rows[method_name][1].append(varCmd[par_key])
+
+        self.dexes = {}
+        self.params = {}
+        for method_name in method_rows:
+            dex_list, par_list = method_rows[method_name]
+            self.dexes[method_name] = (np.array(dex_list, dtype=int),)
+
+            p_name_list = []
+            for pars in par_list:
+                for p_name in pars:
+                    if p_name not in p_name_list:
+                        p_name_list.append(p_name)
+
+            self.params[method_name] = {}
+            for p_name in p_name_list:
+                values = [pars.get(p_name, None) for pars in par_list]
+                self.params[method_name][p_name] = self._make_column(dex_list,
+                                                                     values)
+
+    def _make_column(self, dex_list, values):
+        """
+        Scatter the values of one parameter into an array with one
+        entry per object in the chunk.
+
+        Parameters
+        ----------
+        dex_list is a list of the rows of the chunk that have values
+
+        values is a list of the values (possibly including None)
+
+        Returns
+        -------
+        a numpy array of length len(self)
+        """
+        if len(dex_list) == self._n_obj:
+            return np.array(values)
+
+        column = np.array([None]*self._n_obj)
+        for ix, vv in zip(dex_list, values):
+            column[ix] = vv
+        return column
+
+    def drop_objects(self, obj_dexes):
+        """
+        Return a copy of this table in which the objects at obj_dexes
+        have no variability (their parameters are set to None), so that
+        variability models skip them.  The objects keep their places
+        in the chunk.
+        """
+        dropped = np.zeros(self._n_obj, dtype=bool)
+        dropped[obj_dexes] = True
+
+        new_table = VariabilityParamTable([])
+        new_table._n_obj = self._n_obj
+        for method_name in self.dexes:
+            method_dexes = self.dexes[method_name][0]
+            method_dropped = method_dexes[dropped[method_dexes]]
+            if len(method_dropped) == len(method_dexes):
+                continue
+
+            new_table.dexes[method_name] = (method_dexes[~dropped[method_dexes]],)
+            new_table.params[method_name] = {}
+            for p_name, column in self.params[method_name].items():
+                if len(method_dropped) > 0:
+                    column = column.astype(object)
+                    column[method_dropped] = None
+                new_table.params[method_name][p_name] = column
+
+        return new_table
+
+    def select_objects(self, i_start, i_end):
+        """
+        Return the table of the objects in rows i_start through i_end-1
+        of this table (renumbered so that row i_start becomes row 0).
+        """
+        new_table = VariabilityParamTable([])
+        new_table._n_obj = i_end - i_start
+        for method_name in self.dexes:
+            method_dexes = self.dexes[method_name][0]
+            in_block = method_dexes[np.logical_and(method_dexes >= i_start,
+                                                   method_dexes < i_end)]
+            if len(in_block) == 0:
+                continue
+
+            new_table.dexes[method_name] = (in_block - i_start,)
+            new_table.params[method_name] = {}
+            for p_name, column in self.params[method_name].items():
+                new_table.params[method_name][p_name] = column[i_start:i_end]
+
+        return new_table
+
+    def __len__(self):
+        return self._n_obj
+
+    @property
+    def method_names(self):
+        """
+        A list of the variability methods used by the chunk
+        """
+        return sorted(self.dexes.keys())
+
+
+# variability models registered with register_variability_model(),
+# keyed on the varMethodName used in varParamStr
+_EXTERNAL_VARIABILITY_MODELS = {}
+
+# the functions bounding |delta magnitude| of those models
+_EXTERNAL_MAX_DMAG_MODELS = {}
+
+# the names of the parameters accepted by each variability model
+# (see _get_model_kwargs)
+_MODEL_KWARGS = {}
+
+
+def _get_model_kwargs(model):
+    """
+    Return the set of the names of the parameters accepted by a
+    variability model.  applyVariability uses this to find the models
+    that accept the optional kwargs
+
+        d_mag_out -- an array into which the model writes its delta
+        magnitudes in place (overwriting the entries belonging to the
+        objects that use the model and leaving all other entries alone)
+
+        bands -- the names of the LSST bands to calculate; the rows of
+        the model's output correspond to these bands
+    """
+    if model not in _MODEL_KWARGS:
+        try:
+            model_params = inspect.signature(model).parameters
+        except (TypeError, ValueError):
+            model_params = {}
+        _MODEL_KWARGS[model] = frozenset(model_params)
+    return _MODEL_KWARGS[model]
+
+
+def _get_band_dexes(bands):
+    """
+    Return a list of the indexes (in ugrizy order) of the LSST bands
+    in bands (a string like 'gri' or a sequence of band names)
+    """
+    band_dexes = []
+    for bp in bands:
+        if bp not in ('u', 'g', 'r', 'i', 'z', 'y'):
+            raise RuntimeError("'%s' is not an LSST band" % str(bp))
+        band_dexes.append('ugrizy'.index(bp))
+    return band_dexes
+
+# Bounds found by sampling a light curve (rather than analytically)
+# are divided by this factor, to allow for extrema between samples.
+# singleBandParametrizedLightCurve allows the look up table of Kepler
+# light curve amplitudes the same margin.
+_MAX_DMAG_SAFETY_FACTOR = 0.75
+
+# The AGN random walk has no hard limit; its |delta magnitude| is
+# bounded at this many standard deviations (see
+# ExtraGalacticVariabilityModels.maxDmagAgn)
+_AGN_MAX_DMAG_SIGMA = 8.0
+
+
+def register_max_dmag(key):
+    """
+    Decorator marking a method as returning upper bounds on
+    |delta magnitude| for the variability model registered
+    (with @register_method) under key.  See the docstring of
+    this module.
+    """
+    def decorator(fn):
+        fn._maxDmagKey = key
+        return fn
+    return decorator
+
+
+def register_variability_model(key, model, max_dmag=None):
+    """
+    Make a variability model available to every catalog that inherits
+    from Variability, without having to define it on a class.
+
+    Parameters
+    ----------
+    key is the string identifying the model in varParamStr
+    (the same key that would be passed to @register_method)
+
+    model is a function with the signature
+
+        model(catalog, valid_dexes, params, expmjd, variability_cache=None)
+
+    where catalog is the InstanceCatalog applying variability and the
+    other arguments are as described in the docstring of this module.
+    Like any other variability model, it will be called with an empty
+    params dict when the catalog is checking its column dependencies.
+
+    max_dmag is an optional function with the signature
+
+        max_dmag(catalog, valid_dexes, params, variability_cache=None)
+
+    returning an upper bound on |delta magnitude| for every object
+    (see the docstring of this module)
+
+    Models defined on a catalog class with @register_method take
+    precedence over models registered here.
+    """
+    if key in _EXTERNAL_VARIABILITY_MODELS:
+        if (_EXTERNAL_VARIABILITY_MODELS[key] is model and
+            _EXTERNAL_MAX_DMAG_MODELS.get(key, None) is max_dmag):
+
+            return
+        raise RuntimeError("A variability model has already been "
+                           "registered with the key '%s'" % key)
+    _EXTERNAL_VARIABILITY_MODELS[key] = model
+    if max_dmag is not None:
+        _EXTERNAL_MAX_DMAG_MODELS[key] = max_dmag
+
+
 class Variability(object):
     """
     Variability class for adding temporal variation to the magnitudes of
@@ -132,6 +1037,124 @@ class Variability(object):
 
     variabilityInitialized = False
 
+    # the LightCurveCacheBudget of self.variabilityLcCache; by default,
+    # it is shared with every other light curve cache in the process,
+    # so that Variability.variability_lc_cache_budget.max_bytes bounds
+    # their total memory (setting max_bytes to None makes it unbounded)
+    variability_lc_cache_budget = _GLOBAL_LC_CACHE_BUDGET
+
+    # the approximate size (in bytes) of the blocks
+    # of delta magnitudes yielded by iter_variability
+    variability_block_max_bytes = 2**26
+
+    # the register_method() keys of the variability models whose light
+    # curves depend on which dates are evaluated together (e.g. because
+    # they carry state from one date to the next); iter_variability
+    # never splits the dates of a chunk using any of them into blocks
+    variability_time_coupled_models = frozenset()
+
+    # the rows of the chunk being evaluated by iter_variability
+    # (None means the whole chunk; see _variability_column)
+    _variability_obj_slice = None
+
+    # a read-only dict mapping register_method() keys to the (unbound)
+    # methods implementing them; rebuilt for every subclass
+    _methodRegistry = types.MappingProxyType({})
+
+    # the same for the register_max_dmag() methods bounding the models
+    _maxDmagRegistry = types.MappingProxyType({})
+
+    # the source of random numbers for the stochastic variability
+    # models.  The default legacy mode reproduces the per-object
+    # np.random.RandomState streams of earlier versions; set this to
+    # CounterRNG(seed) so that the random numbers of any object and
+    # time can be drawn independently of all of the others.
+    variability_rng = CounterRNG(legacy=True)
+
+    def __init_subclass__(cls, **kwargs):
+        """
+        Construct the registry of all of the variability models available
+        to a class when the class is created, so that catalogs do not have
+        to search themselves for models every time they are instantiated.
+        """
+        super(Variability, cls).__init_subclass__(**kwargs)
+        registry = {}
+        max_dmag_registry = {}
+        for attr_name in dir(cls):
+            attr = getattr(cls, attr_name, None)
+            if hasattr(attr, '_registryKey'):
+                if attr._registryKey not in registry:
+                    registry[attr._registryKey] = attr
+            if hasattr(attr, '_maxDmagKey'):
+                if attr._maxDmagKey not in max_dmag_registry:
+                    max_dmag_registry[attr._maxDmagKey] = attr
+        cls._methodRegistry = types.MappingProxyType(registry)
+        cls._maxDmagRegistry = types.MappingProxyType(max_dmag_registry)
+
+    def _get_variability_model(self, method_name):
+        """
+        Return the function implementing the variability model
+        method_name (called as model(self, valid_dexes, params, expmjd, ...)),
+        or None if no such model is available to this catalog.
+        """
+        if method_name in self._methodRegistry:
+            return self._methodRegistry[method_name]
+        return _EXTERNAL_VARIABILITY_MODELS.get(method_name, None)
+
+    def _get_max_dmag_model(self, method_name):
+        """
+        Return the function bounding |delta magnitude| for the
+        variability model method_name (called as
+        max_dmag(self, valid_dexes, params, ...)), or None if
+        the model has no such bound.
+        """
+        if method_name in self._methodRegistry:
+            return self._maxDmagRegistry.get(method_name, None)
+        return _EXTERNAL_MAX_DMAG_MODELS.get(method_name, None)
+
+    def max_abs_dmag(self, varParams_arr, variability_cache=None):
+        """
+        Return an upper bound on |delta magnitude| (in any band, at any
+        time) for each of the objects described by varParams_arr,
+        without evaluating their light curves.
+
+        Parameters
+        ----------
+        varParams_arr is an array/list of varParamStr (or a
+        VariabilityParamTable)
+
+        variability_cache is a cache of data as initialized by the
+        create_variability_cache() method (optional; if None, the
+        method will just use a global cache)
+
+        Returns
+        -------
+        A numpy array with one entry per object.  Objects without
+        variability have 0; objects whose variability model does not
+        provide a bound have numpy.inf.
+        """
+        if self.variabilityInitialized == False:
+            self.initializeVariability(doCache=True)
+
+        if isinstance(varParams_arr, VariabilityParamTable):
+            param_table = varParams_arr
+        else:
+            param_table = self._get_variability_param_table(varParams_arr)
+
+        max_dmag = np.zeros(len(param_table), dtype=float)
+        for method_name in param_table.method_names:
+            valid_dexes = param_table.dexes[method_name]
+            max_dmag_model = self._get_max_dmag_model(method_name)
+            if max_dmag_model is None:
+                max_dmag[valid_dexes] = np.inf
+                continue
+            model_max = max_dmag_model(self, valid_dexes,
+                                       param_table.params[method_name],
+                                       variability_cache=variability_cache)
+            max_dmag[valid_dexes] += model_max[valid_dexes]
+
+        return max_dmag
+
     def num_variable_obj(self, params):
         """
         Return the total number of objects in the catalog
@@ -164,7 +1187,7 @@ class Variability(object):
 
         self.variabilityInitialized=True
         #below are variables to cache the light curves of variability models
-        self.variabilityLcCache = {}
+        self.variabilityLcCache = LightCurveCache(budget=self.variability_lc_cache_budget)
         self.variabilityCache = doCache
         try:
             self.variabilityDataDir = os.environ.get("SIMS_SED_LIBRARY_DIR")
@@ -174,8 +1197,50 @@ class Variability(object):
 
 
 
+    def _variability_column(self, column_name):
+        """
+        Return the catalog column column_name, restricted to the block
+        of objects currently being evaluated by iter_variability.
+        Variability models should use this rather than column_by_name.
+        """
+        column = self.column_by_name(column_name)
+        if self._variability_obj_slice is None:
+            return column
+        return column[self._variability_obj_slice]
+
+    def _get_variability_param_table(self, varParams_arr):
+        """
+        Return the VariabilityParamTable corresponding to an array
+        of varParamStr.
+
+        The table for the most recent numpy array is cached, so that
+        the repeated calls that happen when one chunk is evaluated at
+        many epochs (or in many bands) only parse the chunk once.
+        InstanceCatalog.column_by_name returns a new view of the chunk
+        every time, so the cache is keyed on the memory the array
+        points to, rather than on the array object itself.  A reference
+        to the array is held so that memory cannot be reused while
+        the table is cached.
+        """
+        if not isinstance(varParams_arr, np.ndarray):
+            return VariabilityParamTable(varParams_arr)
+
+        array_key = (varParams_arr.__array_interface__['data'][0],
+                     varParams_arr.shape, varParams_arr.strides,
+                     varParams_arr.dtype.str)
+
+        cached = getattr(self, '_variability_param_table_cache', None)
+        if cached is not None and cached[0] == array_key:
+            return cached[2]
+
+        param_table = VariabilityParamTable(varParams_arr)
+        self._variability_param_table_cache = (array_key, varParams_arr,
+                                               param_table)
+        return param_table
+
     def applyVariability(self, varParams_arr, expmjd=None,
-                         variability_cache=None):
+                         variability_cache=None, dmag_cutoff=None,
+                         d_mag_out=None, bands=None, dtype=None):
         """
         Read in an array/list of varParamStr objects taken from the CatSim
         database.  For each varParamStr, call the appropriate variability
@@ -185,140 +1250,230 @@ class Variability(object):
         in ugrizy order and each column is an astrophysical object from
         the CatSim database.
 
+        varParams_arr can also be a VariabilityParamTable built from
+        the varParamStr objects, in which case the parsing step is
+        skipped.
+
         variability_cache is a cache of data as initialized by the
         create_variability_cache() method (optional; if None, the
         method will just use a globl cache)
+
+        dmag_cutoff is optional.  If it is given, objects which
+        max_abs_dmag() shows can never vary by as much as dmag_cutoff
+        are not simulated at all (their delta magnitudes are returned
+        as zero).
+
+        d_mag_out is an optional array (shaped like the output of this
+        method) into which to write the delta magnitudes.  Variability
+        models that accept a d_mag_out kwarg write directly into it;
+        the results of all other models are added to it.
+
+        bands is an optional string (e.g. 'gri') or sequence naming the
+        LSST bands to calculate.  If it is given, the rows of the output
+        correspond to these bands (rather than to ugrizy) and variability
+        models that accept a bands kwarg only calculate these bands.
+
+        dtype is the numpy dtype of the output (default float64; ignored
+        if d_mag_out is given)
         """
         t_start = time.time()
         if not hasattr(self, '_total_t_apply_var'):
             self._total_t_apply_var = 0.0
 
-        # construct a registry of all of the variability models
-        # available to the InstanceCatalog
-        if not hasattr(self, '_methodRegistry'):
-            self._methodRegistry = {}
-            self._method_name_to_int = {}
-            next_int = 0
-            for methodname in dir(self):
-                method=getattr(self, methodname)
-                if hasattr(method, '_registryKey'):
-                    if method._registryKey not in self._methodRegistry:
-                        self._methodRegistry[method._registryKey] = method
-                        self._method_name_to_int[method._registryKey] = next_int
-                        next_int += 1
-
         if self.variabilityInitialized == False:
             self.initializeVariability(doCache=True)
 
 
+        if isinstance(varParams_arr, VariabilityParamTable):
+            param_table = varParams_arr
+        else:
+            param_table = self._get_variability_param_table(varParams_arr)
+
+        n_obj = len(param_table)
+
+        band_dexes = list(range(6))
+        if bands is not None:
+            band_dexes = _get_band_dexes(bands)
+        n_bands = len(band_dexes)
+
         if isinstance(expmjd, numbers.Number) or expmjd is None:
             # A numpy array of magnitude offsets.  Each row is
             # an LSST band in ugrizy order.  Each column is an
             # astrophysical object from the CatSim database.
-            deltaMag = np.zeros((6, len(varParams_arr)))
+            out_shape = (n_bands, n_obj)
         else:
             # the last dimension varies over time
-            deltaMag = np.zeros((6, len(varParams_arr), len(expmjd)))
+            out_shape = (n_bands, n_obj, len(expmjd))
+
+        if d_mag_out is None:
+            deltaMag = np.zeros(out_shape, dtype=dtype)
+        else:
+            if d_mag_out.shape != out_shape:
+                raise RuntimeError("d_mag_out has shape %s; "
+                                   "applyVariability needs shape %s"
+                                   % (str(d_mag_out.shape), str(out_shape)))
+            deltaMag = d_mag_out
+            deltaMag.fill(0.0)
 
         # When the InstanceCatalog calls all of its getters
         # with an empty chunk to check column dependencies,
         # call all of the variability models in the
-        # _methodRegistry to make sure that all of the column
+        # _methodRegistry (and those registered with
+        # register_variability_model) to make sure that all of the column
         # dependencies of the variability models are detected.
-        if len(varParams_arr) == 0:
+        if n_obj == 0:
             for method_name in self._methodRegistry:
-                self._methodRegistry[method_name]([],{},0)
-
-        # Keep a list of all of the specific variability models
-        # that need to be called.  There is one entry for each
-        # astrophysical object in the CatSim database.  We will
-        # ultimately run np.where on method_name_arr to determine
-        # which objects need to be passed through which
-        # variability methods.
-        method_name_arr = []
-
-        # also keep an array listing the methods to use
-        # by the integers mapped with self._method_name_to_int;
-        # this is for faster application of np.where when
-        # figuring out which objects go with which method
-        method_int_arr = -1*np.ones(len(varParams_arr), dtype=int)
-
-        # Keep a dict keyed on all of the method names in
-        # method_name_arr.  params[method_name] will be another
-        # dict keyed on the names of the parameters required by
-        # the method method_name.  The values of this dict will
-        # be lists of parameter values for all astrophysical
-        # objects in the CatSim database.  Even objects that
-        # do no callon method_name will have entries in these
-        # lists (they will be set to None).
-        params = {}
+                self._methodRegistry[method_name](self, [], {}, 0)
+            for method_name in _EXTERNAL_VARIABILITY_MODELS:
+                if method_name not in self._methodRegistry:
+                    _EXTERNAL_VARIABILITY_MODELS[method_name](self, [], {}, 0)
+
+        if dmag_cutoff is not None and n_obj > 0:
+            max_dmag = self.max_abs_dmag(param_table,
+                                         variability_cache=variability_cache)
+            quiet_obj = np.where(max_dmag < dmag_cutoff)[0]
+            if len(quiet_obj) > 0:
+                param_table = param_table.drop_objects(quiet_obj)
+
+        model_dict = {}
+        for method_name in param_table.method_names:
+            model_dict[method_name] = self._get_variability_model(method_name)
+            if model_dict[method_name] is None:
+                raise RuntimeError("Your InstanceCatalog does not contain " \
+                                   + "a variability method corresponding to '%s'"
+                                   % method_name)
 
-        for ix, varCmd in enumerate(varParams_arr):
-            if str(varCmd) == 'None':
-                continue
-
-            varCmd = json.loads(varCmd)
-
-            # find the key associated with the name of
-            # the specific variability model to be applied
-            if 'varMethodName' in varCmd:
-                meth_key = 'varMethodName'
+        # Loop over all of the variability models that need to be called.
+        # Call each variability model on the astrophysical objects that
+        # require the model.  Add the result to deltaMag (models that
+        # can write their results directly into deltaMag do so; every
+        # object uses only one model, so they do not overwrite each other).
+        for method_name in param_table.method_names:
+
+            if expmjd is None:
+                expmjd = self.obs_metadata.mjd.TAI
+
+            model = model_dict[method_name]
+            model_kwargs = _get_model_kwargs(model)
+            kwargs = {'variability_cache': variability_cache}
+            selects_bands = bands is None or 'bands' in model_kwargs
+            if bands is not None and 'bands' in model_kwargs:
+                kwargs['bands'] = bands
+
+            if selects_bands and 'd_mag_out' in model_kwargs:
+                model(self, param_table.dexes[method_name],
+                      param_table.params[method_name], expmjd,
+                      d_mag_out=deltaMag, **kwargs)
             else:
-                meth_key = 'm'
+                model_d_mag = model(self,
+                                    param_table.dexes[method_name],
+                                    param_table.params[method_name],
+                                    expmjd, **kwargs)
+                if not selects_bands:
+                    model_d_mag = model_d_mag[band_dexes]
+                deltaMag += model_d_mag
 
-            # find the key associated with the list of
-            # parameters to be supplied to the variability
-            # model
-            if 'pars' in varCmd:
-                par_key = 'pars'
-            else:
-                par_key = 'p'
+        self._total_t_apply_var += time.time()-t_start
+        return deltaMag
+
+    def iter_variability(self, varParams_arr, expmjd, variability_cache=None,
+                         dmag_cutoff=None, max_bytes=None, bands=None, dtype=None):
+        """
+        Generator evaluating applyVariability on blocks of objects and
+        times, so that the full (6, n_obj, n_time) array of delta
+        magnitudes never has to be in memory at once.
 
-            # if we have discovered a new variability model
-            # that needs to be called, initialize its entries
-            # in the params dict
-            if varCmd[meth_key] not in method_name_arr:
-                params[varCmd[meth_key]] = {}
-                for p_name in varCmd[par_key]:
-                    params[varCmd[meth_key]][p_name] = [None]*len(varParams_arr)
+        Parameters
+        ----------
+        varParams_arr, variability_cache, dmag_cutoff, bands and dtype
+        are as in applyVariability
+
+        expmjd is a numpy array of dates
+
+        max_bytes is the approximate size (in bytes) of each block
+        of delta magnitudes (if None, self.variability_block_max_bytes).
+        Blocks contain all of the objects and as many of the dates as
+        fit in max_bytes; if one date does not fit, the objects are
+        split into blocks as well.  If any of the objects use one of
+        the models in self.variability_time_coupled_models, every
+        block contains all of the dates, and only the objects are split.
+
+        Yields
+        ------
+        (obj_slice, time_slice, d_mag) where d_mag is a numpy array of
+        shape (n_bands, n_obj_block, n_time_block) containing the delta
+        magnitudes of the objects in obj_slice at the dates
+        expmjd[time_slice].  Every block is written into the same
+        buffer, so d_mag is overwritten by the next block; copy it
+        if it needs to be kept.
+        """
+        if self.variabilityInitialized == False:
+            self.initializeVariability(doCache=True)
 
-            method_name_arr.append(varCmd[meth_key])
-            if varCmd[meth_key] != 'None':
-                try:
-                    method_int_arr[ix] = self._method_name_to_int[varCmd[meth_key]]
-                except KeyError:
-                    raise RuntimeError("Your InstanceCatalog does not contain " \
-                                       + "a variability method corresponding to '%s'"
-                                       % varCmd[meth_key])
+        if max_bytes is None:
+            max_bytes = self.variability_block_max_bytes
 
-            for p_name in varCmd[par_key]:
-                params[varCmd[meth_key]][p_name][ix] = varCmd[par_key][p_name]
+        if isinstance(varParams_arr, VariabilityParamTable):
+            param_table = varParams_arr
+        else:
+            param_table = self._get_variability_param_table(varParams_arr)
 
-        method_name_arr = np.array(method_name_arr)
-        for method_name in params:
-            for p_name in params[method_name]:
-                params[method_name][p_name] = np.array(params[method_name][p_name])
+        expmjd = np.atleast_1d(np.asarray(expmjd, dtype=float))
+        n_obj = len(param_table)
+        n_time = len(expmjd)
+        if n_obj == 0 or n_time == 0:
+            return
 
-        # Loop over all of the variability models that need to be called.
-        # Call each variability model on the astrophysical objects that
-        # require the model.  Add the result to deltaMag.
-        for method_name in np.unique(method_name_arr):
-            if method_name != 'None':
+        if dmag_cutoff is not None:
+            max_dmag = self.max_abs_dmag(param_table,
+                                         variability_cache=variability_cache)
+            quiet_obj = np.where(max_dmag < dmag_cutoff)[0]
+            if len(quiet_obj) > 0:
+                param_table = param_table.drop_objects(quiet_obj)
+
+        n_bands = 6
+        if bands is not None:
+            n_bands = len(_get_band_dexes(bands))
+
+        # the bytes needed for every (object, date) pair
+        pair_bytes = n_bands*np.dtype(dtype).itemsize
+        if self.variability_time_coupled_models.intersection(param_table.method_names):
+            n_time_block = n_time
+            n_obj_block = max(1, min(n_obj, max_bytes//(pair_bytes*n_time)))
+        else:
+            n_obj_block = max(1, min(n_obj, max_bytes//pair_bytes))
+            n_time_block = max(1, min(n_time, max_bytes//(pair_bytes*n_obj_block)))
+        d_mag_buffer = np.zeros((n_bands, n_obj_block, n_time_block), dtype=dtype)
+
+        for i_obj_start in range(0, n_obj, n_obj_block):
+            i_obj_end = min(i_obj_start+n_obj_block, n_obj)
+            obj_slice = slice(i_obj_start, i_obj_end)
+            if n_obj_block == n_obj:
+                block_table = param_table
+                block_obj_slice = None
+            else:
+                block_table = param_table.select_objects(i_obj_start, i_obj_end)
+                block_obj_slice = obj_slice
 
-                if expmjd is None:
-                    expmjd = self.obs_metadata.mjd.TAI
+            for i_time_start in range(0, n_time, n_time_block):
+                i_time_end = min(i_time_start+n_time_block, n_time)
+                time_slice = slice(i_time_start, i_time_end)
+                d_mag = d_mag_buffer[:, :i_obj_end-i_obj_start, :i_time_end-i_time_start]
 
-                deltaMag += self._methodRegistry[method_name](np.where(method_int_arr==self._method_name_to_int[method_name]),
-                                                              params[method_name],
-                                                              expmjd,
-                                                              variability_cache=variability_cache)
+                self._variability_obj_slice = block_obj_slice
+                try:
+                    self.applyVariability(block_table, expmjd=expmjd[time_slice],
+                                          variability_cache=variability_cache,
+                                          d_mag_out=d_mag, bands=bands)
+                finally:
+                    self._variability_obj_slice = None
 
-        self._total_t_apply_var += time.time()-t_start
-        return deltaMag
+                yield obj_slice, time_slice, d_mag
 
 
     def applyStdPeriodic(self, valid_dexes, params, keymap, expmjd,
-                         inDays=True, interpFactory=None):
+                         inDays=True, interpFactory=None, d_mag_out=None,
+                         bands=None):
 
         """
         Applies a specified variability method.
@@ -345,76 +1500,224 @@ class Variability(object):
         used by the database to the parameter naming convention used by the
         variability methods below.
 
-        @param [in] expmjd is the mjd of the observation
+        @param [in] expmjd is the mjd of the observation
+
+        @param [in] inDays controls whether or not the time grid
+        of the light curve is renormalized by the period
+
+        @param [in] interpFactory is the method used for interpolating
+        the light curve
+
+        @param [in] d_mag_out is an optional array (shaped like magoff)
+        into which to write the magnitude offsets of the objects in
+        valid_dexes; all of its other entries are left alone
+
+        @param [in] bands is an optional string of the LSST bands to
+        calculate (default 'ugrizy')
+
+        @param [out] magoff is a 2D numpy array of magnitude offsets.  Each
+        row is an LSST band in ugrizy order (or the order of bands).
+        Each column is a different astrophysical object from the
+        CatSim database.
+        """
+        if bands is None:
+            bands = 'ugrizy'
+        if d_mag_out is not None:
+            magoff = d_mag_out
+        elif isinstance(expmjd, numbers.Number):
+            magoff = np.zeros((len(bands), self.num_variable_obj(params)))
+        else:
+            magoff = np.zeros((len(bands), self.num_variable_obj(params), len(expmjd)))
+
+        if len(valid_dexes[0]) == 0:
+            return magoff
+
+        expmjd = np.asarray(expmjd)
+        # params may hold lists rather than numpy arrays
+        valid_obj = np.asarray(valid_dexes[0])
+        filename_arr = np.array([str(ff) for ff in
+                                 np.asarray(params[keymap['filename']])[valid_obj]])
+        toff_arr = np.asarray(params[keymap['t0']])[valid_obj].astype(float)
+
+        inPeriod_arr = None
+        if 'period' in params:
+            inPeriod_arr = np.asarray(params['period'])[valid_obj]
+
+        # the epochs (relative to t0) of every valid object;
+        # shape is (n_valid,) or (n_valid, n_time)
+        if expmjd.ndim == 0:
+            epoch_arr = expmjd - toff_arr
+        else:
+            epoch_arr = expmjd[None, :] - toff_arr[:, None]
+
+        # Evaluate all of the objects that share a light curve template
+        # in one call to each band's spline.  The template for a file is
+        # loaded when the first object (in valid_dexes order) needing it
+        # is encountered, and takes its period from that object.
+        unq_filenames, first_dex, file_inverse = np.unique(filename_arr,
+                                                           return_index=True,
+                                                           return_inverse=True)
+
+        for i_file in np.argsort(first_dex):
+            filename = unq_filenames[i_file]
+            file_rows = np.where(file_inverse == i_file)[0]
+            template_list = self._get_std_periodic_templates(filename, file_rows,
+                                                             inPeriod_arr, inDays,
+                                                             interpFactory)
+
+            for rows, template in template_list:
+                splines = template['splines']
+                period = template['period']
+                epoch = epoch_arr[rows]
+                phase = epoch/period - epoch//period
+                obj_dexes = valid_obj[rows]
+                for i_band, bp in enumerate(bands):
+                    magoff[i_band][obj_dexes] = splines[bp](phase)
+
+        return magoff
+
+    def _get_std_periodic_templates(self, filename, file_rows, inPeriod_arr,
+                                    inDays, interpFactory):
+        """
+        Return the light curve templates needed to evaluate the objects
+        using the light curve file filename.
+
+        @param [in] file_rows are the indices (into inPeriod_arr) of the
+        objects using filename
+
+        @param [in] inPeriod_arr is an array of the objects' periods
+        (or None if the periods come from the light curve files)
+
+        @param [in] inDays and interpFactory are as in applyStdPeriodic
+
+        @param [out] a list of (rows, template) tuples, rows being the
+        subset of file_rows to be evaluated with template (as returned
+        by _load_std_periodic_template)
+        """
+        cached_template = self.variabilityLcCache.get(filename)
+        if cached_template is not None:
+            return [(file_rows, cached_template)]
+
+        if self.variabilityCache or inPeriod_arr is None:
+            inPeriod = None
+            if inPeriod_arr is not None:
+                inPeriod = inPeriod_arr[file_rows[0]]
+            template = self._load_std_periodic_template(filename, inPeriod,
+                                                        inDays, interpFactory)
+            if self.variabilityCache:
+                self.variabilityLcCache[filename] = template
+            return [(file_rows, template)]
+
+        # without the cache, every object's light curve
+        # is normalized by its own period
+        template_list = []
+        for period_val in np.unique(inPeriod_arr[file_rows]):
+            period_rows = file_rows[np.where(inPeriod_arr[file_rows] == period_val)]
+            template = self._load_std_periodic_template(filename,
+                                                        inPeriod_arr[period_rows[0]],
+                                                        inDays, interpFactory)
+            template_list.append((period_rows, template))
+        return template_list
+
+    def _max_dmag_std_periodic(self, valid_dexes, params, keymap, inDays=True,
+                               interpFactory=None, in_flux=False):
+        """
+        Return an upper bound on |delta magnitude| for each object
+        using a light curve model evaluated by applyStdPeriodic.
+
+        The light curve templates are sampled over a finely spaced grid
+        in phase; the largest sampled |delta magnitude| of each template
+        is divided by _MAX_DMAG_SAFETY_FACTOR and cached with the template.
+
+        @param [in] valid_dexes, params, keymap, inDays and interpFactory
+        are as in applyStdPeriodic
+
+        @param [in] in_flux is True if the light curve templates are
+        flux ratios rather than delta magnitudes (as in applyEb)
+
+        @param [out] a numpy array of bounds, one per astrophysical object
+        """
+        max_dmag = np.zeros(self.num_variable_obj(params), dtype=float)
+        if len(valid_dexes[0]) == 0:
+            return max_dmag
+
+        # params may hold lists rather than numpy arrays
+        valid_obj = np.asarray(valid_dexes[0])
+        filename_arr = np.array([str(ff) for ff in
+                                 np.asarray(params[keymap['filename']])[valid_obj]])
+
+        inPeriod_arr = None
+        if 'period' in params:
+            inPeriod_arr = np.asarray(params['period'])[valid_obj]
+
+        # the templates span a single period, so sampling
+        # phase in [0, 1] covers the whole light curve
+        phase = np.linspace(0.0, 1.0, 8193)
+
+        unq_filenames, first_dex, file_inverse = np.unique(filename_arr,
+                                                           return_index=True,
+                                                           return_inverse=True)
+
+        for i_file in np.argsort(first_dex):
+            filename = unq_filenames[i_file]
+            file_rows = np.where(file_inverse == i_file)[0]
+            template_list = self._get_std_periodic_templates(filename, file_rows,
+                                                             inPeriod_arr, inDays,
+                                                             interpFactory)
+            for rows, template in template_list:
+                if 'max_dmag' not in template:
+                    template_max = 0.0
+                    for bp in 'ugrizy':
+                        vals = template['splines'][bp](phase)
+                        if in_flux:
+                            with np.errstate(divide='ignore', invalid='ignore'):
+                                vals = -2.5*np.log10(vals)
+                            vals = np.where(np.isfinite(vals), vals, 0.0)
+                        template_max = max(template_max, np.abs(vals).max())
+                    template['max_dmag'] = template_max/_MAX_DMAG_SAFETY_FACTOR
+                max_dmag[valid_obj[rows]] = template['max_dmag']
+
+        return max_dmag
+
+    def _load_std_periodic_template(self, filename, inPeriod, inDays,
+                                    interpFactory):
+        """
+        Read in a light curve file used by applyStdPeriodic and build
+        the interpolators for each of the LSST bands.
+
+        @param [in] filename is the name of the light curve file relative
+        to self.variabilityDataDir
+
+        @param [in] inPeriod is the period of the light curve (if None,
+        the period will be read from the file's time grid)
 
         @param [in] inDays controls whether or not the time grid
         of the light curve is renormalized by the period
 
         @param [in] interpFactory is the method used for interpolating
-        the light curve
+        the light curve (if None, use scipy's interp1d)
 
-        @param [out] magoff is a 2D numpy array of magnitude offsets.  Each
-        row is an LSST band in ugrizy order.  Each column is a different
-        astrophysical object from the CatSim database.
+        @param [out] a dict containing 'splines' (a dict of interpolators
+        keyed on band) and 'period'
         """
-        if isinstance(expmjd, numbers.Number):
-            magoff = np.zeros((6, self.num_variable_obj(params)))
+        lc = np.loadtxt(os.path.join(self.variabilityDataDir, filename), unpack=True, comments='#')
+        if inPeriod is None:
+            dt = lc[0][1] - lc[0][0]
+            period = lc[0][-1] + dt
         else:
-            magoff = np.zeros((6, self.num_variable_obj(params), len(expmjd)))
-        expmjd = np.asarray(expmjd)
-        for ix in valid_dexes[0]:
-            filename = params[keymap['filename']][ix]
-            toff = params[keymap['t0']][ix]
+            period = inPeriod
 
-            inPeriod = None
-            if 'period' in params:
-                inPeriod = params['period'][ix]
+        if inDays:
+            lc[0] /= period
 
-            epoch = expmjd - toff
-            if filename in self.variabilityLcCache:
-                splines = self.variabilityLcCache[filename]['splines']
-                period = self.variabilityLcCache[filename]['period']
-            else:
-                lc = np.loadtxt(os.path.join(self.variabilityDataDir,filename), unpack=True, comments='#')
-                if inPeriod is None:
-                    dt = lc[0][1] - lc[0][0]
-                    period = lc[0][-1] + dt
-                else:
-                    period = inPeriod
-
-                if inDays:
-                    lc[0] /= period
-
-                splines  = {}
-
-                if interpFactory is not None:
-                    splines['u'] = interpFactory(lc[0], lc[1])
-                    splines['g'] = interpFactory(lc[0], lc[2])
-                    splines['r'] = interpFactory(lc[0], lc[3])
-                    splines['i'] = interpFactory(lc[0], lc[4])
-                    splines['z'] = interpFactory(lc[0], lc[5])
-                    splines['y'] = interpFactory(lc[0], lc[6])
-                    if self.variabilityCache:
-                        self.variabilityLcCache[filename] = {'splines':splines, 'period':period}
-                else:
-                    splines['u'] = interp1d(lc[0], lc[1])
-                    splines['g'] = interp1d(lc[0], lc[2])
-                    splines['r'] = interp1d(lc[0], lc[3])
-                    splines['i'] = interp1d(lc[0], lc[4])
-                    splines['z'] = interp1d(lc[0], lc[5])
-                    splines['y'] = interp1d(lc[0], lc[6])
-                    if self.variabilityCache:
-                        self.variabilityLcCache[filename] = {'splines':splines, 'period':period}
-
-            phase = epoch/period - epoch//period
-            magoff[0][ix] = splines['u'](phase)
-            magoff[1][ix] = splines['g'](phase)
-            magoff[2][ix] = splines['r'](phase)
-            magoff[3][ix] = splines['i'](phase)
-            magoff[4][ix] = splines['z'](phase)
-            magoff[5][ix] = splines['y'](phase)
+        if interpFactory is None:
+            interpFactory = interp1d
 
-        return magoff
+        splines = {}
+        for i_band, bp in enumerate('ugrizy'):
+            splines[bp] = interpFactory(lc[0], lc[i_band+1])
+
+        return {'splines': splines, 'period': period}
 
 
 class StellarVariabilityModels(Variability):
@@ -422,27 +1725,55 @@ class StellarVariabilityModels(Variability):
     A mixin providing standard stellar variability models.
     """
 
+    # applyMicrolens treats events as over more than
+    # microlens_window_factor*that days from their peak;
+    # beyond that u > 2*microlens_window_factor, so the
+    # neglected |dmag| is less than 2.2/(2*microlens_window_factor)**4
+    microlens_window_factor = 30.0
+
     @register_method('applyRRly')
     def applyRRly(self, valid_dexes, params, expmjd,
-                  variability_cache=None):
+                  variability_cache=None, d_mag_out=None, bands=None):
 
         if len(params) == 0:
             return np.array([[],[],[],[],[],[]])
 
         keymap = {'filename':'filename', 't0':'tStartMjd'}
         return self.applyStdPeriodic(valid_dexes, params, keymap, expmjd,
-                interpFactory=InterpolatedUnivariateSpline)
+                interpFactory=InterpolatedUnivariateSpline, d_mag_out=d_mag_out,
+                bands=bands)
+
+    @register_max_dmag('applyRRly')
+    def maxDmagRRly(self, valid_dexes, params, variability_cache=None):
+
+        if len(params) == 0:
+            return np.zeros(0)
+
+        keymap = {'filename':'filename', 't0':'tStartMjd'}
+        return self._max_dmag_std_periodic(valid_dexes, params, keymap,
+                                           interpFactory=InterpolatedUnivariateSpline)
 
     @register_method('applyCepheid')
     def applyCepheid(self, valid_dexes, params, expmjd,
-                     variability_cache=None):
+                     variability_cache=None, d_mag_out=None, bands=None):
 
         if len(params) == 0:
             return np.array([[],[],[],[],[],[]])
 
         keymap = {'filename':'lcfile', 't0':'t0'}
         return self.applyStdPeriodic(valid_dexes, params, keymap, expmjd, inDays=False,
-                interpFactory=InterpolatedUnivariateSpline)
+                interpFactory=InterpolatedUnivariateSpline, d_mag_out=d_mag_out,
+                bands=bands)
+
+    @register_max_dmag('applyCepheid')
+    def maxDmagCepheid(self, valid_dexes, params, variability_cache=None):
+
+        if len(params) == 0:
+            return np.zeros(0)
+
+        keymap = {'filename':'lcfile', 't0':'t0'}
+        return self._max_dmag_std_periodic(valid_dexes, params, keymap, inDays=False,
+                                           interpFactory=InterpolatedUnivariateSpline)
 
     @register_method('applyEb')
     def applyEb(self, valid_dexes, params, expmjd,
@@ -470,14 +1801,29 @@ class StellarVariabilityModels(Variability):
                               dmag_vals, 0.0)
             return dMags
 
+    @register_max_dmag('applyEb')
+    def maxDmagEb(self, valid_dexes, params, variability_cache=None):
+
+        if len(params) == 0:
+            return np.zeros(0)
+
+        keymap = {'filename':'lcfile', 't0':'t0'}
+        return self._max_dmag_std_periodic(valid_dexes, params, keymap, inDays=False,
+                                           interpFactory=InterpolatedUnivariateSpline,
+                                           in_flux=True)
+
     @register_method('applyMicrolensing')
     def applyMicrolensing(self, valid_dexes, params, expmjd_in,
-                          variability_cache=None):
-        return self.applyMicrolens(valid_dexes, params,expmjd_in)
+                          variability_cache=None, bands=None):
+        return self.applyMicrolens(valid_dexes, params,expmjd_in, bands=bands)
+
+    @register_max_dmag('applyMicrolensing')
+    def maxDmagMicrolensing(self, valid_dexes, params, variability_cache=None):
+        return self.maxDmagMicrolens(valid_dexes, params)
 
     @register_method('applyMicrolens')
     def applyMicrolens(self, valid_dexes, params, expmjd_in,
-                       variability_cache=None):
+                       variability_cache=None, bands=None):
         #I believe this is the correct method based on
         #http://www.physics.fsu.edu/Courses/spring98/AST3033/Micro/lensing.htm
         #
@@ -488,35 +1834,81 @@ class StellarVariabilityModels(Variability):
         #variability parameter as its own database column.
         #At some point, either this method or the microlensing tables in the
         #database will need to be changed.
+        #
+        #Microlensing does not change colors, so the output is a read-only
+        #view repeating one array of delta magnitudes for every band.
 
         if len(params) == 0:
             return np.array([[],[],[],[],[],[]])
 
+        n_bands = 6
+        if bands is not None:
+            n_bands = len(bands)
+
         expmjd = np.asarray(expmjd_in,dtype=float)
         if isinstance(expmjd_in, numbers.Number):
-            dMags = np.zeros((6, self.num_variable_obj(params)))
-            epochs = expmjd - params['t0'][valid_dexes].astype(float)
-            umin = params['umin'].astype(float)[valid_dexes]
-            that = params['that'].astype(float)[valid_dexes]
+            dMags = np.zeros(self.num_variable_obj(params))
         else:
-            dMags = np.zeros((6, self.num_variable_obj(params), len(expmjd)))
-            # cast epochs, umin, that into 2-D numpy arrays; the first index will iterate
-            # over objects; the second index will iterate over times in expmjd
-            epochs = np.array([expmjd - t0 for t0 in params['t0'][valid_dexes].astype(float)])
-            umin = np.array([[uu]*len(expmjd) for uu in params['umin'].astype(float)[valid_dexes]])
-            that = np.array([[tt]*len(expmjd) for tt in params['that'].astype(float)[valid_dexes]])
+            dMags = np.zeros((self.num_variable_obj(params), len(expmjd)))
+
+        valid_obj = np.asarray(valid_dexes[0])
+        if len(valid_obj) == 0 or expmjd.size == 0:
+            return np.broadcast_to(dMags, (n_bands,)+dMags.shape)
+
+        t0 = params['t0'][valid_obj].astype(float)
+        umin = params['umin'].astype(float)[valid_obj]
+        that = params['that'].astype(float)[valid_obj]
+
+        # skip the events whose peaks are too far from every
+        # requested epoch to matter
+        half_window = self.microlens_window_factor*np.abs(that)
+        in_window = np.where(np.logical_and(t0+half_window >= expmjd.min(),
+                                            t0-half_window <= expmjd.max()))[0]
+        if len(in_window) == 0:
+            return np.broadcast_to(dMags, (n_bands,)+dMags.shape)
+
+        valid_obj = valid_obj[in_window]
+        t0 = t0[in_window]
+        umin = umin[in_window]
+        that = that[in_window]
+        half_window = half_window[in_window]
+
+        if expmjd.ndim == 0:
+            epochs = expmjd - t0
+        else:
+            # the first index iterates over objects; the second
+            # index iterates over times in expmjd
+            epochs = expmjd[None, :] - t0[:, None]
+            umin = umin[:, None]
+            that = that[:, None]
+            half_window = half_window[:, None]
 
         u = np.sqrt(umin**2 + ((2.0*epochs/that)**2))
         magnification = (u**2+2.0)/(u*np.sqrt(u**2+4.0))
         dmag = -2.5*np.log10(magnification)
-        for ix in range(6):
-            dMags[ix][valid_dexes] += dmag
-        return dMags
+        dmag[np.abs(epochs) > half_window] = 0.0
+        dMags[valid_obj] = dmag
+        return np.broadcast_to(dMags, (n_bands,)+dMags.shape)
+
+    @register_max_dmag('applyMicrolens')
+    def maxDmagMicrolens(self, valid_dexes, params, variability_cache=None):
+        """
+        The magnification of applyMicrolens peaks at epoch == t0,
+        where u == umin, so the bound is exact.
+        """
+        if len(params) == 0:
+            return np.zeros(0)
+
+        max_dmag = np.zeros(self.num_variable_obj(params), dtype=float)
+        umin = np.abs(params['umin'].astype(float)[valid_dexes])
+        magnification = (umin**2+2.0)/(umin*np.sqrt(umin**2+4.0))
+        max_dmag[valid_dexes] = 2.5*np.log10(magnification)
+        return max_dmag
 
 
     @register_method('applyAmcvn')
     def applyAmcvn(self, valid_dexes, params, expmjd_in,
-                   variability_cache=None):
+                   variability_cache=None, bands=None):
         #21 October 2014
         #This method assumes that the parameters for Amcvn variability
         #are stored in a varParamStr column in the database.  Actually, the
@@ -528,66 +1920,123 @@ class StellarVariabilityModels(Variability):
         if len(params) == 0:
             return np.array([[],[],[],[],[],[]])
 
+        if bands is None:
+            bands = 'ugrizy'
+
         maxyears = 10.
-        if isinstance(expmjd_in, numbers.Number):
-            dMag = np.zeros((6, self.num_variable_obj(params)))
-            amplitude = params['amplitude'].astype(float)[valid_dexes]
-            t0_arr = params['t0'].astype(float)[valid_dexes]
-            period = params['period'].astype(float)[valid_dexes]
-            epoch_arr = expmjd_in
+        valid_obj = np.asarray(valid_dexes[0])
+        mjd_is_number = isinstance(expmjd_in, numbers.Number)
+        if mjd_is_number:
+            dMag = np.zeros((len(bands), self.num_variable_obj(params)))
+            epoch = expmjd_in
         else:
-            dMag = np.zeros((6, self.num_variable_obj(params), len(expmjd_in)))
-            n_time = len(expmjd_in)
-            t0_arr = np.array([[tt]*n_time for tt in params['t0'].astype(float)[valid_dexes]])
-            amplitude = np.array([[aa]*n_time for aa in params['amplitude'].astype(float)[valid_dexes]])
-            period = np.array([[pp]*n_time for pp in params['period'].astype(float)[valid_dexes]])
-            epoch_arr = np.array([expmjd_in]*len(valid_dexes[0]))
+            dMag = np.zeros((len(bands), self.num_variable_obj(params), len(expmjd_in)))
+            epoch = np.asarray(expmjd_in, dtype=float)[None, :]
+
+        def per_object(arr):
+            # shape a per-object array so that it broadcasts against epoch
+            if mjd_is_number:
+                return arr
+            return arr[:, None]
+
+        amplitude = params['amplitude'].astype(float)[valid_obj]
+        t0 = params['t0'].astype(float)[valid_obj]
+        period = params['period'].astype(float)[valid_obj]
+        burst_freq = params['burst_freq'].astype(float)[valid_obj]
+        burst_scale = params['burst_scale'].astype(float)[valid_obj]
+        amp_burst = params['amp_burst'].astype(float)[valid_obj]
+        color_excess = params['color_excess_during_burst'].astype(float)[valid_obj]
+        does_burst = params['does_burst'][valid_obj]
+
+        # get the light curve of the typical variability
+        lc = per_object(amplitude)*np.cos((epoch - per_object(t0))/per_object(period))
+
+        # Add in the flux from any bursting.  The bursts begin at
+        # n_burst evenly spaced dates between t0+burst_freq and
+        # t0+maxyears; every burst which began more than burst_scale
+        # before the epoch contributes
+        #
+        #   -amp_burst*exp(1-(epoch-burst_date)/burst_scale)
+        #
+        # Rather than summing over the bursts, find the most recent
+        # contributing burst and sum the geometric series of its
+        # predecessors analytically.
+        bursting = np.where(does_burst==1)[0]
+        if len(bursting) > 0:
+            n_burst = np.ceil(maxyears*365.25/burst_freq[bursting]).astype(np.int64)
+            first_burst = t0[bursting] + burst_freq[bursting]
+            spacing = np.where(n_burst > 1,
+                               (t0[bursting] + maxyears*365.25 - first_burst)/np.maximum(n_burst-1, 1),
+                               0.0)
+            scale = per_object(burst_scale[bursting])
+            spacing = per_object(spacing)
+
+            # the number of bursts contributing at each epoch
+            time_available = epoch - per_object(first_burst) - scale
+            with np.errstate(divide='ignore', invalid='ignore'):
+                n_contrib = np.where(spacing > 0.0, np.ceil(time_available/spacing), 1.0)
+            n_contrib = np.where(time_available > 0.0,
+                                 np.minimum(n_contrib, per_object(n_burst)), 0.0)
+
+            latest_burst = per_object(first_burst) + np.maximum(n_contrib-1.0, 0.0)*spacing
+            with np.errstate(divide='ignore', invalid='ignore'):
+                series = np.where(spacing > 0.0,
+                                  np.expm1(-n_contrib*spacing/scale)/np.expm1(-spacing/scale),
+                                  n_contrib)
+            adds = np.where(n_contrib > 0.0,
+                            -per_object(amp_burst[bursting])*np.exp(1.0-(epoch-latest_burst)/scale)*series,
+                            0.0)
+
+        ## add some blue excess during the outburst
+        color_excess_factor = {'u': 2.0, 'g': 1.0, 'r': 0.5, 'i': 0.0, 'z': 0.0, 'y': 0.0}
+
+        for i_band, bp in enumerate(bands):
+            band_lc = np.copy(lc)
+            if len(bursting) > 0:
+                band_lc[bursting] += adds + color_excess_factor[bp]*per_object(color_excess[bursting])
+            dMag[i_band][valid_obj] += band_lc
+        return dMag
 
-        epoch = expmjd_in
+    @register_max_dmag('applyAmcvn')
+    def maxDmagAmcvn(self, valid_dexes, params, variability_cache=None):
+        """
+        Bound the quiescent oscillation by its amplitude and the bursts
+        of applyAmcvn by the sum of the (exponentially decaying)
+        contributions of every burst, each of which is less than
+        amp_burst.
+        """
+        if len(params) == 0:
+            return np.zeros(0)
 
-        t0 = params['t0'].astype(float)[valid_dexes]
+        maxyears = 10.
+        max_dmag = np.zeros(self.num_variable_obj(params), dtype=float)
+        amplitude = np.abs(params['amplitude'].astype(float)[valid_dexes])
         burst_freq = params['burst_freq'].astype(float)[valid_dexes]
         burst_scale = params['burst_scale'].astype(float)[valid_dexes]
-        amp_burst = params['amp_burst'].astype(float)[valid_dexes]
-        color_excess = params['color_excess_during_burst'].astype(float)[valid_dexes]
+        amp_burst = np.abs(params['amp_burst'].astype(float)[valid_dexes])
+        color_excess = np.abs(params['color_excess_during_burst'].astype(float)[valid_dexes])
         does_burst = params['does_burst'][valid_dexes]
 
-        # get the light curve of the typical variability
-        uLc   = amplitude*np.cos((epoch_arr - t0_arr)/period)
-        gLc   = copy.deepcopy(uLc)
-        rLc   = copy.deepcopy(uLc)
-        iLc   = copy.deepcopy(uLc)
-        zLc   = copy.deepcopy(uLc)
-        yLc   = copy.deepcopy(uLc)
-
-        # add in the flux from any bursting
-        local_bursting_dexes = np.where(does_burst==1)
-        for i_burst in local_bursting_dexes[0]:
-            adds = 0.0
-            for o in np.linspace(t0[i_burst] + burst_freq[i_burst],\
-                                 t0[i_burst] + maxyears*365.25, \
-                                 np.ceil(maxyears*365.25/burst_freq[i_burst]).astype(np.int64)):
-                tmp = np.exp( -1*(epoch - o)/burst_scale[i_burst])/np.exp(-1.)
-                adds -= amp_burst[i_burst]*tmp*(tmp < 1.0)  ## kill the contribution
-            ## add some blue excess during the outburst
-            uLc[i_burst] += adds +  2.0*color_excess[i_burst]
-            gLc[i_burst] += adds + color_excess[i_burst]
-            rLc[i_burst] += adds + 0.5*color_excess[i_burst]
-            iLc[i_burst] += adds
-            zLc[i_burst] += adds
-            yLc[i_burst] += adds
-
-        dMag[0][valid_dexes] += uLc
-        dMag[1][valid_dexes] += gLc
-        dMag[2][valid_dexes] += rLc
-        dMag[3][valid_dexes] += iLc
-        dMag[4][valid_dexes] += zLc
-        dMag[5][valid_dexes] += yLc
-        return dMag
+        burst_max = np.zeros(len(amplitude), dtype=float)
+        bursting = np.where(does_burst==1)
+        if len(bursting[0]) > 0:
+            freq = burst_freq[bursting]
+            n_burst = np.ceil(maxyears*365.25/freq)
+            spacing = (maxyears*365.25 - freq)/np.maximum(n_burst-1.0, 1.0)
+            # the bursts are evenly spaced, so at most
+            # 1/(1-exp(-spacing/burst_scale)) of them add up
+            with np.errstate(divide='ignore', over='ignore'):
+                n_eff = 1.0/(1.0-np.exp(-spacing/burst_scale[bursting]))
+            n_eff = np.where(np.isfinite(n_eff) & (n_eff > 0.0),
+                             np.minimum(n_burst, n_eff), n_burst)
+            burst_max[bursting] = amp_burst[bursting]*n_eff + 2.0*color_excess[bursting]
+
+        max_dmag[valid_dexes] = amplitude + burst_max
+        return max_dmag
 
     @register_method('applyBHMicrolens')
     def applyBHMicrolens(self, valid_dexes, params, expmjd_in,
-                         variability_cache=None):
+                         variability_cache=None, bands=None):
         #21 October 2014
         #This method assumes that the parameters for BHMicrolensing variability
         #are stored in a varParamStr column in the database.  Actually, the
@@ -595,41 +2044,312 @@ class StellarVariabilityModels(Variability):
         #variability parameter as its own database column.
         #At some point, either this method or the BHMicrolensing tables in the
         #database will need to be changed.
+        #
+        #Microlensing does not change colors, so the output is a read-only
+        #view repeating one array of delta magnitudes for every band.
 
         if len(params) == 0:
             return np.array([[],[],[],[],[],[]])
 
+        n_bands = 6
+        if bands is not None:
+            n_bands = len(bands)
+
         if isinstance(expmjd_in, numbers.Number):
-            magoff = np.zeros((6, self.num_variable_obj(params)))
+            magoff = np.zeros(self.num_variable_obj(params))
         else:
-            magoff = np.zeros((6, self.num_variable_obj(params), len(expmjd_in)))
+            magoff = np.zeros((self.num_variable_obj(params), len(expmjd_in)))
+        if len(valid_dexes[0]) == 0:
+            return np.broadcast_to(magoff, (n_bands,)+magoff.shape)
+
         expmjd = np.asarray(expmjd_in,dtype=float)
-        filename_arr = params['filename']
-        toff_arr = params['t0'].astype(float)
-        for ix in valid_dexes[0]:
-            toff = toff_arr[ix]
-            filename = filename_arr[ix]
-            epoch = expmjd - toff
-            lc = np.loadtxt(os.path.join(self.variabilityDataDir, filename), unpack=True, comments='#')
-            dt = lc[0][1] - lc[0][0]
-            period = lc[0][-1]
-            #BH lightcurves are in years
-            lc[0] *= 365.
-            minage = lc[0][0]
-            maxage = lc[0][-1]
-            #I'm assuming that these are all single point sources lensed by a
-            #black hole.  These also can be used to simulate binary systems.
-            #Should be 8kpc away at least.
-            magnification = InterpolatedUnivariateSpline(lc[0], lc[1])
-            mag_val = magnification(epoch)
+        # params may hold lists rather than numpy arrays
+        valid_obj = np.asarray(valid_dexes[0])
+        filename_arr = np.array([str(ff) for ff in np.asarray(params['filename'])[valid_obj]])
+        toff_arr = np.asarray(params['t0'])[valid_obj].astype(float)
+
+        if expmjd.ndim == 0:
+            epoch_arr = expmjd - toff_arr
+        else:
+            epoch_arr = expmjd[None, :] - toff_arr[:, None]
+
+        # evaluate all of the objects sharing a light curve at once
+        unq_filenames, file_inverse = np.unique(filename_arr, return_inverse=True)
+        for i_file, filename in enumerate(unq_filenames):
+            rows = np.where(file_inverse == i_file)[0]
+            magnification = self._get_bh_microlens_curve(filename)
+            mag_val = magnification(epoch_arr[rows])
             # If we are interpolating out of the light curve's domain, set
             # the magnification equal to 1
             mag_val = np.where(np.isnan(mag_val), 1.0, mag_val)
             moff = -2.5*np.log(mag_val)
-            for ii in range(6):
-                magoff[ii][ix] = moff
+            magoff[valid_obj[rows]] = moff
 
-        return magoff
+        return np.broadcast_to(magoff, (n_bands,)+magoff.shape)
+
+    def _get_bh_microlens_curve(self, filename):
+        """
+        Return the interpolator for the black hole microlensing
+        light curve stored in filename (relative to
+        self.variabilityDataDir), loading it into
+        self.variabilityLcCache if it is not already there.
+        """
+        cache_key = 'bh_microlens:%s' % filename
+        cached_curve = self.variabilityLcCache.get(cache_key)
+        if cached_curve is not None:
+            return cached_curve['magnification']
+
+        lc = np.loadtxt(os.path.join(self.variabilityDataDir, filename), unpack=True, comments='#')
+        #BH lightcurves are in years
+        lc[0] *= 365.
+        #I'm assuming that these are all single point sources lensed by a
+        #black hole.  These also can be used to simulate binary systems.
+        #Should be 8kpc away at least.
+        magnification = InterpolatedUnivariateSpline(lc[0], lc[1])
+        if self.variabilityCache:
+            self.variabilityLcCache[cache_key] = {'magnification': magnification}
+        return magnification
+
+
+def convert_mlt_light_curves(npz_file, out_dir=None):
+    """
+    Convert a .npz file of MLT flare light curves (as read by
+    MLTflaringMixin) into a directory of uncompressed .npy files
+    (one per light curve time grid or flux grid) plus an index.
+    MLTLightCurveStore memory-maps the arrays in such a directory,
+    so that every process using it shares the operating system's
+    page cache instead of holding its own copy of the light curves.
+
+    Parameters
+    ----------
+    npz_file is the path to the .npz file
+
+    out_dir is the directory to write (if None, npz_file with
+    the '.npz' removed)
+
+    Returns
+    -------
+    The path to the directory that was written
+    """
+    if out_dir is None:
+        if npz_file.endswith('.npz'):
+            out_dir = npz_file[:-4]
+        else:
+            out_dir = npz_file + '_mmap'
+
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    index = {'source': os.path.basename(npz_file), 'arrays': {}}
+    with np.load(npz_file) as npz_data:
+        for name in npz_data.files:
+            file_name = '%s.npy' % name
+            np.save(os.path.join(out_dir, file_name),
+                    np.ascontiguousarray(npz_data[name]))
+            index['arrays'][name] = file_name
+
+    # write the index last (and atomically) so that a partially
+    # converted directory is never mistaken for a complete one
+    index_name = os.path.join(out_dir, MLTLightCurveStore.index_name)
+    with open(index_name + '.tmp', 'w') as index_file:
+        json.dump(index, index_file, indent=1, sort_keys=True)
+    os.replace(index_name + '.tmp', index_name)
+
+    return out_dir
+
+
+class MLTLightCurveStore(object):
+    """
+    Read-only, dict-like access to a directory of MLT flare light
+    curves written by convert_mlt_light_curves().
+
+    Arrays are memory-mapped the first time they are requested, so
+    only the light curve classes actually used are ever touched, and
+    processes reading the same store share the data through the page
+    cache.  Keys are the same as in the original .npz file
+    (e.g. 'early_active_3_time', 'early_active_3_u').
+
+    Parameters
+    ----------
+    store_dir is the directory written by convert_mlt_light_curves()
+    """
+
+    index_name = 'index.json'
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, self.index_name), 'r') as index_file:
+            self._index = json.load(index_file)['arrays']
+        self._arrays = {}
+        self.closed = False
+
+    @classmethod
+    def is_store(cls, path):
+        """
+        Return True if path is a directory written by
+        convert_mlt_light_curves()
+        """
+        return os.path.isfile(os.path.join(path, cls.index_name))
+
+    @property
+    def files(self):
+        """
+        The names of the arrays in the store (like numpy's NpzFile.files)
+        """
+        return list(self._index.keys())
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __getitem__(self, name):
+        if self.closed:
+            raise RuntimeError("MLTLightCurveStore %s has been closed" % self.store_dir)
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.store_dir, self._index[name]),
+                                         mmap_mode='r')
+        return self._arrays[name]
+
+    def close(self):
+        self._arrays = {}
+        self.closed = True
+
+    def clear(self):
+        self.close()
+
+
+# where look up tables that are expensive to compute (e.g. the dust
+# extinction of MLT flares) are stored between processes
+_DEFAULT_CACHE_DIR = os.environ.get('SIMS_CATUTILS_CACHE_DIR',
+                                    os.path.join(os.path.expanduser('~'), '.cache',
+                                                 'sims_catUtils'))
+
+# MLT dust look up tables that have already been loaded or calculated
+# by this process, keyed on _mlt_dust_lookup_key()
+_MLT_DUST_LOOKUP_MEMO = {}
+
+
+def _mlt_dust_lookup_key(bandpass_dict, temperature):
+    """
+    Return a string uniquely identifying the MLT dust look up table
+    for the bandpasses in bandpass_dict and a blackbody of the given
+    temperature (in Kelvin).
+    """
+    hasher = hashlib.sha1()
+    hasher.update(('mlt_dust_v1_%.6e' % temperature).encode('utf-8'))
+    for bp_name in bandpass_dict.keys():
+        bp = bandpass_dict[bp_name]
+        hasher.update(bp_name.encode('utf-8'))
+        hasher.update(np.ascontiguousarray(bp.wavelen, dtype=float).tobytes())
+        hasher.update(np.ascontiguousarray(bp.sb, dtype=float).tobytes())
+    return hasher.hexdigest()
+
+
+def _calculate_mlt_dust_lookup(bandpass_dict, temperature):
+    """
+    Construct a look-up table to determine the factor by which to
+    multiply the flares' flux to account for dust as a function of
+    E(B-V), modeling the flares as blackbodies of the given temperature.
+
+    Returns a dict of numpy arrays keyed on 'ebv' and the names of the
+    bandpasses in bandpass_dict.
+    """
+    ebv_grid = np.arange(0.0, 7.01, 0.01)
+    bb_wavelen = np.arange(200.0, 1500.0, 0.1)
+    hc_over_k = 1.4387e7  # nm*K
+    exp_arg = hc_over_k/(temperature*bb_wavelen)
+    exp_term = 1.0/(np.exp(exp_arg) - 1.0)
+    ln_exp_term = np.log(exp_term)
+
+    # Blackbody f_lambda function;
+    # discard normalizing factors; we only care about finding the
+    # ratio of fluxes between the case with dust extinction and
+    # the case without dust extinction
+    log_bb_flambda = -5.0*np.log(bb_wavelen) + ln_exp_term
+    bb_flambda = np.exp(log_bb_flambda)
+    bb_sed = Sed(wavelen=bb_wavelen, flambda=bb_flambda)
+
+    base_fluxes = bandpass_dict.fluxListForSed(bb_sed)
+
+    a_x, b_x = bb_sed.setupCCM_ab()
+    dust_lookup = {}
+    dust_lookup['ebv'] = ebv_grid
+    list_of_bp = list(bandpass_dict.keys())
+    for bp in list_of_bp:
+        dust_lookup[bp] = np.zeros(len(ebv_grid))
+    for iebv, ebv_val in enumerate(ebv_grid):
+        wv, fl = bb_sed.addDust(a_x, b_x,
+                                ebv=ebv_val,
+                                wavelen=bb_wavelen,
+                                flambda=bb_flambda)
+
+        dusty_bb = Sed(wavelen=wv, flambda=fl)
+        dusty_fluxes = bandpass_dict.fluxListForSed(dusty_bb)
+        for ibp, bp in enumerate(list_of_bp):
+            dust_lookup[bp][iebv] = dusty_fluxes[ibp]/base_fluxes[ibp]
+
+    return dust_lookup
+
+
+def get_mlt_dust_lookup(bandpass_dict, temperature=9000.0, cache_dir=_DEFAULT_CACHE_DIR):
+    """
+    Return the look-up table of the factor by which dust extinction
+    multiplies the flux of an MLT flare (modeled as a blackbody) as a
+    function of E(B-V) in each bandpass.
+
+    The table is only calculated once per set of bandpasses and
+    temperature.  It is memoized for the rest of the process and
+    written to cache_dir (named by a hash of the bandpasses and
+    the temperature), so that later processes can just read it in.
+
+    Parameters
+    ----------
+    bandpass_dict is a BandpassDict of the bandpasses
+
+    temperature is the temperature of the blackbody in Kelvin
+
+    cache_dir is the directory in which to store the table on disk
+    (if None, the table is only memoized in this process).  Defaults to
+    $SIMS_CATUTILS_CACHE_DIR or ~/.cache/sims_catUtils
+
+    Returns
+    -------
+    A dict of numpy arrays keyed on 'ebv' and the names of the bandpasses.
+    The arrays are shared between callers and should not be modified.
+    """
+    key = _mlt_dust_lookup_key(bandpass_dict, temperature)
+    if key in _MLT_DUST_LOOKUP_MEMO:
+        return _MLT_DUST_LOOKUP_MEMO[key]
+
+    dust_lookup = None
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = os.path.join(cache_dir, 'mlt_dust_lookup_%s.npz' % key)
+        if os.path.exists(cache_file):
+            try:
+                with np.load(cache_file) as cached_data:
+                    dust_lookup = {name: cached_data[name] for name in cached_data.files}
+            except (IOError, OSError, ValueError):
+                dust_lookup = None
+
+    if dust_lookup is None:
+        dust_lookup = _calculate_mlt_dust_lookup(bandpass_dict, temperature)
+        if cache_file is not None:
+            # write to a temporary file and rename it, so that processes
+            # running in parallel never read a partially written table
+            try:
+                if not os.path.exists(cache_dir):
+                    os.makedirs(cache_dir)
+                tmp_file = '%s.%d.tmp.npz' % (cache_file[:-4], os.getpid())
+                np.savez(tmp_file, **dust_lookup)
+                os.replace(tmp_file, cache_file)
+            except (IOError, OSError):
+                pass
+
+    for name in dust_lookup:
+        dust_lookup[name].setflags(write=False)
+
+    _MLT_DUST_LOOKUP_MEMO[key] = dust_lookup
+    return dust_lookup
 
 
 class MLTflaringMixin(Variability):
@@ -641,17 +2361,33 @@ class MLTflaringMixin(Variability):
     _mlt_lc_file = os.path.join(getPackageDir('sims_data'),
                                 'catUtilsData', 'mlt_shortened_lc_171012.npz')
 
+    # the temperature (in Kelvin) of the blackbody used to model
+    # the effect of dust on flares
+    _mlt_flare_temperature = 9000.0
+
+    # the directory in which the dust look up table is cached
+    # (see get_mlt_dust_lookup)
+    _mlt_dust_cache_dir = _DEFAULT_CACHE_DIR
+
     def load_MLT_light_curves(self, mlt_lc_file, variability_cache):
         """
         Load MLT light curves specified by the file mlt_lc_file into
         the variability_cache
+
+        mlt_lc_file can either be a .npz file or a directory written
+        by convert_mlt_light_curves().  If it is a .npz file that
+        has been converted into the default directory (the .npz file's
+        name without the '.npz'), that directory is used instead, so
+        that the light curves are memory-mapped rather than read into
+        each process.  Either way, individual light curves are only
+        read when they are first needed.
         """
 
-        self._mlt_to_int = {}
-        self._mlt_to_int['None'] = -1
-        self._current_mlt_dex = 0
+        store_dir = mlt_lc_file
+        if mlt_lc_file.endswith('.npz'):
+            store_dir = mlt_lc_file[:-4]
 
-        if not os.path.exists(mlt_lc_file):
+        if not (os.path.exists(mlt_lc_file) or MLTLightCurveStore.is_store(store_dir)):
             catutils_scripts = os.path.join(getPackageDir('sims_catUtils'), 'support_scripts')
             raise RuntimeError("The MLT flaring light curve file:\n"
                                + "\n%s\n" % mlt_lc_file
@@ -661,7 +2397,10 @@ class MLTflaringMixin(Variability):
                                + "and run get_mdwarf_flares.sh "
                                + "to get the data")
 
-        variability_cache['_MLT_LC_NPZ'] = np.load(mlt_lc_file)
+        if MLTLightCurveStore.is_store(store_dir):
+            variability_cache['_MLT_LC_NPZ'] = MLTLightCurveStore(store_dir)
+        else:
+            variability_cache['_MLT_LC_NPZ'] = np.load(mlt_lc_file)
 
         global _GLOBAL_VARIABILITY_CACHE
         if variability_cache is _GLOBAL_VARIABILITY_CACHE:
@@ -669,46 +2408,214 @@ class MLTflaringMixin(Variability):
 
         variability_cache['_MLT_LC_NPZ_NAME'] = mlt_lc_file
 
-        if variability_cache['parallelizable']:
-            variability_cache['_MLT_LC_TIME_CACHE'] = mgr.dict()
-            variability_cache['_MLT_LC_DURATION_CACHE'] = mgr.dict()
-            variability_cache['_MLT_LC_MAX_TIME_CACHE'] = mgr.dict()
-            variability_cache['_MLT_LC_FLUX_CACHE'] = mgr.dict()
-        else:
-            variability_cache['_MLT_LC_TIME_CACHE'] = {}
-            variability_cache['_MLT_LC_DURATION_CACHE'] = {}
-            variability_cache['_MLT_LC_MAX_TIME_CACHE'] = {}
-            variability_cache['_MLT_LC_FLUX_CACHE'] = {}
+        # These caches are private to each process, even when the
+        # variability_cache is 'parallelizable'; flux grids read from
+        # an MLTLightCurveStore are memory-mapped, so caching them
+        # does not copy them.
+        budget = variability_cache.get('_LC_CACHE_BUDGET', _GLOBAL_LC_CACHE_BUDGET)
+        for cache_name in ('_MLT_LC_TIME_CACHE', '_MLT_LC_DURATION_CACHE',
+                           '_MLT_LC_MAX_TIME_CACHE', '_MLT_LC_FLUX_CACHE'):
+            # hand the memory of the old entries back to the budget
+            if isinstance(variability_cache.get(cache_name), LightCurveCache):
+                variability_cache[cache_name].clear()
+            variability_cache[cache_name] = LightCurveCache(budget=budget)
+        variability_cache['_MLT_LC_FLUX_RANGE_CACHE'] = {}
+
+
+    def _get_mlt_time_grid(self, lc_name, variability_cache):
+        """
+        Return the time grid (shifted to start at the beginning of the
+        survey), the duration and the maximum time of the MLT light
+        curve lc_name, reading them from the .npz file if they are
+        not (or are no longer) in the variability_cache.
+        """
+        time_arr = variability_cache['_MLT_LC_TIME_CACHE'].get(lc_name)
+        dt = variability_cache['_MLT_LC_DURATION_CACHE'].get(lc_name)
+        max_time = variability_cache['_MLT_LC_MAX_TIME_CACHE'].get(lc_name)
+        if time_arr is None or dt is None or max_time is None:
+            time_arr = variability_cache['_MLT_LC_NPZ']['%s_time' % lc_name] + self._survey_start
+            variability_cache['_MLT_LC_TIME_CACHE'][lc_name] = time_arr
+            dt = time_arr.max() - time_arr.min()
+            variability_cache['_MLT_LC_DURATION_CACHE'][lc_name] = dt
+            max_time = time_arr.max()
+            variability_cache['_MLT_LC_MAX_TIME_CACHE'][lc_name] = max_time
+        return time_arr, dt, max_time
+
+    def _get_mlt_flux(self, flux_name, variability_cache):
+        """
+        Return the flux grid flux_name (e.g. 'early_active_3_u') of an
+        MLT light curve, reading it from the .npz file if it is not
+        (or is no longer) in the variability_cache.
+        """
+        flux_arr = variability_cache['_MLT_LC_FLUX_CACHE'].get(flux_name)
+        if flux_arr is None:
+            flux_arr = variability_cache['_MLT_LC_NPZ'][flux_name]
+            variability_cache['_MLT_LC_FLUX_CACHE'][flux_name] = flux_arr
+        return flux_arr
+
+    def _get_mlt_flux_range(self, flux_name, variability_cache):
+        """
+        Return the (minimum, maximum) of the flux grid flux_name
+        of an MLT light curve.
+        """
+        range_cache = variability_cache.setdefault('_MLT_LC_FLUX_RANGE_CACHE', {})
+        if flux_name not in range_cache:
+            flux_arr = self._get_mlt_flux(flux_name, variability_cache)
+            range_cache[flux_name] = (float(flux_arr.min()), float(flux_arr.max()))
+        return range_cache[flux_name]
+
+    def _prepare_mlt_flaring(self, variability_cache):
+        """
+        Make sure that the MLT light curves are loaded into
+        variability_cache and that the dust look up table
+        has been constructed.
+        """
+        mlt_lc_data = variability_cache['_MLT_LC_NPZ']
+        if (mlt_lc_data is None
+            or variability_cache['_MLT_LC_NPZ_NAME'] != self._mlt_lc_file
+            or getattr(mlt_lc_data, 'closed', False)
+            or (hasattr(mlt_lc_data, 'fid') and mlt_lc_data.fid is None)):
 
+            self.load_MLT_light_curves(self._mlt_lc_file, variability_cache)
+
+        if not hasattr(self, '_mlt_dust_lookup'):
+            # Construct a look-up table to determine the factor
+            # by which to multiply the flares' flux to account for
+            # dust as a function of E(B-V).  Recall that we are
+            # modeling all MLT flares as 9000K blackbodies.
+            # The table is shared by every catalog in the process
+            # and cached on disk (see get_mlt_dust_lookup).
+
+            if not hasattr(self, 'lsstBandpassDict'):
+                raise RuntimeError('You are asking for MLT dwarf flaring '
+                                   'magnitudes in a catalog that has not '
+                                   'defined lsstBandpassDict.  The MLT '
+                                   'flaring magnitudes model does not know '
+                                   'how to apply dust extinction to the '
+                                   'flares without the member variable '
+                                   'lsstBandpassDict being defined.')
+
+            self._mlt_dust_lookup = get_mlt_dust_lookup(self.lsstBandpassDict,
+                                                        temperature=self._mlt_flare_temperature,
+                                                        cache_dir=self._mlt_dust_cache_dir)
+
+    def _mlt_flux_factor(self, parallax):
+        """
+        Return 1/(4 pi d^2) (in cm^-2) for stars with the given
+        parallax (in radians)
+        """
+        # get the distance to each star in parsecs
+        _au_to_parsec = 1.0/206265.0
+        dd = _au_to_parsec/parallax
+
+        # get the area of the sphere through which the star's energy
+        # is radiating to get to us (in cm^2)
+        _cm_per_parsec = 3.08576e18
+        sphere_area = 4.0*np.pi*np.power(dd*_cm_per_parsec, 2)
+
+        return 1.0/sphere_area
+
+    def _group_mlt_light_curves(self, params):
+        """
+        Return a list of (lc_name, use_this_lc) tuples, where lc_name is
+        the name of an MLT light curve and use_this_lc is a numpy array
+        of the indexes of the objects using it.
+        """
+        lc_name_arr = params['lc'].astype(str)
+
+        # group the objects by light curve; 'lc_1.txt' and 'lc_1'
+        # refer to the same light curve
+        lc_names_unique, lc_name_inverse = np.unique(lc_name_arr, return_inverse=True)
+        lc_groups = {}
+        for i_name, lc_name_raw in enumerate(lc_names_unique):
+            if 'None' in lc_name_raw:
+                continue
+
+            lc_name = lc_name_raw.replace('.txt', '')
+            if lc_name not in lc_groups:
+                lc_groups[lc_name] = []
+            lc_groups[lc_name].append(i_name)
+
+        group_list = []
+        for lc_name in sorted(lc_groups):
+
+            use_this_lc = np.where(np.isin(lc_name_inverse, lc_groups[lc_name]))[0]
+
+            # 2017 May 1
+            # There isn't supposed to be a 'late_inactive' light curve.
+            # Unfortunately, I (Scott Daniel) assigned 'late_inactive'
+            # light curves to some of the stars on our database.  Rather
+            # than fix the database table (which will take about a week of
+            # compute time), I am going to fix the problem here by mapping
+            # 'late_inactive' into 'late_active'.
+            if 'late' in lc_name:
+                lc_name = lc_name.replace('in', '')
+
+            group_list.append((lc_name, use_this_lc))
+
+        return group_list
 
-    def _process_mlt_class(self, lc_name_raw, lc_name_arr, lc_dex_arr, expmjd, params, time_arr, max_time, dt,
+    def _process_mlt_class(self, use_this_lc, expmjd, t0_arr, time_arr, max_time, dt,
                            flux_arr_dict, flux_factor, ebv, mlt_dust_lookup, base_fluxes,
-                           base_mags, mag_name_tuple, output_dict, do_mags):
+                           base_mags, mag_name_tuple, d_mag_out, do_mags):
+        """
+        Calculate the flares of all of the objects using one MLT light
+        curve, writing them into d_mag_out.
 
-        ss = Sed()
+        Parameters
+        ----------
+        use_this_lc is a numpy array of the indexes of the objects
+        using this light curve
 
-        lc_name = lc_name_raw.replace('.txt', '')
+        expmjd is a number or numpy array of dates
 
-        lc_dex_target = self._mlt_to_int[lc_name]
+        t0_arr is a numpy array of the t0 parameter of the objects in
+        use_this_lc
 
-        use_this_lc = np.where(lc_dex_arr==lc_dex_target)[0]
+        time_arr, max_time and dt are the time grid, last time and
+        duration of the light curve
 
-        if isinstance(expmjd, numbers.Number):
-            t_interp = (expmjd + params['t0'][use_this_lc]).astype(float)
+        flux_arr_dict is a dict of flux grids keyed on mag_name
+
+        flux_factor is a numpy array of 1/(4 pi d^2) for every object
+
+        ebv is a numpy array of E(B-V) for every object
+
+        mlt_dust_lookup is the dust extinction look up table
+
+        base_fluxes and base_mags are dicts (keyed on mag_name) of the
+        quiescent fluxes and magnitudes of every object
+
+        mag_name_tuple is a tuple of the names of the magnitudes
+        corresponding to the first index of d_mag_out
+
+        d_mag_out is the array (shaped like the output of applyMLTflaring)
+        into which to write the delta magnitudes (or delta fluxes)
+
+        do_mags is a boolean; if True, calculate delta magnitudes;
+        if False, delta fluxes
+        """
+
+        ss = Sed()
+
+        mjd_is_number = isinstance(expmjd, numbers.Number)
+
+        # the time on the light curve of each object at each date;
+        # shape is (n_obj,) or (n_obj, n_time)
+        if mjd_is_number:
+            t_interp = expmjd + t0_arr
         else:
-            n_obj = len(use_this_lc)
-            n_time = len(expmjd)
-            t_interp = np.ones(shape=(n_obj, n_time))*expmjd
-            t0_arr = params['t0'][use_this_lc].astype(float)
-            for i_obj in range(n_obj):
-                t_interp[i_obj,:] += t0_arr[i_obj]
+            t_interp = np.asarray(expmjd)[None, :] + t0_arr[:, None]
 
-        bad_dexes = np.where(t_interp>max_time)
-        while len(bad_dexes[0])>0:
-            t_interp[bad_dexes] -= dt
-            bad_dexes = np.where(t_interp>max_time)
+        # wrap times past the end of the light curve back onto it
+        n_wrap = np.ceil((t_interp - max_time)/dt)
+        t_interp = np.where(n_wrap > 0.0, t_interp - n_wrap*dt, t_interp)
+
+        if mjd_is_number:
+            obj_flux_factor = flux_factor[use_this_lc]
+        else:
+            obj_flux_factor = flux_factor[use_this_lc][:, None]
 
-        local_output_dict = {}
         for i_mag, mag_name in enumerate(mag_name_tuple):
             if mag_name in flux_arr_dict:
 
@@ -718,43 +2625,34 @@ class MLTflaringMixin(Variability):
                 dflux = np.interp(t_interp, time_arr, flux_arr)
                 self.t_spent_interp+=time.time()-t_pre_interp
 
-                if isinstance(expmjd, numbers.Number):
-                    dflux *= flux_factor[use_this_lc]
-                else:
-                    for i_obj in range(n_obj):
-                        dflux[i_obj,:] *= flux_factor[use_this_lc[i_obj]]
+                dflux *= obj_flux_factor
 
                 dust_factor = np.interp(ebv[use_this_lc],
                                         mlt_dust_lookup['ebv'],
                                         mlt_dust_lookup[mag_name])
 
-                if not isinstance(expmjd, numbers.Number):
-                    for i_obj in range(n_obj):
-                        dflux[i_obj,:] *= dust_factor[i_obj]
-                else:
+                if mjd_is_number:
                     dflux *= dust_factor
+                else:
+                    dflux *= dust_factor[:, None]
 
                 if do_mags:
-                    if isinstance(expmjd, numbers.Number):
-                        local_base_fluxes = base_fluxes[mag_name][use_this_lc]
-                        local_base_mags = base_mags[mag_name][use_this_lc]
-                    else:
-                        local_base_fluxes = np.array([base_fluxes[mag_name][use_this_lc]]*n_time).transpose()
-                        local_base_mags = np.array([base_mags[mag_name][use_this_lc]]*n_time).transpose()
+                    local_base_fluxes = base_fluxes[mag_name][use_this_lc]
+                    local_base_mags = base_mags[mag_name][use_this_lc]
+                    if not mjd_is_number:
+                        local_base_fluxes = local_base_fluxes[:, None]
+                        local_base_mags = local_base_mags[:, None]
 
-                    dmag = ss.magFromFlux(local_base_fluxes + dflux) - local_base_mags
-
-                    local_output_dict[i_mag]=dmag
+                    d_mag_out[i_mag][use_this_lc] = ss.magFromFlux(local_base_fluxes + dflux) - local_base_mags
                 else:
-                    local_output_dict[i_mag]=dflux
-
-            output_dict[lc_name_raw] = {'dex':use_this_lc, 'dmag':local_output_dict}
+                    d_mag_out[i_mag][use_this_lc] = dflux
 
     @register_method('MLT')
     def applyMLTflaring(self, valid_dexes, params, expmjd,
                         parallax=None, ebv=None, quiescent_mags=None,
                         variability_cache=None, do_mags=True,
-                        mag_name_tuple=('u','g','r','i','z','y')):
+                        mag_name_tuple=('u','g','r','i','z','y'),
+                        d_mag_out=None, bands=None):
         """
         parallax, ebv, and quiescent_mags are optional kwargs for use if you are
         calling this method outside the context of an InstanceCatalog (presumably
@@ -772,16 +2670,28 @@ class MLTflaringMixin(Variability):
 
         mag_name_tuple is a tuple indicating which magnitudes should actually
         be simulated
+
+        bands is the same as mag_name_tuple (it is the name under which
+        applyVariability passes the bands it needs); if it is given,
+        it overrides mag_name_tuple
+
+        d_mag_out is an optional array into which to write the output.
+        It must have the shape of the array this method returns;
+        the entries for objects which use this model are overwritten
+        and all other entries are left alone.
         """
         self.t_spent_interp = 0.0
         t_start = time.time()
         if not hasattr(self, '_total_t_MLT'):
             self._total_t_MLT = 0.0
 
+        if bands is not None:
+            mag_name_tuple = tuple(bands)
+
         if parallax is None:
-            parallax = self.column_by_name('parallax')
+            parallax = self._variability_column('parallax')
         if ebv is None:
-            ebv = self.column_by_name('ebv')
+            ebv = self._variability_column('ebv')
 
         if variability_cache is None:
             global _GLOBAL_VARIABILITY_CACHE
@@ -799,7 +2709,7 @@ class MLTflaringMixin(Variability):
                 if ('lsst_%s' % mag_name in self._actually_calculated_columns or
                     'delta_lsst_%s' % mag_name in self._actually_calculated_columns):
 
-                    quiescent_mags[mag_name] = self.column_by_name('quiescent_lsst_%s' % mag_name)
+                    quiescent_mags[mag_name] = self._variability_column('quiescent_lsst_%s' % mag_name)
 
         if not hasattr(self, 'photParams'):
             raise RuntimeError("To apply MLT dwarf flaring, your "
@@ -811,75 +2721,14 @@ class MLTflaringMixin(Variability):
                                "knowledge of the effective area of the LSST "
                                "mirror.")
 
-        if (variability_cache['_MLT_LC_NPZ'] is None
-            or variability_cache['_MLT_LC_NPZ_NAME'] != self._mlt_lc_file
-            or variability_cache['_MLT_LC_NPZ'].fid is None):
-
-            self.load_MLT_light_curves(self._mlt_lc_file, variability_cache)
-
-        if not hasattr(self, '_mlt_dust_lookup'):
-            # Construct a look-up table to determine the factor
-            # by which to multiply the flares' flux to account for
-            # dust as a function of E(B-V).  Recall that we are
-            # modeling all MLT flares as 9000K blackbodies.
-
-            if not hasattr(self, 'lsstBandpassDict'):
-                raise RuntimeError('You are asking for MLT dwarf flaring '
-                                   'magnitudes in a catalog that has not '
-                                   'defined lsstBandpassDict.  The MLT '
-                                   'flaring magnitudes model does not know '
-                                   'how to apply dust extinction to the '
-                                   'flares without the member variable '
-                                   'lsstBandpassDict being defined.')
-
-            ebv_grid = np.arange(0.0, 7.01, 0.01)
-            bb_wavelen = np.arange(200.0, 1500.0, 0.1)
-            hc_over_k = 1.4387e7  # nm*K
-            temp = 9000.0  # black body temperature in Kelvin
-            exp_arg = hc_over_k/(temp*bb_wavelen)
-            exp_term = 1.0/(np.exp(exp_arg) - 1.0)
-            ln_exp_term = np.log(exp_term)
-
-            # Blackbody f_lambda function;
-            # discard normalizing factors; we only care about finding the
-            # ratio of fluxes between the case with dust extinction and
-            # the case without dust extinction
-            log_bb_flambda = -5.0*np.log(bb_wavelen) + ln_exp_term
-            bb_flambda = np.exp(log_bb_flambda)
-            bb_sed = Sed(wavelen=bb_wavelen, flambda=bb_flambda)
-
-            base_fluxes = self.lsstBandpassDict.fluxListForSed(bb_sed)
-
-            a_x, b_x = bb_sed.setupCCM_ab()
-            self._mlt_dust_lookup = {}
-            self._mlt_dust_lookup['ebv'] = ebv_grid
-            list_of_bp = self.lsstBandpassDict.keys()
-            for bp in list_of_bp:
-                self._mlt_dust_lookup[bp] = np.zeros(len(ebv_grid))
-            for iebv, ebv_val in enumerate(ebv_grid):
-                wv, fl = bb_sed.addDust(a_x, b_x,
-                                        ebv=ebv_val,
-                                        wavelen=bb_wavelen,
-                                        flambda=bb_flambda)
-
-                dusty_bb = Sed(wavelen=wv, flambda=fl)
-                dusty_fluxes = self.lsstBandpassDict.fluxListForSed(dusty_bb)
-                for ibp, bp in enumerate(list_of_bp):
-                    self._mlt_dust_lookup[bp][iebv] = dusty_fluxes[ibp]/base_fluxes[ibp]
-
-        # get the distance to each star in parsecs
-        _au_to_parsec = 1.0/206265.0
-        dd = _au_to_parsec/parallax
-
-        # get the area of the sphere through which the star's energy
-        # is radiating to get to us (in cm^2)
-        _cm_per_parsec = 3.08576e18
-        sphere_area = 4.0*np.pi*np.power(dd*_cm_per_parsec, 2)
+        self._prepare_mlt_flaring(variability_cache)
 
-        flux_factor = 1.0/sphere_area
+        flux_factor = self._mlt_flux_factor(parallax)
 
         n_mags = len(mag_name_tuple)
-        if isinstance(expmjd, numbers.Number):
+        if d_mag_out is not None:
+            dMags = d_mag_out
+        elif isinstance(expmjd, numbers.Number):
             dMags = np.zeros((n_mags, self.num_variable_obj(params)))
         else:
             dMags = np.zeros((n_mags, self.num_variable_obj(params), len(expmjd)))
@@ -895,106 +2744,307 @@ class MLTflaringMixin(Variability):
                 base_mags[mag_name] = mm
                 base_fluxes[mag_name] = ss.fluxFromMag(mm)
 
-        lc_name_arr = params['lc'].astype(str)
-        lc_names_unique = np.sort(np.unique(lc_name_arr))
-
         t_work = 0.0
 
-        # load all of the necessary light curves
-        # t_flux_dict = 0.0
+        t_set_up = time.time()-t_start
 
-        if not hasattr(self, '_mlt_to_int'):
-            self._mlt_to_int = {}
-            self._mlt_to_int['None'] = -1
-            self._current_mlt_dex = 0
+        for lc_name, use_this_lc in self._group_mlt_light_curves(params):
 
-        for lc_name in lc_names_unique:
-            if 'None' in lc_name:
-                continue
+            time_arr, dt, max_time = self._get_mlt_time_grid(lc_name, variability_cache)
+            flux_arr_dict = {}
+            for mag_name in mag_name_tuple:
+                if ('lsst_%s' % mag_name in self._actually_calculated_columns or
+                    'delta_lsst_%s' % mag_name in self._actually_calculated_columns):
 
-            if lc_name not in self._mlt_to_int:
-                self._mlt_to_int[lc_name] = self._current_mlt_dex
-                self._mlt_to_int[lc_name.replace('.txt','')] = self._current_mlt_dex
-                self._current_mlt_dex += 1
+                    flux_arr_dict[mag_name] = self._get_mlt_flux('%s_%s' % (lc_name, mag_name),
+                                                                 variability_cache)
 
+            t_before_work = time.time()
+
+            self._process_mlt_class(use_this_lc, expmjd, params['t0'][use_this_lc].astype(float),
+                                    time_arr, max_time, dt,
+                                    flux_arr_dict, flux_factor, ebv, self._mlt_dust_lookup,
+                                    base_fluxes, base_mags, mag_name_tuple, dMags, do_mags)
+
+            t_work += time.time() - t_before_work
+
+        t_mlt = time.time()-t_start
+        self._total_t_MLT += t_mlt
 
-            lc_name = lc_name.replace('.txt', '')
+        return dMags
 
-            if 'late' in lc_name:
-                lc_name = lc_name.replace('in', '')
+    @register_max_dmag('MLT')
+    def maxDmagMLTflaring(self, valid_dexes, params, variability_cache=None,
+                          parallax=None, ebv=None, quiescent_mags=None,
+                          mag_name_tuple=('u','g','r','i','z','y')):
+        """
+        Bound |delta magnitude| of the flares of applyMLTflaring using
+        the extremes of each light curve's flux grids.  Because the
+        flares are linearly interpolated on those grids, the bound is
+        exact.  Only the bands actually calculated by the catalog are
+        considered.
+
+        parallax, ebv, quiescent_mags and mag_name_tuple are as in
+        applyMLTflaring
+        """
+        if len(params) == 0:
+            return np.zeros(0)
 
-            if lc_name not in variability_cache['_MLT_LC_DURATION_CACHE']:
-                time_arr = variability_cache['_MLT_LC_NPZ']['%s_time' % lc_name] + self._survey_start
-                variability_cache['_MLT_LC_TIME_CACHE'][lc_name] = time_arr
-                dt = time_arr.max() - time_arr.min()
-                variability_cache['_MLT_LC_DURATION_CACHE'][lc_name] = dt
-                max_time = time_arr.max()
-                variability_cache['_MLT_LC_MAX_TIME_CACHE'][lc_name] = max_time
+        if parallax is None:
+            parallax = self._variability_column('parallax')
+        if ebv is None:
+            ebv = self._variability_column('ebv')
 
-            # t_before_flux = time.time()
-            for mag_name in mag_name_tuple:
-                if ('lsst_%s' % mag_name in self._actually_calculated_columns or
-                    'delta_lsst_%s' % mag_name in self._actually_calculated_columns):
+        if variability_cache is None:
+            global _GLOBAL_VARIABILITY_CACHE
+            variability_cache = _GLOBAL_VARIABILITY_CACHE
 
-                    flux_name = '%s_%s' % (lc_name, mag_name)
-                    if flux_name not in variability_cache['_MLT_LC_FLUX_CACHE']:
+        mag_name_list = []
+        for mag_name in mag_name_tuple:
+            if ('lsst_%s' % mag_name in self._actually_calculated_columns or
+                'delta_lsst_%s' % mag_name in self._actually_calculated_columns):
 
-                        flux_arr = variability_cache['_MLT_LC_NPZ'][flux_name]
-                        variability_cache['_MLT_LC_FLUX_CACHE'][flux_name] = flux_arr
-            # t_flux_dict += time.time()-t_before_flux
+                mag_name_list.append(mag_name)
 
-        lc_dex_arr = np.array([self._mlt_to_int[name] for name in lc_name_arr])
+        if quiescent_mags is None:
+            quiescent_mags = {}
+            for mag_name in mag_name_list:
+                quiescent_mags[mag_name] = self._variability_column('quiescent_lsst_%s' % mag_name)
 
-        t_set_up = time.time()-t_start
+        self._prepare_mlt_flaring(variability_cache)
 
-        dmag_master_dict = {}
+        flux_factor = self._mlt_flux_factor(parallax)
 
-        for lc_name_raw in lc_names_unique:
-            if 'None' in lc_name_raw:
-                continue
+        ss = Sed()
+        max_dmag = np.zeros(self.num_variable_obj(params), dtype=float)
+        for lc_name, use_this_lc in self._group_mlt_light_curves(params):
+            for mag_name in mag_name_list:
+                flux_min, flux_max = self._get_mlt_flux_range('%s_%s' % (lc_name, mag_name),
+                                                              variability_cache)
+                dust_factor = np.interp(ebv[use_this_lc],
+                                        self._mlt_dust_lookup['ebv'],
+                                        self._mlt_dust_lookup[mag_name])
+                base_flux = ss.fluxFromMag(np.asarray(quiescent_mags[mag_name])[use_this_lc])
+                scale = flux_factor[use_this_lc]*dust_factor/base_flux
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    band_max = np.maximum(np.abs(2.5*np.log10(1.0+flux_max*scale)),
+                                          np.abs(2.5*np.log10(1.0+flux_min*scale)))
+                band_max = np.where(np.isnan(band_max), np.inf, band_max)
+                max_dmag[use_this_lc] = np.maximum(max_dmag[use_this_lc], band_max)
 
-            lc_name = lc_name_raw.replace('.txt', '')
+        return max_dmag
 
-            # 2017 May 1
-            # There isn't supposed to be a 'late_inactive' light curve.
-            # Unfortunately, I (Scott Daniel) assigned 'late_inactive'
-            # light curves to some of the stars on our database.  Rather
-            # than fix the database table (which will take about a week of
-            # compute time), I am going to fix the problem here by mapping
-            # 'late_inactive' into 'late_active'.
-            if 'late' in lc_name:
-                lc_name = lc_name.replace('in', '')
 
-            time_arr = variability_cache['_MLT_LC_TIME_CACHE'][lc_name]
-            dt = variability_cache['_MLT_LC_DURATION_CACHE'][lc_name]
-            max_time = variability_cache['_MLT_LC_MAX_TIME_CACHE'][lc_name]
-            flux_arr_dict = {}
-            for mag_name in mag_name_tuple:
-                if ('lsst_%s' % mag_name in self._actually_calculated_columns or
-                    'delta_lsst_%s' % mag_name in self._actually_calculated_columns):
+def _read_parametrized_light_curve_file(file_name):
+    """
+    Generator that parses a text file of parametrized light curve
+    models (see ParametrizedLightCurveMixin for the format), yielding
+    (tag, median, aa, bb, cc, omega, tau) for each light curve, where
+    aa, bb, cc, omega, and tau are lists of floats.
+    """
+    if file_name.endswith('.gz'):
+        open_fn = gzip.open
+    else:
+        open_fn = open
+
+    with open_fn(file_name, 'r') as input_file:
+        for line in input_file:
+            if type(line) == bytes:
+                line = line.decode("utf-8")
+            if line[0] == '#':
+                continue
+            params = line.strip().split()
+            name = params[0]
+            tag = int(name.split('_')[0][4:])
+            n_c = int(params[3])
+            median = float(params[4+n_c])
+            local_aa = []
+            local_bb = []
+            local_cc = []
+            local_omega = []
+            local_tau = []
+
+            for i_c in range(n_c):
+                base_dex = 5+n_c+i_c*5
+                local_aa.append(float(params[base_dex]))
+                local_bb.append(float(params[base_dex+1]))
+                local_cc.append(float(params[base_dex+2]))
+                local_omega.append(float(params[base_dex+3]))
+                local_tau.append(float(params[base_dex+4]))
+
+            yield tag, median, local_aa, local_bb, local_cc, local_omega, local_tau
+
+
+def _default_parametrized_store_dir(file_name):
+    """
+    Return the directory in which convert_parametrized_light_curves()
+    writes (and load_parametrized_light_curves() looks for) the
+    converted version of the text file file_name
+    """
+    store_dir = file_name
+    if store_dir.endswith('.gz'):
+        store_dir = store_dir[:-3]
+    if store_dir.endswith('.txt'):
+        store_dir = store_dir[:-4]
+    if store_dir == file_name:
+        store_dir = file_name + '_store'
+    return store_dir
 
-                    flux_arr_dict[mag_name] = variability_cache['_MLT_LC_FLUX_CACHE']['%s_%s' % (lc_name, mag_name)]
 
-            t_before_work = time.time()
+def convert_parametrized_light_curves(file_name, out_dir=None):
+    """
+    Convert a text file of parametrized light curve models (as read
+    by ParametrizedLightCurveMixin) into a directory of uncompressed
+    .npy files that ParametrizedLightCurveStore can memory-map.
+
+    The models are stored in columns sorted on the light curve tag:
+    'tag' and 'median' have one entry per light curve; 'a', 'b', 'c',
+    'omega', and 'tau' are the Fourier components of all of the light
+    curves concatenated, with the components of the ith light curve
+    at [offsets[i]:offsets[i+1]].
+
+    Parameters
+    ----------
+    file_name is the path to the text (or gzipped text) file
+
+    out_dir is the directory to write (if None, file_name with
+    '.txt.gz' or '.txt' removed)
+
+    Returns
+    -------
+    The path to the directory that was written
+    """
+    if out_dir is None:
+        out_dir = _default_parametrized_store_dir(file_name)
+
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    tag_list = []
+    median_list = []
+    n_c_list = []
+    component_lists = {'a': [], 'b': [], 'c': [], 'omega': [], 'tau': []}
+    for (tag, median, aa, bb, cc,
+         omega, tau) in _read_parametrized_light_curve_file(file_name):
+
+        tag_list.append(tag)
+        median_list.append(median)
+        n_c_list.append(len(aa))
+        component_lists['a'].extend(aa)
+        component_lists['b'].extend(bb)
+        component_lists['c'].extend(cc)
+        component_lists['omega'].extend(omega)
+        component_lists['tau'].extend(tau)
+
+    tag_arr = np.array(tag_list, dtype=np.int64)
+    n_c_arr = np.array(n_c_list, dtype=np.int64)
+    raw_offsets = np.zeros(len(n_c_arr)+1, dtype=np.int64)
+    raw_offsets[1:] = np.cumsum(n_c_arr)
+
+    sorted_dex = np.argsort(tag_arr, kind='stable')
+    tag_arr = tag_arr[sorted_dex]
+    if len(tag_arr) > 1 and (tag_arr[1:] == tag_arr[:-1]).any():
+        duplicate = tag_arr[1:][tag_arr[1:] == tag_arr[:-1]][0]
+        raise RuntimeError("The light curve tag %d appears more than once in %s"
+                           % (duplicate, file_name))
+
+    # gather the components of each light curve in tag order
+    n_c_arr = n_c_arr[sorted_dex]
+    offsets = np.zeros(len(n_c_arr)+1, dtype=np.int64)
+    offsets[1:] = np.cumsum(n_c_arr)
+    component_dex = np.arange(offsets[-1], dtype=np.int64)
+    component_dex += np.repeat(raw_offsets[:-1][sorted_dex]-offsets[:-1], n_c_arr)
+
+    columns = {'tag': tag_arr,
+               'offsets': offsets,
+               'median': np.array(median_list, dtype=float)[sorted_dex]}
+    for name in component_lists:
+        columns[name] = np.array(component_lists[name], dtype=float)[component_dex]
+
+    index = {'source': os.path.basename(file_name), 'arrays': {}}
+    for name in columns:
+        array_name = '%s.npy' % name
+        np.save(os.path.join(out_dir, array_name), columns[name])
+        index['arrays'][name] = array_name
+
+    # write the index last (and atomically) so that a partially
+    # converted directory is never mistaken for a complete one
+    index_name = os.path.join(out_dir, ParametrizedLightCurveStore.index_name)
+    with open(index_name + '.tmp', 'w') as index_file:
+        json.dump(index, index_file, indent=1, sort_keys=True)
+    os.replace(index_name + '.tmp', index_name)
+
+    return out_dir
+
+
+class ParametrizedLightCurveStore(object):
+    """
+    Read-only access to a directory of parametrized light curve models
+    written by convert_parametrized_light_curves().
+
+    The columns ('tag', 'offsets', 'median', 'a', 'b', 'c', 'omega',
+    'tau') are memory-mapped, so opening a store costs almost nothing
+    and processes reading the same store share the data through the
+    page cache.  Indexing the store with a light curve tag returns
+    a dict in the same form as the entries of the variability cache's
+    '_PARAMETRIZED_LC_MODELS' (with views into the flat columns).
+
+    Parameters
+    ----------
+    store_dir is the directory written by convert_parametrized_light_curves()
+    """
 
-            self._process_mlt_class(lc_name_raw, lc_name_arr, lc_dex_arr, expmjd, params, time_arr, max_time, dt,
-                                    flux_arr_dict, flux_factor, ebv, self._mlt_dust_lookup,
-                                    base_fluxes, base_mags, mag_name_tuple, dmag_master_dict, do_mags)
+    index_name = 'index.json'
 
-            t_work += time.time() - t_before_work
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, self.index_name), 'r') as index_file:
+            index = json.load(index_file)['arrays']
+        for name in ('tag', 'offsets', 'median', 'a', 'b', 'c', 'omega', 'tau'):
+            setattr(self, name, np.load(os.path.join(store_dir, index[name]),
+                                        mmap_mode='r'))
 
-        for lc_name in dmag_master_dict:
-            for i_mag in dmag_master_dict[lc_name]['dmag']:
-                dMags[i_mag][dmag_master_dict[lc_name]['dex']] += dmag_master_dict[lc_name]['dmag'][i_mag]
+    @classmethod
+    def is_store(cls, path):
+        """
+        Return True if path is a directory written by
+        convert_parametrized_light_curves()
+        """
+        return os.path.isfile(os.path.join(path, cls.index_name))
 
-        t_mlt = time.time()-t_start
-        self._total_t_MLT += t_mlt
+    def __len__(self):
+        return len(self.tag)
 
-        return dMags
+    def lookup(self, tags):
+        """
+        Return the row of each of the light curve tags in the columns
+        of the store (-1 for tags that are not in the store)
+        """
+        tags = np.asarray(tags, dtype=np.int64)
+        if len(self.tag) == 0:
+            return -1*np.ones(tags.shape, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.tag, tags), len(self.tag)-1)
+        return np.where(self.tag[rows] == tags, rows, -1)
+
+    def __contains__(self, tag):
+        return self.lookup(tag) >= 0
+
+    def __getitem__(self, tag):
+        row = int(self.lookup(tag))
+        if row < 0:
+            raise KeyError(tag)
+        i_start = self.offsets[row]
+        i_end = self.offsets[row+1]
+        return {'median': float(self.median[row]),
+                'a': self.a[i_start:i_end],
+                'b': self.b[i_start:i_end],
+                'c': self.c[i_start:i_end],
+                'omega': self.omega[i_start:i_end],
+                'tau': self.tau[i_start:i_end]}
 
 
 class ParametrizedLightCurveMixin(Variability):
-    """
+    r"""
     This mixin models variability using parametrized functions fit
     to light curves.
 
@@ -1040,6 +3090,18 @@ class ParametrizedLightCurveMixin(Variability):
                              cc_i }
     """
 
+    # the memory budget (in bytes) of the temporary arrays used when
+    # evaluating a block of parametrized light curves
+    parametrized_lc_block_max_bytes = 2**26
+
+    # how the Fourier sums of the parametrized light curves are evaluated;
+    # either 'direct' or 'recurrence' (see _calc_dflux_block_recurrence())
+    parametrized_lc_kernel = 'direct'
+
+    # the number of time steps between exact evaluations of the
+    # 'recurrence' kernel
+    parametrized_lc_reanchor = 32
+
     def load_parametrized_light_curves(self, file_name=None, variability_cache=None):
         """
         This method will load the parametrized light curve models
@@ -1047,6 +3109,13 @@ class ParametrizedLightCurveMixin(Variability):
         a global cache.  It is enough to just run this method from
         any instantiation of ParametrizedLightCurveMixin.
 
+        If file_name is a directory written by
+        convert_parametrized_light_curves(), or if such a directory
+        exists next to the text file file_name (see
+        convert_parametrized_light_curves() for its default name),
+        the models are memory-mapped from it rather than parsed
+        from the text file.
+
         Parameters
         ----------
         file_name is the absolute path to the file being loaded.
@@ -1066,14 +3135,30 @@ class ParametrizedLightCurveMixin(Variability):
         if file_name in variability_cache['_PARAMETRIZED_MODELS_LOADED']:
             return
 
-        if len(variability_cache['_PARAMETRIZED_LC_MODELS']) == 0 and using_global:
+        if '_PARAMETRIZED_LC_STORES' not in variability_cache:
+            variability_cache['_PARAMETRIZED_LC_STORES'] = []
+
+        if len(variability_cache['_PARAMETRIZED_MODELS_LOADED']) == 0 and using_global:
             sims_clean_up.targets.append(variability_cache['_PARAMETRIZED_LC_MODELS'])
+            sims_clean_up.targets.append(variability_cache['_PARAMETRIZED_LC_STORES'])
             sims_clean_up.targets.append(variability_cache['_PARAMETRIZED_MODELS_LOADED'])
+            if '_PARAMETRIZED_LC_COEFF_CACHE' in variability_cache:
+                sims_clean_up.targets.append(variability_cache['_PARAMETRIZED_LC_COEFF_CACHE'])
 
-        if file_name.endswith('.gz'):
-            open_fn = gzip.open
+        if ParametrizedLightCurveStore.is_store(file_name):
+            store_dir = file_name
         else:
-            open_fn = open
+            store_dir = _default_parametrized_store_dir(file_name)
+            if not ParametrizedLightCurveStore.is_store(store_dir):
+                store_dir = None
+
+        if store_dir is not None:
+            if store_dir not in variability_cache['_PARAMETRIZED_MODELS_LOADED']:
+                self._load_parametrized_light_curve_store(store_dir, variability_cache)
+                variability_cache['_PARAMETRIZED_MODELS_LOADED'].append(store_dir)
+            if file_name != store_dir:
+                variability_cache['_PARAMETRIZED_MODELS_LOADED'].append(file_name)
+            return
 
         if not os.path.exists(file_name):
             if file_name.endswith('kplr_lc_params.txt.gz'):
@@ -1084,80 +3169,89 @@ class ParametrizedLightCurveMixin(Variability):
             else:
                 raise RuntimeError('The file %s does not exist' % file_name)
 
-        with open_fn(file_name, 'r') as input_file:
-            for line in input_file:
-                if type(line) == bytes:
-                    line = line.decode("utf-8")
-                if line[0] == '#':
-                    continue
-                params = line.strip().split()
-                name = params[0]
-                tag = int(name.split('_')[0][4:])
-                if tag in variability_cache['_PARAMETRIZED_LC_MODELS']:
-                    # In case multiple sets of models have been loaded that
-                    # duplicate identifying integers.
-                    raise RuntimeError("You are trying to load light curve with the "
-                                       "identifying tag %d.  That has already been " % tag
-                                       + "loaded.  I am unsure how to proceed")
-                n_c = int(params[3])
-                median = float(params[4+n_c])
-                local_aa = []
-                local_bb = []
-                local_cc = []
-                local_omega = []
-                local_tau = []
-
-                for i_c in range(n_c):
-                    base_dex = 5+n_c+i_c*5
-                    local_aa.append(float(params[base_dex]))
-                    local_bb.append(float(params[base_dex+1]))
-                    local_cc.append(float(params[base_dex+2]))
-                    local_omega.append(float(params[base_dex+3]))
-                    local_tau.append(float(params[base_dex+4]))
-                local_aa = np.array(local_aa)
-                local_bb = np.array(local_bb)
-                local_cc = np.array(local_cc)
-                local_omega = np.array(local_omega)
-                local_tau = np.array(local_tau)
-
-                local_params = {}
-                local_params['median'] = median
-                local_params['a'] = local_aa
-                local_params['b'] = local_bb
-                local_params['c'] = local_cc
-                local_params['omega'] = local_omega
-                local_params['tau'] = local_tau
-                variability_cache['_PARAMETRIZED_LC_MODELS'][tag] = local_params
+        stores = variability_cache['_PARAMETRIZED_LC_STORES']
+        for (tag, median, local_aa, local_bb, local_cc,
+             local_omega, local_tau) in _read_parametrized_light_curve_file(file_name):
+
+            if (tag in variability_cache['_PARAMETRIZED_LC_MODELS'] or
+                any(tag in store for store in stores)):
+
+                # In case multiple sets of models have been loaded that
+                # duplicate identifying integers.
+                raise RuntimeError("You are trying to load light curve with the "
+                                   "identifying tag %d.  That has already been " % tag
+                                   + "loaded.  I am unsure how to proceed")
+
+            local_params = {}
+            local_params['median'] = median
+            local_params['a'] = np.array(local_aa)
+            local_params['b'] = np.array(local_bb)
+            local_params['c'] = np.array(local_cc)
+            local_params['omega'] = np.array(local_omega)
+            local_params['tau'] = np.array(local_tau)
+            variability_cache['_PARAMETRIZED_LC_MODELS'][tag] = local_params
 
         variability_cache['_PARAMETRIZED_MODELS_LOADED'].append(file_name)
 
-    def _calc_dflux(self, lc_id, expmjd, variability_cache=None):
+    def _load_parametrized_light_curve_store(self, store_dir, variability_cache):
+        """
+        Open the ParametrizedLightCurveStore in store_dir and add it
+        to the stores in variability_cache, making sure that none of
+        its light curve tags have already been loaded.
         """
+        store = ParametrizedLightCurveStore(store_dir)
+
+        loaded_tags = [np.fromiter(variability_cache['_PARAMETRIZED_LC_MODELS'].keys(),
+                                   dtype=np.int64)]
+        loaded_tags += [other.tag for other in variability_cache['_PARAMETRIZED_LC_STORES']]
+        for tag_arr in loaded_tags:
+            duplicates = np.intersect1d(tag_arr, store.tag)
+            if len(duplicates) > 0:
+                raise RuntimeError("You are trying to load light curve with the "
+                                   "identifying tag %d.  That has already been " % duplicates[0]
+                                   + "loaded.  I am unsure how to proceed")
+
+        variability_cache['_PARAMETRIZED_LC_STORES'].append(store)
+
+    def _get_parametrized_lc_coeffs(self, lc_id, variability_cache):
+        r"""
+        Return the coefficients needed to evaluate the parametrized
+        light curve lc_id, caching them in the variability_cache.
+
         Parameters
         ----------
         lc_id is an integer referring to the ID of the light curve in
-        the parametrized light curve model (these need to be unique
-        across all parametrized light curve catalogs loaded)
+        the parametrized light curve model
 
-        expmjd is either a number or an array referring to the MJD of the
-        observations
+        variability_cache is the cache into which the parametrized
+        light curve models were loaded
 
         Returns
         -------
-        baseline_flux is a number indicating the quiescent flux
-        of the light curve
+        quiescent_flux is the quiescent flux of the light curve
 
-        delta_flux is a number or an array of the flux above or below
-        the quiescent flux at each of expmjd
-        """
+        omega is a numpy array of the angular frequencies of the
+        Fourier components
 
-        if variability_cache is None:
-            global _GLOBAL_VARIABILITY_CACHE
-            variability_cache = _GLOBAL_VARIABILITY_CACHE
+        cos_coeff and sin_coeff are numpy arrays such that
+        delta_flux(t) = \sum_i cos_coeff_i*cos(omega_i*t) + sin_coeff_i*sin(omega_i*t)
+        """
+        coeff_cache = variability_cache.get('_PARAMETRIZED_LC_COEFF_CACHE', None)
+        if coeff_cache is not None:
+            coeffs = coeff_cache.get(lc_id)
+            if coeffs is not None:
+                return coeffs
 
         try:
             model = variability_cache['_PARAMETRIZED_LC_MODELS'][lc_id]
         except KeyError:
+            model = None
+            for store in variability_cache.get('_PARAMETRIZED_LC_STORES', ()):
+                if lc_id in store:
+                    model = store[lc_id]
+                    break
+
+        if model is None:
             raise KeyError('A KeyError was raised on the light curve id %d.  ' % lc_id
                            + 'You may not have loaded your parametrized light '
                            + 'curve models, yet.  '
@@ -1172,7 +3266,6 @@ class ParametrizedLightCurveMixin(Variability):
 
         quiescent_flux = model['median'] + cc.sum()
 
-        omega_t = np.outer(expmjd, omega)
         omega_tau = omega*tau
 
         # use trig identities to calculate
@@ -1184,21 +3277,329 @@ class ParametrizedLightCurveMixin(Variability):
         b_cos_omega_tau = bb*cos_omega_tau
         b_sin_omega_tau = bb*sin_omega_tau
 
-        cos_omega_t = np.cos(omega_t)
-        sin_omega_t = np.sin(omega_t)
+        coeffs = (quiescent_flux, omega,
+                  a_cos_omega_tau-b_sin_omega_tau,
+                  a_sin_omega_tau+b_cos_omega_tau)
+
+        if coeff_cache is not None:
+            coeff_cache[lc_id] = coeffs
+
+        return coeffs
+
+    def _calc_dflux(self, lc_id, expmjd, variability_cache=None, kernel=None):
+        """
+        Parameters
+        ----------
+        lc_id is an integer referring to the ID of the light curve in
+        the parametrized light curve model (these need to be unique
+        across all parametrized light curve catalogs loaded)
+
+        expmjd is either a number or an array referring to the MJD of the
+        observations
+
+        kernel is the name of the method used to evaluate the Fourier
+        sum (if None, self.parametrized_lc_kernel)
+
+        Returns
+        -------
+        baseline_flux is a number indicating the quiescent flux
+        of the light curve
+
+        delta_flux is a number or an array of the flux above or below
+        the quiescent flux at each of expmjd
+        """
+
+        if variability_cache is None:
+            global _GLOBAL_VARIABILITY_CACHE
+            variability_cache = _GLOBAL_VARIABILITY_CACHE
 
-        #delta_flux = np.dot(cos_omega_t, a_cos_omega_tau)
-        #delta_flux += np.dot(sin_omega_t, a_sin_omega_tau)
-        #delta_flux += np.dot(sin_omega_t, b_cos_omega_tau)
-        #delta_flux -= np.dot(cos_omega_t, b_sin_omega_tau)
+        quiescent_flux, omega, cos_coeff, sin_coeff = self._get_parametrized_lc_coeffs(lc_id,
+                                                                                      variability_cache)
 
-        delta_flux = np.dot(cos_omega_t, a_cos_omega_tau-b_sin_omega_tau)
-        delta_flux += np.dot(sin_omega_t, a_sin_omega_tau+b_cos_omega_tau)
+        calc_dflux_block = self._get_parametrized_lc_kernel(kernel)
+
+        lc_time = np.atleast_1d(np.asarray(expmjd, dtype=float))
+        delta_flux = calc_dflux_block(lc_time[None, :], omega[None, :],
+                                      cos_coeff[None, :], sin_coeff[None, :])[0]
 
         if len(delta_flux)==1:
-            delta_flux = np.float(delta_flux)
+            delta_flux = float(delta_flux[0])
         return quiescent_flux, delta_flux
 
+    def _calc_dflux_block(self, lc_time, omega, cos_coeff, sin_coeff):
+        """
+        Evaluate the variable flux of a block of parametrized light
+        curves that all have the same number of Fourier components.
+
+        Parameters
+        ----------
+        lc_time is an (n_obj, n_t) numpy array of the times at which
+        to evaluate each light curve
+
+        omega, cos_coeff, and sin_coeff are (n_obj, n_components) numpy
+        arrays in the sense of _get_parametrized_lc_coeffs()
+
+        Returns
+        -------
+        An (n_obj, n_t) numpy array of the flux above or below the
+        quiescent flux
+        """
+        # Every sum over components is taken along the contiguous last
+        # axis of its own row, so the result for an object does not
+        # depend on which (or how many) other objects share its block.
+        omega_t = lc_time[:, :, None]*omega[:, None, :]
+        trig_omega_t = np.cos(omega_t)
+        trig_omega_t *= cos_coeff[:, None, :]
+        delta_flux = trig_omega_t.sum(axis=2)
+        np.sin(omega_t, out=trig_omega_t)
+        trig_omega_t *= sin_coeff[:, None, :]
+        delta_flux += trig_omega_t.sum(axis=2)
+        return delta_flux
+
+    def _calc_dflux_block_recurrence(self, lc_time, omega, cos_coeff, sin_coeff):
+        r"""
+        Evaluate the variable flux of a block of parametrized light
+        curves on uniformly spaced times using angle-addition recurrences.
+
+        exp(i*omega*t) is evaluated exactly only at every
+        self.parametrized_lc_reanchor'th time step; in between, it is
+        advanced by repeated multiplication with exp(i*omega*dt).  This
+        replaces all but a fraction 1/parametrized_lc_reanchor of the
+        transcendental function calls with complex multiplications.
+
+        The rounding error of the recurrence grows linearly between
+        anchors, so, with m = self.parametrized_lc_reanchor, the result
+        differs from _calc_dflux_block() by at most about
+
+            \sum_i (|aa_i| + |bb_i|) * ((2*m + 4)*2**-52 + omega_i*delta_t)
+
+        where delta_t <= 8*2**-52*max(|t|) is how far the times stray
+        from an exactly uniform grid (the same size as the round-off
+        already present in omega*t, so the second term is no larger
+        than the error of _calc_dflux_block() itself).
+
+        If the rows of lc_time are not uniformly spaced to within
+        delta_t, this falls back to _calc_dflux_block().
+
+        Parameters
+        ----------
+        lc_time is an (n_obj, n_t) numpy array of the times at which
+        to evaluate each light curve
+
+        omega, cos_coeff, and sin_coeff are (n_obj, n_components) numpy
+        arrays in the sense of _get_parametrized_lc_coeffs()
+
+        Returns
+        -------
+        An (n_obj, n_t) numpy array of the flux above or below the
+        quiescent flux
+        """
+        n_obj, n_t = lc_time.shape
+        n_reanchor = int(min(self.parametrized_lc_reanchor, n_t))
+        if n_t < 3 or n_reanchor < 2:
+            return self._calc_dflux_block(lc_time, omega, cos_coeff, sin_coeff)
+
+        time_step = (lc_time[:, -1]-lc_time[:, 0])/(n_t-1)
+        uniform_time = lc_time[:, :1] + np.arange(n_t)[None, :]*time_step[:, None]
+        tolerance = 8.0*np.finfo(float).eps*np.abs(lc_time).max()
+        if np.abs(lc_time-uniform_time).max() > tolerance:
+            return self._calc_dflux_block(lc_time, omega, cos_coeff, sin_coeff)
+
+        n_c = omega.shape[1]
+        anchor_dex = np.arange(0, n_t, n_reanchor)
+
+        # exp(i*omega*t) at the anchors, weighted by the complex
+        # amplitudes (cos_coeff - i*sin_coeff); the real part of their
+        # product is cos_coeff*cos(omega*t) + sin_coeff*sin(omega*t)
+        weighted_anchor = np.exp(1j*(lc_time[:, anchor_dex, None]*omega[:, None, :]))
+        weighted_anchor *= (cos_coeff - 1j*sin_coeff)[:, None, :]
+
+        # exp(i*omega*k*dt) for the time steps k between anchors
+        rotation = np.empty((n_obj, n_c, n_reanchor), dtype=complex)
+        rotation[:, :, 0] = 1.0
+        rotation[:, :, 1:] = np.exp(1j*(omega*time_step[:, None]))[:, :, None]
+        np.cumprod(rotation, axis=2, out=rotation)
+
+        delta_flux = np.matmul(weighted_anchor, rotation).real
+        return delta_flux.reshape(n_obj, len(anchor_dex)*n_reanchor)[:, :n_t]
+
+    def _get_parametrized_lc_kernel(self, kernel):
+        """
+        Return the method that evaluates blocks of parametrized light
+        curves for the kernel name kernel (if None,
+        self.parametrized_lc_kernel)
+        """
+        if kernel is None:
+            kernel = self.parametrized_lc_kernel
+        if kernel == 'direct':
+            return self._calc_dflux_block
+        elif kernel == 'recurrence':
+            return self._calc_dflux_block_recurrence
+        raise RuntimeError("There is no parametrized light curve kernel '%s'; "
+                           "the options are 'direct' and 'recurrence'" % kernel)
+
+    def _get_parametrized_lc_matrix(self, lc_id_arr, variability_cache):
+        """
+        Return the coefficients needed to evaluate the parametrized
+        light curves in lc_id_arr, padded into matrices with one row
+        per light curve (padding components have zero frequency and
+        zero amplitude, so they contribute nothing to the flux).
+
+        Parameters
+        ----------
+        lc_id_arr is a numpy array of light curve IDs
+
+        variability_cache is the cache into which the parametrized
+        light curve models were loaded
+
+        Returns
+        -------
+        quiescent_flux is a numpy array of the quiescent fluxes
+
+        n_components is a numpy array of the number of Fourier
+        components in each light curve
+
+        omega, cos_coeff, and sin_coeff are (len(lc_id_arr), max(n_components))
+        numpy arrays in the sense of _get_parametrized_lc_coeffs()
+        """
+        n_lc = len(lc_id_arr)
+        quiescent_flux = np.zeros(n_lc, dtype=float)
+        n_components = np.zeros(n_lc, dtype=int)
+        found = np.zeros(n_lc, dtype=bool)
+        store_rows = []
+
+        # light curves loaded into memory-mapped stores can be gathered
+        # from the flat columns all at once
+        for store in variability_cache.get('_PARAMETRIZED_LC_STORES', ()):
+            rows = store.lookup(lc_id_arr)
+            rows[found] = -1
+            in_store = np.where(rows >= 0)[0]
+            if len(in_store) > 0:
+                rows = rows[in_store]
+                n_components[in_store] = store.offsets[rows+1] - store.offsets[rows]
+                store_rows.append((store, in_store, rows))
+                found[in_store] = True
+
+        other_coeffs = {}
+        for i_lc in np.where(~found)[0]:
+            coeffs = self._get_parametrized_lc_coeffs(lc_id_arr[i_lc], variability_cache)
+            other_coeffs[i_lc] = coeffs
+            n_components[i_lc] = len(coeffs[1])
+
+        max_n_c = n_components.max() if n_lc > 0 else 0
+        omega = np.zeros((n_lc, max_n_c), dtype=float)
+        cos_coeff = np.zeros((n_lc, max_n_c), dtype=float)
+        sin_coeff = np.zeros((n_lc, max_n_c), dtype=float)
+
+        for store, in_store, rows in store_rows:
+            n_c = n_components[in_store]
+            component_dex = np.arange(max_n_c)
+            valid = component_dex[None, :] < n_c[:, None]
+            flat_dex = np.where(valid, store.offsets[rows][:, None] + component_dex[None, :], 0)
+
+            tau = np.where(valid, store.tau[flat_dex], 0.0)
+            omega_store = np.where(valid, store.omega[flat_dex], 0.0)
+            aa = np.where(valid, store.a[flat_dex], 0.0)
+            bb = np.where(valid, store.b[flat_dex], 0.0)
+            cc = np.where(valid, store.c[flat_dex], 0.0)
+
+            omega_tau = omega_store*tau
+            cos_omega_tau = np.cos(omega_tau)
+            sin_omega_tau = np.sin(omega_tau)
+
+            quiescent_flux[in_store] = store.median[rows] + cc.sum(axis=1)
+            omega[in_store] = omega_store
+            cos_coeff[in_store] = aa*cos_omega_tau - bb*sin_omega_tau
+            sin_coeff[in_store] = aa*sin_omega_tau + bb*cos_omega_tau
+
+        for i_lc in other_coeffs:
+            n_c = n_components[i_lc]
+            (quiescent_flux[i_lc], omega[i_lc, :n_c],
+             cos_coeff[i_lc, :n_c], sin_coeff[i_lc, :n_c]) = other_coeffs[i_lc]
+
+        return quiescent_flux, n_components, omega, cos_coeff, sin_coeff
+
+    def _calc_dmag_batch(self, lc_id_arr, lc_time, variability_cache, max_bytes=None,
+                         kernel=None):
+        """
+        Evaluate the parametrized light curves of many objects at once.
+
+        Objects are sorted on the number of Fourier components in their
+        light curves and evaluated in blocks of (objects, times, components)
+        whose temporary arrays fit within max_bytes.
+
+        Parameters
+        ----------
+        lc_id_arr is a numpy array of the light curve ID of each object
+
+        lc_time is a (len(lc_id_arr), n_t) numpy array of the times
+        at which to evaluate each object's light curve (i.e. expmjd-t0)
+
+        variability_cache is the cache into which the parametrized
+        light curve models were loaded
+
+        max_bytes is the memory budget of the temporary arrays
+        (if None, self.parametrized_lc_block_max_bytes)
+
+        kernel is the name of the method used to evaluate the Fourier
+        sums (if None, self.parametrized_lc_kernel)
+
+        Returns
+        -------
+        A (len(lc_id_arr), n_t) numpy array of delta magnitudes
+        """
+        if max_bytes is None:
+            max_bytes = self.parametrized_lc_block_max_bytes
+
+        calc_dflux_block = self._get_parametrized_lc_kernel(kernel)
+
+        n_obj, n_t = lc_time.shape
+        d_mag = np.zeros((n_obj, n_t), dtype=float)
+        if n_obj == 0 or n_t == 0:
+            return d_mag
+
+        unq_lc_id, lc_dex = np.unique(lc_id_arr, return_inverse=True)
+        (quiescent_flux, n_components,
+         omega, cos_coeff, sin_coeff) = self._get_parametrized_lc_matrix(unq_lc_id,
+                                                                         variability_cache)
+
+        obj_n_c = n_components[lc_dex]
+        sorted_obj = np.argsort(obj_n_c, kind='stable')
+        sorted_n_c = obj_n_c[sorted_obj]
+
+        # omega*t and cos(omega*t) (then sin(omega*t)) are held at once
+        bytes_per_element = 2*8
+
+        d_flux = np.empty((n_obj, n_t), dtype=float)
+        i_start = 0
+        while i_start < n_obj:
+            # blocks only contain light curves with the same number of
+            # components, so no time is spent evaluating padding
+            n_c = sorted_n_c[i_start]
+            element_bytes = bytes_per_element*max(n_c, 1)
+            t_step = int(max(1, min(n_t, max_bytes//element_bytes)))
+            n_block = int(max(1, max_bytes//(element_bytes*t_step)))
+            i_end = min(i_start+n_block,
+                        np.searchsorted(sorted_n_c, n_c, side='right'))
+
+            obj_dex = sorted_obj[i_start:i_end]
+            block_lc = lc_dex[obj_dex]
+            block_omega = omega[block_lc, :n_c]
+            block_cos_coeff = cos_coeff[block_lc, :n_c]
+            block_sin_coeff = sin_coeff[block_lc, :n_c]
+
+            for t_start in range(0, n_t, t_step):
+                t_end = min(n_t, t_start+t_step)
+                d_flux[obj_dex, t_start:t_end] = calc_dflux_block(lc_time[obj_dex, t_start:t_end],
+                                                                  block_omega,
+                                                                  block_cos_coeff,
+                                                                  block_sin_coeff)
+
+            i_start = i_end
+
+        d_mag[:] = -2.5*np.log10(1.0+d_flux/quiescent_flux[lc_dex][:, None])
+        return d_mag
+
     def singleBandParametrizedLightCurve(self, valid_dexes, params, expmjd,
                                          variability_cache=None):
         """
@@ -1217,122 +3618,125 @@ class ParametrizedLightCurveMixin(Variability):
             global _GLOBAL_VARIABILITY_CACHE
             variability_cache = _GLOBAL_VARIABILITY_CACHE
 
-        # t_before_cast = time.time()
-        lc_int_arr = -1*np.ones(len(params['lc']), dtype=int)
-        for ii in range(len(params['lc'])):
-            if params['lc'][ii] is not None:
-                lc_int_arr[ii] = params['lc'][ii]
-        # print('t_cast %.2e' % (time.time()-t_before_cast))
+        lc_arr = np.asarray(params['lc'])
+        if lc_arr.dtype == object:
+            has_lc = np.not_equal(lc_arr, None)
+        else:
+            has_lc = np.ones(len(lc_arr), dtype=bool)
 
-        good = np.where(lc_int_arr>=0)
-        unq_lc_int = np.unique(params['lc'][good])
+        if '_PARAMETRIZED_LC_DMAG_CUTOFF' in variability_cache and has_lc.any():
+            unq_lc_int, unq_dex = np.unique(lc_arr[has_lc].astype(int), return_inverse=True)
+            cutoff = _MAX_DMAG_SAFETY_FACTOR*variability_cache['_PARAMETRIZED_LC_DMAG_CUTOFF']
+            dmag_lookup = variability_cache['_PARAMETRIZED_LC_DMAG_LOOKUP']
+            can_alert = np.array([dmag_lookup[lc_int] >= cutoff for lc_int in unq_lc_int.tolist()],
+                                 dtype=bool)
+            has_lc[has_lc] = can_alert[unq_dex]
 
-        # print('applyParamLC %d obj; %d unique' % (n_obj, len(unq_lc_int)))
+        use_this_lc = np.where(has_lc)[0]
+        lc_int_arr = lc_arr[use_this_lc].astype(int)
+        t0_arr = params['t0'][use_this_lc].astype(float)
 
         if isinstance(expmjd, numbers.Number):
-            mjd_is_number = True
-            n_t = 1
             d_mag_out = np.zeros(n_obj, dtype=float)
-            lc_time = expmjd - params['t0'].astype(float)
+            lc_time = (expmjd - t0_arr)[:, None]
+            d_mag_out[use_this_lc] = self._calc_dmag_batch(lc_int_arr, lc_time,
+                                                           variability_cache)[:, 0]
         else:
-            mjd_is_number = False
             n_t = len(expmjd)
             d_mag_out = np.zeros((n_obj, n_t), dtype=float)
-            t0_float = params['t0'].astype(float)
-            lc_time = np.zeros(n_t*n_obj)
-            i_start = 0
-            for i_obj in range(n_obj):
-                lc_time[i_start:i_start+n_t] = expmjd - t0_float[i_obj]
-                i_start += n_t
+            lc_time = np.asarray(expmjd, dtype=float)[None, :] - t0_arr[:, None]
+            d_mag_out[use_this_lc] = self._calc_dmag_batch(lc_int_arr, lc_time,
+                                                           variability_cache)
 
-        # print('initialized arrays in %e' % (time.time()-t_start))
-        # t_assign = 0.0
-        # t_flux = 0.0
-        t_use_this = 0.0
+        self._total_t_param_lc += time.time()-t_start
 
-        not_none = 0
+        return d_mag_out
 
-        for lc_int in unq_lc_int:
-            if lc_int is None:
-                continue
-            if '_PARAMETRIZED_LC_DMAG_CUTOFF' in variability_cache:
-                if variability_cache['_PARAMETRIZED_LC_DMAG_LOOKUP'][lc_int] < 0.75*variability_cache['_PARAMETRIZED_LC_DMAG_CUTOFF']:
-                    continue
-            # t_before = time.time()
-            if mjd_is_number:
-                use_this_lc = np.where(lc_int_arr == lc_int)[0]
-                not_none += len(use_this_lc)
-            else:
-                use_this_lc_unq = np.where(lc_int_arr == lc_int)[0]
-                not_none += len(use_this_lc_unq)
-                template_arange = np.arange(0, n_t, dtype=int)
-                use_this_lc = np.array([template_arange + i_lc*n_t
-                                        for i_lc in use_this_lc_unq]).flatten()
+    @register_method('kplr')  # this 'kplr' tag derives from the fact that default light curves come from Kepler
+    def applyParametrizedLightCurve(self, valid_dexes, params, expmjd,
+                                    variability_cache=None, d_mag_out=None,
+                                    bands=None):
+        """
+        The parametrized light curves do not change colors, so (unless
+        d_mag_out is given) this returns a read-only view repeating
+        the output of singleBandParametrizedLightCurve for every band.
 
-            # t_use_this += time.time()-t_before
-            try:
-                assert len(use_this_lc) % n_t == 0
-            except AssertionError:
-                raise RuntimeError("Something went wrong in applyParametrizedLightCurve\n"
-                                   "len(use_this_lc) %d ; n_t %d" % (len(use_this_lc), n_t))
+        d_mag_out is an optional array (shaped like the output of this
+        method) into which to write the delta magnitudes of the objects
+        in valid_dexes; all of its other entries are left alone.
 
-            # t_before = time.time()
-            q_flux, d_flux = self._calc_dflux(lc_int, lc_time[use_this_lc],
-                                              variability_cache=variability_cache)
+        bands is an optional string of the LSST bands to calculate
+        (default 'ugrizy')
+        """
 
-            d_mag = -2.5*np.log10(1.0+d_flux/q_flux)
-            # t_flux += time.time()-t_before
+        if len(params) == 0:
+            return np.array([[], [], [], [], [], []])
 
-            if isinstance(d_mag, numbers.Number) and not isinstance(expmjd, numbers.Number):
-                # in case you only passed in one expmjd value,
-                # in which case self._calc_dflux will return a scalar
-                d_mag = np.array([d_mag])
+        d_mag = self.singleBandParametrizedLightCurve(valid_dexes, params, expmjd,
+                                                      variability_cache=variability_cache)
 
-            # t_before = time.time()
-            if mjd_is_number:
-                d_mag_out[use_this_lc] = d_mag
-            else:
-                for i_obj in range(len(use_this_lc)//n_t):
-                    i_start = i_obj*n_t
-                    obj_dex = use_this_lc_unq[i_obj]
-                    d_mag_out[obj_dex] = d_mag[i_start:i_start+n_t]
+        if d_mag_out is not None:
+            # every band gets the same delta magnitudes
+            d_mag_out[:, valid_dexes[0]] = d_mag[valid_dexes[0]]
+            return d_mag_out
 
-            # t_assign += time.time()-t_before
+        n_bands = 6
+        if bands is not None:
+            n_bands = len(bands)
 
-        # print('applyParametrized took %.2e\nassignment %.2e\nflux %.2e\nuse %.2e\n' %
-        # (time.time()-t_start,t_assign,t_flux,t_use_this))
+        return np.broadcast_to(d_mag, (n_bands,)+d_mag.shape)
 
-        # print('applying Parametrized LC to %d' % not_none)
-        # print('per capita %.2e\n' % ((time.time()-t_start)/float(not_none)))
+    @register_max_dmag('kplr')
+    def maxDmagParametrizedLightCurve(self, valid_dexes, params,
+                                      variability_cache=None):
+        """
+        Bound |delta magnitude| of the parametrized light curves.
+
+        No light curve's flux can depart from its quiescent flux by more
+        than the sum of the amplitudes of its Fourier components.  If
+        the variability_cache contains a look up table of the largest
+        |delta magnitude| of each light curve (see
+        load_parametrized_light_curves), the bound is tightened with it
+        (allowing the same margin singleBandParametrizedLightCurve does).
+        """
+        if len(params) == 0:
+            return np.zeros(0)
 
-        # print('param time %.2e use this %.2e' % (time.time()-t_start, t_use_this))
-        self._total_t_param_lc += time.time()-t_start
+        if variability_cache is None:
+            global _GLOBAL_VARIABILITY_CACHE
+            variability_cache = _GLOBAL_VARIABILITY_CACHE
 
-        return d_mag_out
+        max_dmag = np.zeros(self.num_variable_obj(params), dtype=float)
 
-    @register_method('kplr')  # this 'kplr' tag derives from the fact that default light curves come from Kepler
-    def applyParametrizedLightCurve(self, valid_dexes, params, expmjd,
-                                    variability_cache=None):
+        lc_arr = np.asarray(params['lc'])
+        if lc_arr.dtype == object:
+            has_lc = np.not_equal(lc_arr, None)
+        else:
+            has_lc = np.ones(len(lc_arr), dtype=bool)
 
-        if len(params) == 0:
-            return np.array([[], [], [], [], [], []])
+        if not has_lc.any():
+            return max_dmag
 
-        n_obj = self.num_variable_obj(params)
-        if isinstance(expmjd, numbers.Number):
-            mjd_is_number = True
-            d_mag_out = np.zeros((6, n_obj), dtype=float)
-        else:
-            mjd_is_number = False
-            n_t = len(expmjd)
-            d_mag_out = np.zeros((6, n_obj, n_t), dtype=float)
+        unq_lc_int, unq_dex = np.unique(lc_arr[has_lc].astype(int), return_inverse=True)
+        (quiescent_flux, n_components,
+         omega, cos_coeff, sin_coeff) = self._get_parametrized_lc_matrix(unq_lc_int,
+                                                                          variability_cache)
 
-        d_mag = self.singleBandParametrizedLightCurve(valid_dexes, params, expmjd,
-                                                      variability_cache=variability_cache)
+        amplitude = np.sqrt(cos_coeff**2 + sin_coeff**2).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            lc_max = -2.5*np.log10(1.0-amplitude/quiescent_flux)
+        lc_max = np.where(np.logical_and(quiescent_flux > 0.0,
+                                         amplitude < quiescent_flux),
+                          lc_max, np.inf)
 
-        for i_filter in range(6):
-            d_mag_out[i_filter] = np.copy(d_mag)
+        if '_PARAMETRIZED_LC_DMAG_LOOKUP' in variability_cache:
+            dmag_lookup = variability_cache['_PARAMETRIZED_LC_DMAG_LOOKUP']
+            lookup_max = np.array([dmag_lookup[lc_int] for lc_int in unq_lc_int.tolist()],
+                                  dtype=float)/_MAX_DMAG_SAFETY_FACTOR
+            lc_max = np.minimum(lc_max, lookup_max)
 
-        return d_mag_out
+        max_dmag[has_lc] = lc_max[unq_dex]
+        return max_dmag
 
 
 class ExtraGalacticVariabilityModels(Variability):
@@ -1342,38 +3746,51 @@ class ExtraGalacticVariabilityModels(Variability):
 
     _agn_walk_start_date = 58580.0
     _agn_threads = 1
+    _agn_sparse_walk = False  # if True, sample the walk only near the dates (see _simulate_agn_sparse)
 
     @register_method('applyAgn')
     def applyAgn(self, valid_dexes, params, expmjd,
-                 variability_cache=None, redshift=None):
+                 variability_cache=None, redshift=None, d_mag_out=None,
+                 bands=None):
+        """
+        d_mag_out is an optional array (shaped like the output of this
+        method) into which to write the delta magnitudes of the objects
+        in valid_dexes; all of its other entries are left alone.
+
+        bands is an optional string of the LSST bands to calculate
+        (default 'ugrizy')
+        """
 
         if redshift is None:
-            redshift_arr = self.column_by_name('redshift')
+            redshift_arr = self._variability_column('redshift')
         else:
             redshift_arr = redshift
 
         if len(params) == 0:
             return np.array([[],[],[],[],[],[]])
 
+        if bands is None:
+            bands = 'ugrizy'
+
         if isinstance(expmjd, numbers.Number):
-            dMags = np.zeros((6, self.num_variable_obj(params)))
+            dMags_shape = (len(bands), self.num_variable_obj(params))
             max_mjd = expmjd
             min_mjd = expmjd
             mjd_is_number = True
         else:
-            dMags = np.zeros((6, self.num_variable_obj(params), len(expmjd)))
+            dMags_shape = (len(bands), self.num_variable_obj(params), len(expmjd))
             max_mjd = max(expmjd)
             min_mjd = min(expmjd)
             mjd_is_number = False
 
+        if d_mag_out is not None:
+            dMags = d_mag_out
+        else:
+            dMags = np.zeros(dMags_shape)
+
         seed_arr = params['seed']
         tau_arr = params['agn_tau'].astype(float)
         sfu_arr = params['agn_sfu'].astype(float)
-        sfg_arr = params['agn_sfg'].astype(float)
-        sfr_arr = params['agn_sfr'].astype(float)
-        sfi_arr = params['agn_sfi'].astype(float)
-        sfz_arr = params['agn_sfz'].astype(float)
-        sfy_arr = params['agn_sfy'].astype(float)
 
         duration_observer_frame = max_mjd - self._agn_walk_start_date
 
@@ -1383,101 +3800,198 @@ class ExtraGalacticVariabilityModels(Variability):
                                "expmjd: %e should be > start_date: %e  " % (min_mjd, self._agn_walk_start_date) +
                                "in applyAgn variability method")
 
-        if self._agn_threads == 1 or len(valid_dexes[0])==1:
-            for i_obj in valid_dexes[0]:
-                seed = seed_arr[i_obj]
-                tau = tau_arr[i_obj]
-                time_dilation = 1.0+redshift_arr[i_obj]
-                sf_u = sfu_arr[i_obj]
-                dMags[0][i_obj] = self._simulate_agn(expmjd, tau, time_dilation, sf_u, seed)
+        obj_dexes = np.array(valid_dexes[0], dtype=int)
+
+        # the random walk is simulated in the u band;
+        # the other bands are scaled from it
+        if self._agn_sparse_walk:
+            d_mag_u = _simulate_agn_sparse(expmjd, self._agn_walk_start_date,
+                                           tau_arr[obj_dexes],
+                                           1.0+redshift_arr[obj_dexes],
+                                           sfu_arr[obj_dexes],
+                                           seed_arr[obj_dexes],
+                                           rng=self.variability_rng)
+        elif self._agn_threads == 1 or len(valid_dexes[0])==1:
+            d_mag_u = _simulate_agn_batch(expmjd, self._agn_walk_start_date,
+                                          tau_arr[obj_dexes],
+                                          1.0+redshift_arr[obj_dexes],
+                                          sfu_arr[obj_dexes],
+                                          seed_arr[obj_dexes],
+                                          rng=self.variability_rng)
         else:
-            p_list = []
+            d_mag_u = self._pooled_simulate_agn(expmjd,
+                                                tau_arr[obj_dexes],
+                                                1.0+redshift_arr[obj_dexes],
+                                                sfu_arr[obj_dexes],
+                                                seed_arr[obj_dexes])
+
+        for i_filter, bp in enumerate(bands):
+            if bp == 'u':
+                dMags[i_filter][obj_dexes] = d_mag_u
+                continue
 
-            mgr = multiprocessing.Manager()
+            sf_arr = params['agn_sf%s' % bp].astype(float)
             if mjd_is_number:
-                out_struct = mgr.Array('d', [0]*len(valid_dexes[0]))
+                dMags[i_filter][obj_dexes] = d_mag_u*sf_arr[obj_dexes]/sfu_arr[obj_dexes]
             else:
-                out_struct = mgr.dict()
-
-            #################
-            # Try to subdivide the AGN into batches such that the number
-            # of time steps simulated by each thread is close to equal
-            tot_steps = 0
-            n_steps = []
-            for tt, zz in zip(tau_arr[valid_dexes], redshift_arr[valid_dexes]):
-                dilation = 1.0+zz
-                dt = tt/100.0
-                dur = (duration_observer_frame/dilation)
-                nt = dur/dt
-                tot_steps += nt
-                n_steps.append(nt)
-
-            batch_target = tot_steps/self._agn_threads
-            i_start_arr = [0]
-            i_end_arr = []
-            current_batch = n_steps[0]
-            for ii in range(1,len(n_steps),1):
-                current_batch += n_steps[ii]
-                if ii == len(n_steps)-1:
-                    i_end_arr.append(len(n_steps))
-                elif len(i_start_arr)<self._agn_threads:
-                    if current_batch>=batch_target:
-                        i_end_arr.append(ii)
-                        i_start_arr.append(ii)
-                        current_batch = n_steps[ii]
-
-            if len(i_start_arr) != len(i_end_arr):
-                raise RuntimeError('len i_start %d len i_end %d; dexes %d' %
-                                   (len(i_start_arr),
-                                    len(i_end_arr),
-                                    len(valid_dexes[0])))
-            assert len(i_start_arr) <= self._agn_threads
-            ############
-
-            # Actually simulate the AGN on the the number of threads allotted
-            for i_start, i_end in zip(i_start_arr, i_end_arr):
-                dexes = valid_dexes[0][i_start:i_end]
-                if mjd_is_number:
-                    out_dexes = range(i_start,i_end,1)
-                else:
-                    out_dexes = dexes
-                p = multiprocessing.Process(target=self._threaded_simulate_agn,
-                                            args=(expmjd, tau_arr[dexes],
-                                                  1.0+redshift_arr[dexes],
-                                                  sfu_arr[dexes],
-                                                  seed_arr[dexes],
-                                                  out_dexes,
-                                                  out_struct))
-                p.start()
-                p_list.append(p)
-            for p in p_list:
-                p.join()
+                dMags[i_filter][obj_dexes] = (d_mag_u*sf_arr[obj_dexes][:, None] /
+                                              sfu_arr[obj_dexes][:, None])
 
-            if mjd_is_number:
-                dMags[0][valid_dexes] = out_struct[:]
-            else:
-                for i_obj in out_struct.keys():
-                    dMags[0][i_obj] = out_struct[i_obj]
+        return dMags
+
+    @register_max_dmag('applyAgn')
+    def maxDmagAgn(self, valid_dexes, params, variability_cache=None):
+        """
+        The AGN random walk is unbounded, so this bound is statistical:
+        it is _AGN_MAX_DMAG_SIGMA times the standard deviation of the
+        stationary random walk (the walk starts at zero, so its variance
+        is never larger than that) in the band with the largest
+        structure function.
+        """
+        if len(params) == 0:
+            return np.zeros(0)
 
-        for i_filter, filter_name in enumerate(('g', 'r', 'i', 'z', 'y')):
-            for i_obj in valid_dexes[0]:
-                dMags[i_filter+1][i_obj] = dMags[0][i_obj]*params['agn_sf%s' % filter_name][i_obj]/params['agn_sfu'][i_obj]
+        max_dmag = np.zeros(self.num_variable_obj(params), dtype=float)
 
-        return dMags
+        # applyAgn takes time steps of tau/100, so each step is
+        # dx -> (1-dt/tau)*dx + sf*sqrt(dt/tau)*N(0, 1)
+        dt_over_tau = 0.01
+        sigma_per_sf = np.sqrt(dt_over_tau/(1.0-(1.0-dt_over_tau)**2))
 
-    def _threaded_simulate_agn(self, expmjd, tau_arr,
-                               time_dilation_arr, sf_u_arr,
-                               seed_arr, dex_arr, out_struct):
+        max_sf = np.zeros(len(valid_dexes[0]), dtype=float)
+        for sf_name in ('agn_sfu', 'agn_sfg', 'agn_sfr', 'agn_sfi', 'agn_sfz', 'agn_sfy'):
+            max_sf = np.maximum(max_sf, np.abs(params[sf_name].astype(float)[valid_dexes]))
 
-        if isinstance(expmjd, numbers.Number):
-            mjd_is_number = True
+        max_dmag[valid_dexes] = _AGN_MAX_DMAG_SIGMA*sigma_per_sf*max_sf
+        return max_dmag
+
+    def _get_agn_pool(self):
+        """
+        Return the pool of worker processes used to simulate AGN when
+        self._agn_threads > 1.  The pool is created the first time it
+        is needed and persists for the lifetime of this object (or
+        until close_agn_pool() is called).
+
+        The workers share their output through multiprocessing.shared_memory,
+        which requires python 3.8 or later; it is only imported here so that
+        this module can still be used without a pool on older versions.
+        """
+        try:
+            from multiprocessing import shared_memory  # noqa: F401
+        except ImportError:
+            raise RuntimeError('_agn_threads > 1 requires python 3.8 or later '
+                               '(multiprocessing.shared_memory)')
+
+        pool = getattr(self, '_agn_pool', None)
+        if pool is not None and self._agn_pool_size != self._agn_threads:
+            self.close_agn_pool()
+            pool = None
+
+        if pool is None:
+            pool = multiprocessing.Pool(processes=self._agn_threads)
+            self._agn_pool = pool
+            self._agn_pool_size = self._agn_threads
+            self._agn_pool_finalizer = weakref.finalize(self, pool.terminate)
+
+        return pool
+
+    def close_agn_pool(self):
+        """
+        Shut down the pool of worker processes used to simulate AGN
+        (if it exists).
+        """
+        if getattr(self, '_agn_pool', None) is not None:
+            self._agn_pool_finalizer()
+            self._agn_pool = None
+
+    def _pooled_simulate_agn(self, expmjd, tau_arr, time_dilation_arr,
+                             sf_u_arr, seed_arr):
+        """
+        Simulate the u-band light curves for a batch of AGN using
+        self._agn_threads worker processes.
+
+        The AGN are divided into tasks containing roughly equal numbers
+        of random walk time steps.  The tasks are put on the work queue
+        of a persistent multiprocessing.Pool, largest first, and each
+        worker writes its light curves directly into a shared memory
+        buffer.
+
+        Parameters
+        ----------
+        expmjd -- a number or numpy array of dates for the light curves
+
+        tau_arr -- the characteristic timescales of the AGN in days
+
+        time_dilation_arr -- (1+z) for the AGN
+
+        sf_u_arr -- the u-band structure functions of the AGN
+
+        seed_arr -- the seeds for the random number generators
+
+        Returns
+        -------
+        a numpy array of delta_magnitude in the u-band.  If expmjd is a number,
+        the array has shape (n_obj,); otherwise it has shape (n_obj, len(expmjd))
+        """
+        mjd_is_number = isinstance(expmjd, numbers.Number)
+        n_obj = len(tau_arr)
+        if mjd_is_number:
+            n_time = 1
+            max_mjd = expmjd
         else:
-            mjd_is_number = False
+            n_time = len(expmjd)
+            max_mjd = max(expmjd)
+
+        duration_observer_frame = max_mjd - self._agn_walk_start_date
+
+        # the number of time steps in each random walk
+        n_steps = (duration_observer_frame/time_dilation_arr)/(tau_arr/100.0)
+        obj_order = np.argsort(-1.0*n_steps, kind='mergesort')
+        task_target = n_steps.sum()/(4.0*self._agn_threads)
 
-        for tau, time_dilation, sf_u, seed, dex in \
-        zip(tau_arr, time_dilation_arr, sf_u_arr, seed_arr, dex_arr):
-            out_struct[dex] = self._simulate_agn(expmjd, tau, time_dilation,
-                                                 sf_u, seed)
+        pool = self._get_agn_pool()
+        from multiprocessing import shared_memory
+
+        shape = (n_obj, n_time)
+        shm = shared_memory.SharedMemory(create=True,
+                                         size=max(1, n_obj*n_time*np.dtype(float).itemsize))
+        try:
+            d_m_out = np.ndarray(shape, dtype=float, buffer=shm.buf)
+            d_m_out[:] = 0.0
+
+            task_list = []
+            i_start = 0
+            current_task = 0.0
+            for ii, i_obj in enumerate(obj_order):
+                current_task += n_steps[i_obj]
+                if current_task >= task_target or ii == n_obj-1:
+                    rows = obj_order[i_start:ii+1]
+                    task_list.append((shm.name, shape, expmjd,
+                                      self._agn_walk_start_date,
+                                      rows, tau_arr[rows],
+                                      time_dilation_arr[rows],
+                                      sf_u_arr[rows], seed_arr[rows],
+                                      self.variability_rng))
+                    i_start = ii+1
+                    current_task = 0.0
+
+            n_done = 0
+            for n_rows in pool.imap_unordered(_agn_pool_worker, task_list):
+                n_done += n_rows
+
+            if n_done != n_obj:
+                raise RuntimeError('AGN worker pool simulated %d objects; '
+                                   'should have simulated %d' % (n_done, n_obj))
+
+            output = np.array(d_m_out)
+            del d_m_out
+        finally:
+            shm.close()
+            shm.unlink()
+
+        if mjd_is_number:
+            return output[:, 0]
+        return output
 
     def _simulate_agn(self, expmjd, tau, time_dilation, sf_u, seed):
             """
@@ -1507,7 +4021,7 @@ class ExtraGalacticVariabilityModels(Variability):
                 duration_observer_frame = expmjd - self._agn_walk_start_date
 
 
-            rng = np.random.RandomState(seed)
+            rng = self.variability_rng.stream('agn', seed)
             dt = tau/100.
             duration_rest_frame = duration_observer_frame/time_dilation
             nbins = int(math.ceil(duration_rest_frame/dt))+1
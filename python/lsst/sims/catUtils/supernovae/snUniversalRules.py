@@ -1,6 +1,7 @@
 from __future__ import absolute_import
 from builtins import object
 import numpy as np
+from lsst.sims.catUtils.mixins.CounterRNG import CounterRNG
 
 __all__ = ['SNUniverse']
 
@@ -28,8 +29,13 @@ class SNUniverse(object):
     suppressDimSN : bool, if true drop observations of SN with peak at t0, if
         abs(mjdobs - t0) > self.maxTimeVisible
 
+    The SN parameters are drawn from the stream hostid of the
+    `lsst.sims.catUtils.mixins.CounterRNG` sn_rng.  Its default legacy mode
+    seeds a `np.random.RandomState` with each hostid, as in earlier versions.
     """
 
+    sn_rng = CounterRNG(legacy=True)
+
     @property
     def snFrequency(self):
         """
@@ -132,8 +138,14 @@ class SNUniverse(object):
         return vals
 
     def getSN_rng(self, hostid):
-        hostid = hostid % 4294967295
-        rng = np.random.RandomState(hostid)
+        """
+        Return the stream of self.sn_rng from which the parameters of
+        the SN in the host hostid are drawn (an object with the
+        sequential interface of np.random.RandomState)
+        """
+        if self.sn_rng.legacy:
+            hostid = hostid % 4294967295
+        rng = self.sn_rng.stream('sn', hostid)
         return rng
 
     def drawSNParams(self, hostid, hostmu):
@@ -9,6 +9,7 @@ from collections import OrderedDict
 from lsst.sims.catUtils.utils import ObservationMetaDataGenerator
 from lsst.sims.catUtils.mixins import PhotometryStars, VariabilityStars
 from lsst.sims.catUtils.mixins import PhotometryGalaxies, VariabilityGalaxies
+from lsst.sims.catUtils.mixins import VariabilityParamTable
 from lsst.sims.catalogs.definitions import InstanceCatalog
 from lsst.sims.catalogs.decorators import compound, cached
 from lsst.sims.utils import haversine
@@ -676,6 +677,9 @@ class FastLightCurveGenerator(LightCurveGenerator):
             if chunk is not None:
                 quiescent_mags = {}
                 d_mags = {}
+                # parse the variability parameters once for
+                # all of the bandpasses
+                varparam_table = None
                 # pre-calculate quiescent magnitudes
                 # and delta magnitude arrays
                 for bp in quiescent_obs_dict:
@@ -687,9 +691,15 @@ class FastLightCurveGenerator(LightCurveGenerator):
                     quiescent_mags[bp] = np.array(local_quiescent_mags)
                     if self.delta_name_mapper(bp) not in cat._actually_calculated_columns:
                         cat._actually_calculated_columns.append(self.delta_name_mapper(bp))
-                    varparamstr = cat.column_by_name('varParamStr')
-                    temp_d_mags = cat.applyVariability(varparamstr, mjd_arr_dict[bp])
-                    d_mags[bp] = temp_d_mags[{'u':0, 'g':1, 'r':2, 'i':3, 'z':4, 'y':5}[bp]].transpose()
+                    if varparam_table is None:
+                        varparam_table = VariabilityParamTable(cat.column_by_name('varParamStr'))
+                    # only calculate this bandpass' delta magnitudes,
+                    # one block of objects and times at a time
+                    d_mags[bp] = np.zeros((len(mjd_arr_dict[bp]), len(varparam_table)))
+                    for obj_slice, time_slice, d_mag_block in \
+                        cat.iter_variability(varparam_table, mjd_arr_dict[bp], bands=bp):
+
+                        d_mags[bp][time_slice, obj_slice] = d_mag_block[0].transpose()
 
                 for ix, obs in enumerate(grp):
                     bp = obs.bandpass
@@ -5,5 +5,6 @@ from .DBobjectTestUtils import *
 from .CatalogTestUtils import *
 from .LightCurveGenerator import *
 from .SNIaLightCurveGenerator import *
+from .alertDataBackends import *
 from .alertDataGenerator import *
 from .avroAlertGenerator import *
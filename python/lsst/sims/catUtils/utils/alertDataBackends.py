@@ -0,0 +1,668 @@
+"""
+This module defines the backends through which AlertDataGenerator
+writes (and AvroAlertGenerator reads) the alert data simulated
+for each trixel.  Each backend stores the same four tables
+(alert_data, metadata, quiescent_flux and baseline_astrometry;
+see the docstring of AlertDataGenerator):
+
+    SqliteAlertDataBackend -- the default; one sqlite file per trixel
+    named like prefix_NNNN_sqlite.db
+
+    ParquetAlertDataBackend -- one directory per trixel named like
+    prefix_NNNN_parquet containing a compressed Parquet file per table.
+    The alert_data table is sorted on obshistId, so that the alerts
+    of one pointing can be read from a few row groups, rather than
+    by scanning the whole file.  This backend requires pyarrow.
+"""
+
+import os
+import glob
+import json
+import itertools
+import sqlite3
+import numpy as np
+
+from lsst.sims.catalogs.db import DBObject
+
+_pyarrow_is_installed = True
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.parquet
+except ImportError:
+    _pyarrow_is_installed = False
+    pass
+
+__all__ = ["AlertDataBackend", "SqliteAlertDataBackend",
+           "ParquetAlertDataBackend"]
+
+
+# the columns of the output tables and their types
+_ALERT_DATA_COLUMNS = (('uniqueId', np.int64), ('obshistId', np.int64),
+                       ('xPix', float), ('yPix', float), ('chipNum', np.int64),
+                       ('dflux', float), ('snr', float), ('ra', float), ('dec', float))
+
+_METADATA_COLUMNS = (('obshistId', np.int64), ('TAI', float), ('band', np.int64))
+
+_QUIESCENT_FLUX_COLUMNS = (('uniqueId', np.int64), ('band', np.int64),
+                           ('flux', float), ('snr', float))
+
+_BASELINE_ASTROMETRY_COLUMNS = (('uniqueId', np.int64), ('ra', float), ('dec', float),
+                                ('pmRA', float), ('pmDec', float), ('parallax', float),
+                                ('TAI', float))
+
+# the dtypes of the arrays returned by read_diasources and read_diaobjects
+DIASOURCE_DTYPE = np.dtype([('uniqueId', int), ('xPix', float), ('yPix', float),
+                            ('chipNum', int), ('dflux', float), ('tot_snr', float),
+                            ('ra', float), ('dec', float), ('band', int), ('TAI', float),
+                            ('quiescent_flux', float), ('quiescent_snr', float)])
+
+DIAOBJECT_DTYPE = np.dtype([('uniqueId', int), ('ra', float), ('dec', float),
+                            ('TAI', float), ('pmRA', float), ('pmDec', float),
+                            ('parallax', float)])
+
+
+def _insert_columns(cursor, table_name, column_list):
+    """
+    Insert rows into an sqlite table with a single executemany() call,
+    taking the data one column at a time.
+
+    Parameters
+    ----------
+    cursor is a cursor on the (already open) sqlite connection
+
+    table_name is the name of the table into which to insert
+
+    column_list is a list of the columns to insert, in the order of
+    the table's columns.  Each column is either a numpy array (already
+    converted to the type and units of the table's column) or a single
+    value to be repeated in every row.
+
+    Returns
+    -------
+    The number of rows inserted
+    """
+    n_rows = None
+    value_list = []
+    for column in column_list:
+        if isinstance(column, np.ndarray):
+            if n_rows is None:
+                n_rows = len(column)
+            elif len(column) != n_rows:
+                raise RuntimeError('Cannot insert columns of lengths %d and %d '
+                                   'into %s' % (n_rows, len(column), table_name))
+            # tolist() converts to python types all at once
+            value_list.append(column.tolist())
+        else:
+            if isinstance(column, np.generic):
+                # sqlite would store numpy scalars as blobs
+                column = column.item()
+            value_list.append(itertools.repeat(column))
+
+    if n_rows is None:
+        raise RuntimeError('Cannot insert only scalars into %s' % table_name)
+    if n_rows == 0:
+        return 0
+
+    cmd = 'INSERT INTO %s VALUES (%s)' % (table_name, ','.join(['?']*len(column_list)))
+    cursor.executemany(cmd, zip(*value_list))
+    return n_rows
+
+
+def _as_columns(table_name, column_def, column_dict):
+    """
+    Return a list of the columns in column_dict, in the order of
+    column_def (a tuple of (name, type) pairs), cast to their types.
+    Scalars are left alone (to be repeated in every row).
+    """
+    column_list = []
+    for name, dtype in column_def:
+        if name not in column_dict:
+            raise RuntimeError('No column %s for %s' % (name, table_name))
+        column = column_dict[name]
+        if isinstance(column, np.ndarray) or isinstance(column, (list, tuple)):
+            column = np.asarray(column).astype(dtype)
+        column_list.append(column)
+    return column_list
+
+
+class AlertDataBackend(object):
+    """
+    The base class for the backends that store the alert data of one
+    trixel.  AlertDataGenerator.alert_data_from_htmid writes through a
+    backend as a context manager:
+
+        with backend_class(output_dir, output_prefix, htmid) as backend:
+            backend.write_metadata(...)
+            backend.write_alert_data(...)
+            ...
+
+    The output is finalized (indexed, sorted, etc.) when the context
+    exits without an exception.  AvroAlertGenerator reads the output
+    of a trixel with read_diasources and read_diaobjects.
+
+    Rows written to the output are only committed when checkpoint() is
+    called (or the output is finalized).  checkpoint() stores a progress
+    journal (a dict of JSON-serializable values) together with the rows,
+    so that, if the process dies, the output holds exactly the rows
+    written before the last checkpoint and the journal describing them.
+    Such an output can be reopened with resume=True to continue writing.
+
+    The write methods all accept a dict mapping column names to numpy
+    arrays (already in the units of the table; see the docstring of
+    AlertDataGenerator).  A column can also be a single value that is
+    repeated in every row.
+    """
+
+    def __init__(self, data_dir, prefix, htmid, resume=False):
+        """
+        Parameters
+        ----------
+        data_dir is the directory containing the output
+
+        prefix is the prefix of the output's name
+
+        htmid is the htmid of the trixel
+
+        resume is a boolean.  If True, open() reopens an existing output,
+        discarding anything written after its last checkpoint, rather than
+        creating a new one.
+        """
+        self.data_dir = data_dir
+        self.prefix = prefix
+        self.htmid = htmid
+        self.resume = resume
+
+    @property
+    def file_name(self):
+        """
+        The name of the file (or directory) holding the output
+        """
+        raise NotImplementedError
+
+    def exists(self):
+        """
+        Does the output of this trixel exist?
+        """
+        return os.path.exists(self.file_name)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(finalize=exc_type is None)
+        return False
+
+    def open(self):
+        """
+        Create the (empty) tables of the output (or, if self.resume,
+        reopen the existing output)
+        """
+        raise NotImplementedError
+
+    def close(self, finalize=True):
+        """
+        Close the output.  If finalize is True, commit everything written,
+        index (or sort, etc.) the tables so that they can be read and mark
+        the journal (if any) as complete.  Otherwise, discard everything
+        written since the last checkpoint.
+        """
+        raise NotImplementedError
+
+    def checkpoint(self, journal):
+        """
+        Commit everything written so far, together with the dict journal
+        """
+        raise NotImplementedError
+
+    def read_journal(self):
+        """
+        Return the journal stored by the last checkpoint (with the key
+        'complete' set to True if the output was finalized), or None if
+        the output does not exist or has no journal.
+        """
+        raise NotImplementedError
+
+    def write_metadata(self, columns):
+        """
+        Write rows to the metadata table (obshistId, TAI, band)
+        """
+        raise NotImplementedError
+
+    def write_alert_data(self, columns):
+        """
+        Write rows to the alert_data table (uniqueId, obshistId, xPix,
+        yPix, chipNum, dflux, snr, ra, dec).  Returns the number of
+        rows written.
+        """
+        raise NotImplementedError
+
+    def write_quiescent_flux(self, columns):
+        """
+        Write rows to the quiescent_flux table (uniqueId, band, flux, snr)
+        """
+        raise NotImplementedError
+
+    def write_baseline_astrometry(self, columns):
+        """
+        Write rows to the baseline_astrometry table (uniqueId, ra, dec,
+        pmRA, pmDec, parallax, TAI)
+        """
+        raise NotImplementedError
+
+    def read_diasources(self, obshistid):
+        """
+        Return a numpy array of dtype DIASOURCE_DTYPE containing the
+        alert_data rows of the pointing obshistid, joined with the band
+        and TAI of the pointing and the quiescent flux and snr of the
+        source in that band, sorted on uniqueId.
+        """
+        raise NotImplementedError
+
+    def read_diaobjects(self):
+        """
+        Return a numpy array of dtype DIAOBJECT_DTYPE containing the
+        baseline_astrometry table
+        """
+        raise NotImplementedError
+
+
+class SqliteAlertDataBackend(AlertDataBackend):
+    """
+    Store the alert data of a trixel in an sqlite file
+    named like prefix_NNNN_sqlite.db
+
+    The progress journal is stored as JSON in the table progress,
+    which is updated in the same transaction as the rows it describes.
+    """
+
+    @property
+    def file_name(self):
+        return os.path.join(self.data_dir, '%s_%d_sqlite.db' % (self.prefix, self.htmid))
+
+    def open(self):
+        self._journal = None
+        if self.resume:
+            if not self.exists():
+                raise RuntimeError('Cannot resume %s; it does not exist' % self.file_name)
+            self._journal = self.read_journal()
+            # anything written after the last checkpoint was never
+            # committed, so sqlite has already discarded it
+            self._conn = sqlite3.connect(self.file_name, isolation_level='EXCLUSIVE')
+            return
+
+        if self.exists():
+            raise RuntimeError('%s already exists' % self.file_name)
+        self._conn = sqlite3.connect(self.file_name, isolation_level='EXCLUSIVE')
+        cursor = self._conn.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL;')
+        self._conn.commit()
+
+        cursor.execute('''CREATE TABLE alert_data
+                       (uniqueId int, obshistId int, xPix float, yPix float,
+                        chipNum int, dflux float, snr float, ra float, dec float)''')
+
+        cursor.execute('''CREATE TABLE metadata
+                       (obshistId int, TAI float, band int)''')
+
+        cursor.execute('''CREATE TABLE quiescent_flux
+                       (uniqueId int, band int, flux float, snr float)''')
+
+        cursor.execute('''CREATE TABLE baseline_astrometry
+                       (uniqueId int, ra real, dec real, pmRA real,
+                        pmDec real, parallax real, TAI real)''')
+
+        cursor.execute('CREATE TABLE progress (journal text)')
+        self._conn.commit()
+
+    def close(self, finalize=True):
+        if finalize:
+            cursor = self._conn.cursor()
+            # a resumed output may already have been finalized once
+            cursor.execute('CREATE INDEX IF NOT EXISTS unq_obs ON alert_data (uniqueId, obshistId)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS unq_flux ON quiescent_flux (uniqueId, band)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS obs ON metadata (obshistid)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS unq_ast ON baseline_astrometry (uniqueId)')
+            if self._journal is not None:
+                self._journal['complete'] = True
+                self._write_journal(self._journal)
+            self._conn.commit()
+        else:
+            self._conn.rollback()
+        self._conn.close()
+        self._conn = None
+
+    def _write_journal(self, journal):
+        cursor = self._conn.cursor()
+        cursor.execute('DELETE FROM progress')
+        cursor.execute('INSERT INTO progress VALUES (?)', (json.dumps(journal, sort_keys=True),))
+
+    def checkpoint(self, journal):
+        self._journal = dict(journal)
+        self._journal['complete'] = False
+        self._write_journal(self._journal)
+        self._conn.commit()
+
+    def read_journal(self):
+        if not self.exists():
+            return None
+        with sqlite3.connect(self.file_name) as conn:
+            has_progress = conn.execute("SELECT name FROM sqlite_master WHERE "
+                                        "type='table' AND name='progress'").fetchall()
+            if len(has_progress) == 0:
+                return None
+            rows = conn.execute('SELECT journal FROM progress').fetchall()
+        if len(rows) == 0:
+            return None
+        return json.loads(rows[0][0])
+
+    def write_metadata(self, columns):
+        obshistid, tai, band = _as_columns('metadata', _METADATA_COLUMNS, columns)
+        cursor = self._conn.cursor()
+        for i_row in range(len(obshistid)):
+            cmd = '''INSERT INTO metadata
+                  VALUES(%d, %.5f, %d)''' % (obshistid[i_row], tai[i_row], band[i_row])
+            cursor.execute(cmd)
+
+    def write_alert_data(self, columns):
+        return _insert_columns(self._conn.cursor(), 'alert_data',
+                               _as_columns('alert_data', _ALERT_DATA_COLUMNS, columns))
+
+    def write_quiescent_flux(self, columns):
+        _insert_columns(self._conn.cursor(), 'quiescent_flux',
+                        _as_columns('quiescent_flux', _QUIESCENT_FLUX_COLUMNS, columns))
+
+    def write_baseline_astrometry(self, columns):
+        _insert_columns(self._conn.cursor(), 'baseline_astrometry',
+                        _as_columns('baseline_astrometry', _BASELINE_ASTROMETRY_COLUMNS, columns))
+
+    def read_diasources(self, obshistid):
+        query = 'SELECT alert.uniqueId, alert.xPix, alert.yPix, '
+        query += 'alert.chipNum, alert.dflux, alert.snr, alert.ra, alert.dec, '
+        query += 'meta.band, meta.TAI, quiescent.flux, quiescent.snr '
+        query += 'FROM alert_data as alert '
+        query += 'INNER JOIN metadata AS meta ON alert.obshistId=meta.obshistId '
+        query += 'INNER JOIN quiescent_flux AS quiescent ON quiescent.uniqueId=alert.uniqueID '
+        query += 'AND quiescent.band=meta.band '
+        query += 'WHERE alert.obshistId=%d ' % obshistid
+        query += 'ORDER BY alert.uniqueId'
+
+        db_obj = DBObject(self.file_name, driver='sqlite')
+        return db_obj.execute_arbitrary(query, dtype=DIASOURCE_DTYPE)
+
+    def read_diaobjects(self):
+        query = 'SELECT uniqueId, ra, dec, TAI, pmRA, pmDec, parallax '
+        query += 'FROM baseline_astrometry'
+
+        db_obj = DBObject(self.file_name, driver='sqlite')
+        return db_obj.execute_arbitrary(query, dtype=DIAOBJECT_DTYPE)
+
+
+class ParquetAlertDataBackend(AlertDataBackend):
+    """
+    Store the alert data of a trixel in a directory named like
+    prefix_NNNN_parquet containing the files alert_data.parquet,
+    metadata.parquet, quiescent_flux.parquet and
+    baseline_astrometry.parquet.
+
+    While the trixel is simulated, the rows written between two
+    checkpoints go to a new set of part files (named like
+    alert_data_part_NNNN.parquet) and journal.json records the journal
+    and the number of committed parts.  Each write to quiescent_flux
+    and baseline_astrometry (i.e. each chunk of astrophysical objects)
+    becomes one row group.  When the output is finalized, the parts of
+    each table are concatenated; the alert data are also sorted on
+    (obshistId, uniqueId) and rewritten in row groups of
+    alert_row_group_size rows, so that read_diasources can use the
+    row groups' statistics to read only the rows of one pointing.
+
+    The class attributes compression and alert_row_group_size can
+    be overridden in subclasses.
+    """
+
+    # the Parquet compression codec
+    compression = 'zstd'
+
+    # the number of rows in each row group of the sorted alert_data table
+    alert_row_group_size = 2**16
+
+    _tables = (('metadata', _METADATA_COLUMNS),
+               ('alert_data', _ALERT_DATA_COLUMNS),
+               ('quiescent_flux', _QUIESCENT_FLUX_COLUMNS),
+               ('baseline_astrometry', _BASELINE_ASTROMETRY_COLUMNS))
+
+    def __init__(self, data_dir, prefix, htmid, resume=False):
+        if not _pyarrow_is_installed:
+            raise RuntimeError('ParquetAlertDataBackend requires pyarrow')
+        super(ParquetAlertDataBackend, self).__init__(data_dir, prefix, htmid,
+                                                      resume=resume)
+        self._writers = {}
+        self._n_parts = 0
+        self._journal = None
+
+    @property
+    def file_name(self):
+        return os.path.join(self.data_dir, '%s_%d_parquet' % (self.prefix, self.htmid))
+
+    def _table_name(self, table):
+        return os.path.join(self.file_name, '%s.parquet' % table)
+
+    def _part_name(self, table, i_part):
+        return os.path.join(self.file_name, '%s_part_%04d.parquet' % (table, i_part))
+
+    @property
+    def _journal_name(self):
+        return os.path.join(self.file_name, 'journal.json')
+
+    def _schema(self, column_def):
+        arrow_type = {np.int64: pyarrow.int64(), float: pyarrow.float64()}
+        return pyarrow.schema([(name, arrow_type[dtype]) for name, dtype in column_def])
+
+    def _read_journal_file(self):
+        """
+        Return the journal and the number of committed parts
+        """
+        if not os.path.exists(self._journal_name):
+            return None, 0
+        with open(self._journal_name, 'r') as in_file:
+            contents = json.load(in_file)
+        return contents['journal'], contents['n_parts']
+
+    def _write_journal_file(self):
+        # write a new file and rename it, so that the
+        # journal is replaced in one step
+        tmp_name = self._journal_name + '.tmp'
+        with open(tmp_name, 'w') as out_file:
+            json.dump({'journal': self._journal, 'n_parts': self._n_parts},
+                      out_file, sort_keys=True)
+        os.replace(tmp_name, self._journal_name)
+
+    def open(self):
+        self._writers = {}
+        if self.resume:
+            if not self.exists():
+                raise RuntimeError('Cannot resume %s; it does not exist' % self.file_name)
+            self._journal, self._n_parts = self._read_journal_file()
+
+            # discard the parts written after the last checkpoint
+            for part_name in glob.glob(os.path.join(self.file_name, '*_part_*.parquet')):
+                i_part = int(part_name.split('_part_')[-1].replace('.parquet', ''))
+                if i_part >= self._n_parts:
+                    os.unlink(part_name)
+            return
+
+        if os.path.exists(self.file_name):
+            raise RuntimeError('%s already exists' % self.file_name)
+        os.mkdir(self.file_name)
+
+    def _close_part(self):
+        """
+        Close the part files currently being written
+        """
+        if len(self._writers) == 0:
+            return
+        for table in self._writers:
+            self._writers[table].close()
+        self._writers = {}
+        self._n_parts += 1
+
+    def checkpoint(self, journal):
+        self._close_part()
+        self._journal = dict(journal)
+        self._journal['complete'] = False
+        self._write_journal_file()
+
+    def read_journal(self):
+        if not self.exists():
+            return None
+        return self._read_journal_file()[0]
+
+    def close(self, finalize=True):
+        if not finalize:
+            # the parts written since the last checkpoint
+            # will be discarded if the output is resumed
+            for table in self._writers:
+                self._writers[table].close()
+            self._writers = {}
+            return
+
+        self._close_part()
+        part_dict = {}
+        for table, column_def in self._tables:
+            part_dict[table] = [self._part_name(table, i_part) for i_part in range(self._n_parts)
+                                if os.path.exists(self._part_name(table, i_part))]
+            schema = self._schema(column_def)
+
+            if table == 'alert_data':
+                # sort the alert data so that each pointing occupies
+                # a contiguous set of row groups
+                if len(part_dict[table]) > 0:
+                    alert_data = pyarrow.concat_tables([pyarrow.parquet.read_table(part_name)
+                                                        for part_name in part_dict[table]])
+                else:
+                    alert_data = schema.empty_table()
+                sorted_dex = np.lexsort((alert_data.column('uniqueId').to_numpy(),
+                                         alert_data.column('obshistId').to_numpy()))
+                pyarrow.parquet.write_table(alert_data.take(pyarrow.array(sorted_dex)),
+                                            self._table_name(table),
+                                            row_group_size=self.alert_row_group_size,
+                                            compression=self.compression)
+                continue
+
+            with pyarrow.parquet.ParquetWriter(self._table_name(table), schema,
+                                               compression=self.compression) as writer:
+                for part_name in part_dict[table]:
+                    part_file = pyarrow.parquet.ParquetFile(part_name)
+                    for i_group in range(part_file.num_row_groups):
+                        writer.write_table(part_file.read_row_group(i_group))
+
+        if self._journal is not None:
+            self._journal['complete'] = True
+            self._write_journal_file()
+
+        for table in part_dict:
+            for part_name in part_dict[table]:
+                os.unlink(part_name)
+
+    def _write(self, table, columns):
+        """
+        Write one row group to table; return the number of rows
+        """
+        column_def = dict(self._tables)[table]
+        column_list = _as_columns(table, column_def, columns)
+        n_rows = None
+        for column in column_list:
+            if isinstance(column, np.ndarray):
+                n_rows = len(column)
+                break
+        if n_rows is None:
+            raise RuntimeError('Cannot write only scalars to %s' % table)
+        if n_rows == 0:
+            return 0
+
+        if table not in self._writers:
+            self._writers[table] = pyarrow.parquet.ParquetWriter(self._part_name(table, self._n_parts),
+                                                                 self._schema(column_def),
+                                                                 compression=self.compression)
+        writer = self._writers[table]
+
+        array_list = []
+        for (name, dtype), column in zip(column_def, column_list):
+            if not isinstance(column, np.ndarray):
+                column = np.full(n_rows, column, dtype=dtype)
+            array_list.append(pyarrow.array(column))
+        writer.write_table(pyarrow.Table.from_arrays(array_list, schema=writer.schema))
+        return n_rows
+
+    def write_metadata(self, columns):
+        self._write('metadata', columns)
+
+    def write_alert_data(self, columns):
+        return self._write('alert_data', columns)
+
+    def write_quiescent_flux(self, columns):
+        self._write('quiescent_flux', columns)
+
+    def write_baseline_astrometry(self, columns):
+        self._write('baseline_astrometry', columns)
+
+    def _read_obshistid(self, obshistid):
+        """
+        Read the rows of the alert_data table belonging to obshistid,
+        only reading the row groups that can contain them
+        """
+        parquet_file = pyarrow.parquet.ParquetFile(self._table_name('alert_data'))
+        i_col = parquet_file.schema_arrow.get_field_index('obshistId')
+        row_groups = []
+        for i_group in range(parquet_file.metadata.num_row_groups):
+            stats = parquet_file.metadata.row_group(i_group).column(i_col).statistics
+            if stats is None or not stats.has_min_max or stats.min <= obshistid <= stats.max:
+                row_groups.append(i_group)
+
+        if len(row_groups) == 0:
+            return parquet_file.schema_arrow.empty_table()
+        data = parquet_file.read_row_groups(row_groups)
+        return data.filter(pyarrow.compute.equal(data.column('obshistId'), obshistid))
+
+    def read_diasources(self, obshistid):
+        metadata = pyarrow.parquet.read_table(self._table_name('metadata'))
+        meta_dex = np.where(metadata.column('obshistId').to_numpy() == obshistid)[0]
+        alert_data = self._read_obshistid(obshistid)
+        if len(meta_dex) == 0 or alert_data.num_rows == 0:
+            return np.zeros(0, dtype=DIASOURCE_DTYPE)
+
+        band = metadata.column('band').to_numpy()[meta_dex[0]]
+        tai = metadata.column('TAI').to_numpy()[meta_dex[0]]
+
+        quiescent = pyarrow.parquet.read_table(self._table_name('quiescent_flux'),
+                                               filters=[('band', '=', band)])
+        if quiescent.num_rows == 0:
+            return np.zeros(0, dtype=DIASOURCE_DTYPE)
+
+        # inner join on uniqueId (alert_data is already sorted on uniqueId)
+        q_unq = quiescent.column('uniqueId').to_numpy()
+        q_sorted = np.argsort(q_unq, kind='mergesort')
+        q_unq = q_unq[q_sorted]
+        unq = alert_data.column('uniqueId').to_numpy()
+        q_dex = np.minimum(np.searchsorted(q_unq, unq), len(q_unq)-1)
+        has_quiescent = np.where(q_unq[q_dex] == unq)[0]
+
+        output = np.zeros(len(has_quiescent), dtype=DIASOURCE_DTYPE)
+        for name, out_name in (('uniqueId', 'uniqueId'), ('xPix', 'xPix'), ('yPix', 'yPix'),
+                               ('chipNum', 'chipNum'), ('dflux', 'dflux'), ('snr', 'tot_snr'),
+                               ('ra', 'ra'), ('dec', 'dec')):
+            output[out_name] = alert_data.column(name).to_numpy()[has_quiescent]
+        output['band'] = band
+        output['TAI'] = tai
+        q_rows = q_sorted[q_dex[has_quiescent]]
+        output['quiescent_flux'] = quiescent.column('flux').to_numpy()[q_rows]
+        output['quiescent_snr'] = quiescent.column('snr').to_numpy()[q_rows]
+        return output
+
+    def read_diaobjects(self):
+        baseline = pyarrow.parquet.read_table(self._table_name('baseline_astrometry'))
+        output = np.zeros(baseline.num_rows, dtype=DIAOBJECT_DTYPE)
+        for name in DIAOBJECT_DTYPE.names:
+            output[name] = baseline.column(name).to_numpy()
+        return output
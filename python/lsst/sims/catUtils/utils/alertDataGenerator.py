@@ -1,18 +1,21 @@
 import numpy as np
 import os
 import re
-import sqlite3
+import hashlib
 from collections import OrderedDict
 import time
 import gc
+import multiprocessing
+import threading
 from lsst.utils import getPackageDir
 import lsst.obs.lsst.phosim as obs_lsst_phosim
 from lsst.sims.catalogs.definitions import InstanceCatalog
 from lsst.sims.utils import trixelFromHtmid, getAllTrixels
 from lsst.sims.utils import levelFromHtmid, halfSpaceFromRaDec
 from lsst.sims.utils import angularSeparation, ObservationMetaData
-from lsst.sims.utils import arcsecFromRadians
+from lsst.sims.utils import arcsecFromRadians, galacticFromEquatorial
 from lsst.sims.catUtils.utils import _baseLightCurveCatalog
+from lsst.sims.catUtils.utils import SqliteAlertDataBackend
 from lsst.sims.utils import _pupilCoordsFromRaDec
 from lsst.sims.coordUtils import chipNameFromPupilCoords
 from lsst.sims.coordUtils import pixelCoordsFromPupilCoords
@@ -25,6 +28,7 @@ from lsst.sims.catUtils.mixins import VariabilityGalaxies, AstrometryGalaxies
 from lsst.sims.catUtils.mixins import CameraCoords, PhotometryBase
 from lsst.sims.catUtils.mixins import ParametrizedLightCurveMixin
 from lsst.sims.catUtils.mixins import create_variability_cache
+from lsst.sims.catUtils.mixins import VariabilityParamTable
 
 from lsst.sims.catUtils.baseCatalogModels import StarObj, GalaxyAgnObj
 from sqlalchemy.sql import text
@@ -109,6 +113,12 @@ class StellarAlertDBObjMixin(object):
         if constraint is not None:
             query = query.filter(text(constraint))
 
+        # Return the objects in a fixed order, so that the trixel is
+        # divided into the same chunks every time it is queried
+        # (AlertDataGenerator relies on this to resume a simulation)
+        id_name = self.columnMap[self.getIdColKey()]
+        query = query.order_by(self.table.c[htmid_name], self.table.c[id_name])
+
         if limit is not None:
             query = query.limit(limit)
 
@@ -408,6 +418,101 @@ class AlertAgnVariabilityCatalog(_baseAlertCatalog,
                          self.column_by_name('z_ab'), self.column_by_name('y_ab')])
 
 
+def _photometrically_variable(dmag_arr, dmag_cutoff):
+    """
+    Return the indices (as the output of np.where) of the objects whose
+    |delta_mag| reaches dmag_cutoff in some band at some time.
+
+    dmag_arr is a numpy array of delta_mag with shape (n_time, n_band, n_obj).
+    Objects with a NaN delta_mag in a band are never selected by that band.
+    """
+    # max(|dmag|) == max(max(dmag), -min(dmag)); reducing first means that
+    # no temporary the size of dmag_arr is ever allocated
+    dmag_abs_max = dmag_arr.max(axis=0)
+    np.maximum(dmag_abs_max, -dmag_arr.min(axis=0), out=dmag_abs_max)
+    return np.where((dmag_abs_max >= dmag_cutoff).any(axis=0))
+
+
+def _detectably_variable(dmag_arr_transpose, time_arr, q_m_arr,
+                         dmag_cutoff, obs_mag_cutoff):
+    """
+    Return the indices of the objects whose |delta_mag| exceeds dmag_cutoff
+    in some band while they are detected, provided that they are brighter
+    than that band's obs_mag_cutoff at some time they are detected.
+
+    dmag_arr_transpose is a numpy array of delta_mag with shape
+    (n_obj, n_band, n_time)
+
+    time_arr is a numpy array of shape (n_obj, n_time) which is
+    positive where the object is detected
+
+    q_m_arr is a numpy array of quiescent magnitudes with shape (n_obj, n_band)
+
+    obs_mag_cutoff is a sequence of the n_band limiting magnitudes
+    """
+    # reduce over the times at which each object was detected
+    # (objects that were never detected get -inf and +inf)
+    # (max(|dmag|) == max(max(dmag), -min(dmag)), as above)
+    valid_times = (time_arr > 0)[:, None, :]
+    dmag_abs_max = dmag_arr_transpose.max(axis=2, initial=-np.inf, where=valid_times)
+    dmag_min = dmag_arr_transpose.min(axis=2, initial=np.inf, where=valid_times)
+    np.maximum(dmag_abs_max, -dmag_min, out=dmag_abs_max)
+
+    keep_it = np.logical_and(dmag_abs_max > dmag_cutoff,
+                             q_m_arr + dmag_min <= np.array(obs_mag_cutoff))
+    return np.where(keep_it.any(axis=1))[0]
+
+
+# the state of each worker process of
+# AlertDataGenerator.alert_data_from_htmid_list
+_trixel_worker_state = {}
+
+
+def _init_trixel_worker(alert_gen, dbobj_class, dbobj_kwargs, kwargs, progress_queue):
+    """
+    Initialize a worker process of AlertDataGenerator.alert_data_from_htmid_list:
+    connect to the database, store the kwargs for alert_data_from_htmid
+    and send all progress messages to progress_queue
+    """
+    alert_gen._progress_queue = progress_queue
+    _trixel_worker_state['alert_gen'] = alert_gen
+    _trixel_worker_state['dbobj'] = dbobj_class(**dbobj_kwargs)
+    _trixel_worker_state['kwargs'] = kwargs
+
+
+def _simulate_trixel(htmid):
+    """
+    Simulate the trixel htmid in a worker process of
+    AlertDataGenerator.alert_data_from_htmid_list.
+
+    Returns (htmid, the number of rows written, the elapsed time in hours)
+    """
+    t_start = time.time()
+    n_rows = _trixel_worker_state['alert_gen'].alert_data_from_htmid(htmid,
+                                                                     _trixel_worker_state['dbobj'],
+                                                                     **_trixel_worker_state['kwargs'])
+    return htmid, n_rows, (time.time()-t_start)/3600.0
+
+
+def _write_progress(progress_queue, log_file_name):
+    """
+    Print the (message, to_file) tuples sent to progress_queue and
+    write those with to_file == True to log_file_name, until None is
+    sent.  This runs in a thread of the parent process of
+    AlertDataGenerator.alert_data_from_htmid_list, so that only one
+    process ever writes to stdout or the log file.
+    """
+    while True:
+        message = progress_queue.get()
+        if message is None:
+            break
+        msg, to_file = message
+        print(msg)
+        if to_file:
+            with open(log_file_name, 'a') as out_file:
+                out_file.write('%s\n' % msg)
+
+
 class AlertDataGenerator(object):
     """
     This class will read in astrophysical sources and variability
@@ -436,13 +541,16 @@ class AlertDataGenerator(object):
 
     where prefix is specified by theuser and NNNN is the htmid, the
     unique identifying integer, corresponding to each simulated trixel.
+    (This is the output of the default SqliteAlertDataBackend; other
+    formats, e.g. Parquet, can be selected with the backend_class
+    argument of alert_data_from_htmid.  See alertDataBackends.py.)
 
     The proper way to run this class is to instantiate it, run
     subdivide_obs on a list of ObservationMetaData corresponding
     to the OpSim pointings to be simulated, and then running
     alert_data_from_htmid on each of the htmid in the class property
-    htmid_list.  This last step can easily be parallelized using python's
-    multiprocessing module, with each process handling a different htmid.
+    htmid_list.  alert_data_from_htmid_list does this last step with a pool
+    of worker processes, each handling a different htmid.
 
     The sqlite files produced by alert_data_from_htmid will each contain
     four tables.  They are as follows.  Columns are listed below the
@@ -536,7 +644,10 @@ class AlertDataGenerator(object):
         self.lsst_camera = obs_lsst_phosim.PhosimMapper().camera
         self._variability_cache = create_variability_cache()
         self._stdout_lock = None
+        self._progress_queue = None
         if not testing:
+            # this memory-maps the light curve models if they have been
+            # converted with convertParametrizedLightCurves.py
             plm = ParametrizedLightCurveMixin()
             plm.load_parametrized_light_curves(variability_cache = self._variability_cache)
         self.bp_dict = BandpassDict.loadTotalBandpassesFromFiles()
@@ -576,6 +687,27 @@ class AlertDataGenerator(object):
         if self._stdout_lock is not None:
             self._stdout_lock.release()
 
+    def _log_progress(self, log_file_name, msg, to_file=True):
+        """
+        Print a progress message and (if to_file) write it to the
+        text file log_file_name.
+
+        When running in a worker process of alert_data_from_htmid_list,
+        the message is sent to the parent process, which does all of the
+        printing and writing.  Otherwise, the lock (if any) is held while
+        printing and writing.
+        """
+        if self._progress_queue is not None:
+            self._progress_queue.put((msg, to_file))
+            return
+
+        self.acquire_lock()
+        print(msg)
+        if to_file:
+            with open(log_file_name, 'a') as out_file:
+                out_file.write('%s\n' % msg)
+        self.release_lock()
+
     def subdivide_obs(self, obs_list, htmid_level=6):
         """
         Take a list of ObservationMetaData and subdivide
@@ -692,54 +824,97 @@ class AlertDataGenerator(object):
         """
         return self._obs_list[self._htmid_dict[htmid]]
 
-    def _output_alert_data(self, conn, data_cache):
+    def _obs_hash(self, htmid):
+        """
+        Return a hash of the obsHistID, TAI and bandpass of the
+        ObservationMetaData that intersect the trixel specified by
+        htmid (stored in the progress journal of the output, so that
+        a simulation is only ever resumed with the same observations)
+        """
+        obs_list = sorted([(obs.OpsimMetaData['obsHistID'], '%.5f' % obs.mjd.TAI, obs.bandpass)
+                           for obs in self.obs_from_htmid(htmid)])
+        hasher = hashlib.sha1()
+        for obs in obs_list:
+            hasher.update(('%d %s %s;' % obs).encode('utf-8'))
+        return hasher.hexdigest()
+
+    def stellar_density_estimate(self, htmid):
+        """
+        Return a rough estimate of the relative density of stars in
+        the trixel specified by htmid: 1/sin|b| (the column density of a
+        plane-parallel disk) at the galactic latitude b of the center of
+        the trixel, with |b| floored at 5 degrees.
+
+        Must run subdivide_obs in order for this method to
+        work.
+        """
+        ra, dec = self._trixel_dict[htmid].get_center()
+        gal_lon, gal_lat = galacticFromEquatorial(ra, dec)
+        return 1.0/np.sin(np.radians(max(np.abs(gal_lat), 5.0)))
+
+    def estimate_cost(self, htmid, density=None):
+        """
+        Return an estimate of the relative cost of simulating the trixel
+        specified by htmid: n_obs(htmid) times the density of
+        astrophysical sources in the trixel.
+
+        density is either None (all trixels have the same density of
+        sources), a dict mapping htmid to density or a callable that
+        takes htmid and returns the density (e.g.
+        self.stellar_density_estimate).
+
+        Must run subdivide_obs in order for this method to
+        work.
+        """
+        if density is None:
+            return float(self.n_obs(htmid))
+        if isinstance(density, dict):
+            return self.n_obs(htmid)*float(density[htmid])
+        return self.n_obs(htmid)*float(density(htmid))
+
+    def _output_alert_data(self, backend, data_cache):
         """
-        Write a cache of alert data to the sqlite file currently open.
+        Write a cache of alert data to the output currently open.
 
         Parameters
         ----------
-        conn is the connection to the sqlite file (already open)
+        backend is the AlertDataBackend (already open) to write to
 
         data_cache is a dict containing all of the data to be written.
         It will keyed on a string like 'i_j' where i is the obshistID
         of an OpSim pointing and j is an arbitrary integer.  That key
         will lead to another dict keyed on the columns being output to
-        the sqlite file.  The values of this second layer of dict are
+        the output.  The values of this second layer of dict are
         numpy arrays.
 
         Returns
         -------
-        The number of rows written to the sqlite file
+        The number of rows written to the output
         """
 
-        cursor = conn.cursor()
-        n_rows_0 = cursor.execute('SELECT COUNT(uniqueId) FROM alert_data').fetchall()
-
-        chunk_lengths = np.zeros(len(data_cache))
-
-        for i_cache_tag, cache_tag in enumerate(data_cache):
-            obshistid = int(cache_tag.split('_')[0])
-            n_obj = len(data_cache[cache_tag]['uniqueId'])
-            chunk_lengths[i_cache_tag] = n_obj
-
-            values = ((int(data_cache[cache_tag]['uniqueId'][i_obj]),
-                      obshistid,
-                      data_cache[cache_tag]['xPix'][i_obj],
-                      data_cache[cache_tag]['yPix'][i_obj],
-                      int(data_cache[cache_tag]['chipNum'][i_obj]),
-                      data_cache[cache_tag]['dflux'][i_obj],
-                      data_cache[cache_tag]['SNR'][i_obj],
-                      np.degrees(data_cache[cache_tag]['raICRS'][i_obj]),
-                      np.degrees(data_cache[cache_tag]['decICRS'][i_obj]))
-                      for i_obj in range(n_obj))
-            cursor.executemany('INSERT INTO alert_data VALUES (?,?,?,?,?,?,?,?,?)', values)
-        conn.commit()
-
-        n_rows_1 = cursor.execute('SELECT COUNT(uniqueId) FROM alert_data').fetchall()
-        conn.commit()
-        n_written = (n_rows_1[0][0]-n_rows_0[0][0])
-
-        return n_written
+        if len(data_cache) == 0:
+            return 0
+
+        # concatenate the cached columns so that every column is
+        # converted (and every row is inserted) in one pass
+        tag_list = list(data_cache.keys())
+        obshistid = np.repeat(np.array([int(cache_tag.split('_')[0]) for cache_tag in tag_list],
+                                       dtype=np.int64),
+                              [len(data_cache[cache_tag]['uniqueId']) for cache_tag in tag_list])
+
+        def column(col_name, dtype):
+            return np.concatenate([np.asarray(data_cache[cache_tag][col_name])
+                                   for cache_tag in tag_list]).astype(dtype)
+
+        return backend.write_alert_data({'uniqueId': column('uniqueId', np.int64),
+                                         'obshistId': obshistid,
+                                         'xPix': column('xPix', float),
+                                         'yPix': column('yPix', float),
+                                         'chipNum': column('chipNum', np.int64),
+                                         'dflux': column('dflux', float),
+                                         'snr': column('SNR', float),
+                                         'ra': np.degrees(column('raICRS', float)),
+                                         'dec': np.degrees(column('decICRS', float))})
 
     def _filter_on_photometry_then_chip_name(self, chunk, column_query,
                                              obs_valid_dex, expmjd_list,
@@ -804,24 +979,26 @@ class AlertDataGenerator(object):
         # Calculate the delta_magnitude for all of the sources
         #
         photometry_catalog._set_current_chunk(chunk)
-        dmag_arr = photometry_catalog.applyVariability(chunk['varParamStr'],
-                                                       variability_cache=self._variability_cache,
-                                                       expmjd=expmjd_list).transpose((2, 0, 1))
+        varparam_table = VariabilityParamTable(chunk['varParamStr'])
+        n_raw_obj = len(chunk)
 
-        dmag_arr_transpose = dmag_arr.transpose(2, 1, 0)
+        # Fill dmag_arr one block of objects and times at a time, so that
+        # the variability models never allocate arrays the size of the
+        # whole chunk.  Objects whose variability models cannot reach
+        # dmag_cutoff are not simulated (their delta_magnitudes are zero).
+        dmag_arr = np.zeros((len(expmjd_list), 6, n_raw_obj))
+        for obj_slice, time_slice, dmag_block in \
+            photometry_catalog.iter_variability(varparam_table, expmjd_list,
+                                                variability_cache=self._variability_cache,
+                                                dmag_cutoff=dmag_cutoff):
 
-        n_raw_obj = len(chunk)
-        photometrically_valid = -1*np.ones(n_raw_obj, dtype=int)
-        for i_obj in range(n_raw_obj):
-            keep_it = False
-            for i_filter in range(6):
-                if np.abs(dmag_arr_transpose[i_obj][i_filter]).max() >= dmag_cutoff:
-                    keep_it = True
-                    break
-            if keep_it:
-                photometrically_valid[i_obj] = 1
+            dmag_arr[time_slice, :, obj_slice] = dmag_block.transpose((2, 0, 1))
+
+        dmag_arr_transpose = dmag_arr.transpose(2, 1, 0)
 
-        photometrically_valid = np.where(photometrically_valid >= 0)
+        # keep the objects whose np.abs(delta_mag) reaches dmag_cutoff
+        # in some band at some time
+        photometrically_valid = _photometrically_variable(dmag_arr, dmag_cutoff)
 
         if 'properMotionRa'in column_query:
             pmra = chunk['properMotionRa'][photometrically_valid]
@@ -883,6 +1060,122 @@ class AlertDataGenerator(object):
 
         return chip_name_dict, dmag_arr, dmag_arr_transpose, time_arr
 
+    def alert_data_from_htmid_list(self, htmid_list, dbobj_class,
+                                   dbobj_kwargs=None, n_processes=1,
+                                   density=None, log_file_name=None,
+                                   **kwargs):
+        """
+        Run alert_data_from_htmid on every trixel in htmid_list using a
+        pool of n_processes worker processes.
+
+        The trixels are handed to the workers one at a time, in order of
+        decreasing estimated cost (see estimate_cost), as the workers
+        become free.  This way, the most expensive trixels are started
+        first and no worker sits idle while others still have a queue of
+        trixels to simulate.
+
+        All progress messages are printed and written to log_file_name
+        by the parent process, so no lock is needed.
+
+        Parameters
+        ----------
+        htmid_list is a list of the htmid of the trixels to simulate
+        (e.g. self.htmid_list)
+
+        dbobj_class is the CatalogDBObject class (not an instantiation;
+        or any callable returning a CatalogDBObject) connecting to the data
+        underlying the simulation.  Each worker process calls it once, so
+        that workers do not share a database connection.
+
+        dbobj_kwargs is an optional dict of keyword arguments for dbobj_class
+
+        n_processes is the number of worker processes.  If n_processes == 1,
+        the trixels are simulated in this process.
+
+        density is the density of astrophysical sources used to estimate the
+        cost of each trixel (see estimate_cost)
+
+        log_file_name is the name of a text file where progress will be written
+
+        All other keyword arguments (photometry_class, dmag_cutoff, output_dir,
+        etc.) are passed to alert_data_from_htmid.  In particular, with
+        resume=True, a restarted run skips the trixels that are already
+        complete and resumes the partial ones from their last checkpoint.
+
+        Returns
+        -------
+        A dict mapping each htmid to the number of rows written for that trixel
+
+        Note: the worker processes are always forked from this process (even
+        where the default start method is spawn or forkserver), so this
+        AlertDataGenerator, dbobj_class, dbobj_kwargs and all other keyword
+        arguments (including photometry_class and backend_class) are
+        inherited by the workers rather than pickled, and may be classes
+        defined at runtime.  Only the htmid of each trixel and the results
+        are sent between the processes.  Platforms that do not support
+        fork (e.g. Windows) must use n_processes=1.
+        """
+        if log_file_name is None:
+            raise RuntimeError('must specify log_file_name')
+        if 'lock' in kwargs:
+            raise RuntimeError('alert_data_from_htmid_list does not use a lock')
+        if dbobj_kwargs is None:
+            dbobj_kwargs = {}
+
+        kwargs['log_file_name'] = log_file_name
+        cost_list = np.array([self.estimate_cost(htmid, density=density)
+                              for htmid in htmid_list])
+        task_list = [htmid_list[i_htmid]
+                     for i_htmid in np.argsort(-1.0*cost_list, kind='mergesort')]
+
+        t_start = time.time()
+        n_rows_dict = {}
+
+        def progress_msg(htmid, n_rows, elapsed):
+            n_rows_dict[htmid] = n_rows
+            return ('htmid %d nobs %d n_rows %d time %.2e hrs -- %d of %d trixels done; '
+                    'total time %.2e hrs' % (htmid, self.n_obs(htmid), n_rows, elapsed,
+                                             len(n_rows_dict), len(task_list),
+                                             (time.time()-t_start)/3600.0))
+
+        if n_processes == 1:
+            _init_trixel_worker(self, dbobj_class, dbobj_kwargs, kwargs, None)
+            try:
+                for task in task_list:
+                    self._log_progress(log_file_name, progress_msg(*_simulate_trixel(task)))
+            finally:
+                # do not keep this AlertDataGenerator and the database
+                # connection alive, even if a trixel failed
+                _trixel_worker_state.clear()
+            return n_rows_dict
+
+        # the initializer arguments are only inherited without pickling
+        # if the workers are forked
+        mp_context = multiprocessing.get_context('fork')
+        progress_queue = mp_context.Queue()
+        pool = mp_context.Pool(processes=n_processes,
+                               initializer=_init_trixel_worker,
+                               initargs=(self, dbobj_class, dbobj_kwargs,
+                                         kwargs, progress_queue))
+        # start the writer thread only after the workers have been forked,
+        # so that no worker is forked while it holds the stdout or file lock
+        writer = threading.Thread(target=_write_progress,
+                                  args=(progress_queue, log_file_name))
+        writer.start()
+        try:
+            for result in pool.imap_unordered(_simulate_trixel, task_list, chunksize=1):
+                progress_queue.put((progress_msg(*result), True))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            progress_queue.put(None)
+            writer.join()
+
+        return n_rows_dict
+
     def alert_data_from_htmid(self, htmid, dbobj,
                               dmag_cutoff=0.005,
                               chunk_size=1000, write_every=10000,
@@ -890,11 +1183,13 @@ class AlertDataGenerator(object):
                               log_file_name=None,
                               photometry_class=None,
                               chunk_cutoff=-1,
-                              lock=None):
+                              lock=None,
+                              backend_class=None,
+                              resume=False):
 
         """
-        Generate an sqlite file with all of the alert data for a given
-        trixel.
+        Generate an sqlite file (or other output; see backend_class)
+        with all of the alert data for a given trixel.
 
         Parameters
         ----------
@@ -932,6 +1227,21 @@ class AlertDataGenerator(object):
         lock is a multiprocessing.Lock() for use if running multiple
         instances of alert_data_from_htmid.  This will prevent multiple processes
         from writing to the log file or stdout simultaneously.
+
+        backend_class is the AlertDataBackend class (not an instantiation)
+        used to write the output (see alertDataBackends.py).  Defaults to
+        SqliteAlertDataBackend.
+
+        resume is a boolean.  The output carries a progress journal recording
+        the last chunk of astrophysical objects whose data have been committed,
+        a hash of the observations being simulated and the parameters of the
+        simulation.  If resume is True and the output already exists, the
+        simulation continues from the last committed chunk (or, if the output
+        is complete, returns immediately).  A RuntimeError is raised if the
+        output was produced from different observations or parameters, or
+        if dbobj does not return the same chunks of objects that were
+        committed (the chunks must come back in a deterministic order, as
+        they do from StellarAlertDBObjMixin.query_columns_htmid).
         """
 
         htmid_level = levelFromHtmid(htmid)
@@ -993,6 +1303,53 @@ class AlertDataGenerator(object):
         if photometry_class is None:
             raise RuntimeError('Must specify photometry_class')
 
+        if backend_class is None:
+            backend_class = SqliteAlertDataBackend
+
+        params = {'htmid': int(htmid),
+                  'dmag_cutoff': dmag_cutoff,
+                  'chunk_size': chunk_size,
+                  'chunk_cutoff': chunk_cutoff,
+                  'photometry_class': '%s.%s' % (photometry_class.__module__,
+                                                 photometry_class.__name__),
+                  'dbobj': getattr(dbobj, 'objid', type(dbobj).__name__)}
+
+        # chunk_digest is a hash of the ids of the objects in every
+        # chunk up to i_chunk, so that a resumed simulation can verify
+        # that the database returned the same chunks as before
+        chunk_digest = hashlib.sha1()
+        journal = {'obs_hash': self._obs_hash(htmid),
+                   'params': params,
+                   'i_chunk': 0,
+                   'n_rows': 0,
+                   'n_obj': 0,
+                   'chunk_digest': chunk_digest.hexdigest()}
+
+        is_resumed = False
+        if resume:
+            old_output = backend_class(output_dir, output_prefix, htmid)
+            old_journal = old_output.read_journal()
+            if old_journal is None and old_output.exists():
+                raise RuntimeError('Cannot resume %s; it has no progress journal' %
+                                   old_output.file_name)
+
+            if old_journal is not None:
+                if (old_journal['obs_hash'] != journal['obs_hash'] or
+                    old_journal['params'] != params):
+
+                    raise RuntimeError('Cannot resume %s; it was produced from different '
+                                       'observations or parameters' % old_output.file_name)
+
+                if old_journal['complete']:
+                    self._log_progress(log_file_name, 'htmid %d is already complete' % htmid)
+                    return old_journal['n_rows']
+
+                for key in ('i_chunk', 'n_rows', 'n_obj', 'chunk_digest'):
+                    journal[key] = old_journal[key]
+                is_resumed = True
+                self._log_progress(log_file_name, 'resuming htmid %d after chunk %d' %
+                                   (htmid, journal['i_chunk']))
+
         if os.path.exists(output_dir) and not os.path.isdir(output_dir):
             raise RuntimeError('%s is not a dir' % output_dir)
         if not os.path.exists(output_dir):
@@ -1041,6 +1398,7 @@ class AlertDataGenerator(object):
 
         n_bits_off = 2*(21-htmid_level)
 
+        id_col_name = dbobj.getIdColKey()
         data_iter = dbobj.query_columns_htmid(colnames=column_query,
                                               htmid=htmid,
                                               chunk_size=chunk_size)
@@ -1058,54 +1416,24 @@ class AlertDataGenerator(object):
         output_data_cache = {}
         n_rows_cached = 0
 
-        n_obj = 0
+        n_obj = journal['n_obj']
         n_actual_obj = 0
         n_time_last = 0
-        n_rows = 0
+        n_rows = journal['n_rows']
+        last_committed_chunk = journal['i_chunk']
 
         t_before_obj = time.time()  # so that we can get a sense of how long the
                                     # "iterating over astrophysical objects" part
                                     # of the simulation will take
 
-        db_name = os.path.join(output_dir, '%s_%d_sqlite.db' % (output_prefix, htmid))
-        with sqlite3.connect(db_name, isolation_level='EXCLUSIVE') as conn:
-            creation_cmd = '''CREATE TABLE alert_data
-                           (uniqueId int, obshistId int, xPix float, yPix float,
-                            chipNum int, dflux float, snr float, ra float, dec float)'''
-
-            cursor = conn.cursor()
-            cursor.execute('PRAGMA journal_mode=WAL;')
-            conn.commit()
-            cursor.execute(creation_cmd)
-            conn.commit()
-
-            creation_cmd = '''CREATE TABLE metadata
-                           (obshistId int, TAI float, band int)'''
-            cursor.execute(creation_cmd)
-            conn.commit()
-
-            for obs_dex in obs_valid_dex:
-                obs = self._obs_list[obs_dex]
-                cmd = '''INSERT INTO metadata
-                      VALUES(%d, %.5f, %d)''' % (obs.OpsimMetaData['obsHistID'],
-                                                 obs.mjd.TAI,
-                                                 mag_name_to_int[obs.bandpass])
-
-                cursor.execute(cmd)
-            conn.commit()
-
-            creation_cmd = '''CREATE TABLE quiescent_flux
-                          (uniqueId int, band int, flux float, snr float)'''
-
-            cursor.execute(creation_cmd)
-            conn.commit()
-
-            creation_cmd = '''CREATE TABLE baseline_astrometry
-                           (uniqueId int, ra real, dec real, pmRA real,
-                            pmDec real, parallax real, TAI real)'''
-
-            cursor.execute(creation_cmd)
-            conn.commit()
+        with backend_class(output_dir, output_prefix, htmid, resume=is_resumed) as backend:
+            if not is_resumed:
+                backend.write_metadata({'obshistId': np.array([self._obs_list[obs_dex].OpsimMetaData['obsHistID']
+                                                               for obs_dex in obs_valid_dex]),
+                                        'TAI': expmjd_list,
+                                        'band': np.array([mag_name_to_int[self._obs_list[obs_dex].bandpass]
+                                                          for obs_dex in obs_valid_dex])})
+                backend.checkpoint(journal)
 
             for chunk in data_iter:
                 n_raw_obj = len(chunk)
@@ -1114,6 +1442,19 @@ class AlertDataGenerator(object):
                 if chunk_cutoff > 0 and i_chunk >= chunk_cutoff:
                     break
 
+                chunk_digest.update(np.ascontiguousarray(chunk[id_col_name],
+                                                         dtype=np.int64).tobytes())
+
+                # the data of this chunk were committed before the
+                # simulation was interrupted
+                if i_chunk <= last_committed_chunk:
+                    if (i_chunk == last_committed_chunk and
+                        chunk_digest.hexdigest() != journal['chunk_digest']):
+
+                        raise RuntimeError('Cannot resume htmid %d; the database did not '
+                                           'return the chunks that were committed' % htmid)
+                    continue
+
                 n_time_last = 0
                 # filter the chunk so that we are only considering sources that are in
                 # the trixel being considered
@@ -1192,26 +1533,18 @@ class AlertDataGenerator(object):
                 # each object (in self._filter_on_photometry_then_chip_name(),
                 # we assumed that every object was detected at every time step).
 
-                photometrically_valid_obj = []
-                for i_obj in range(len(chunk)):
-                    keep_it = False
-                    valid_times = np.where(time_arr[i_obj] > 0)
-                    if len(valid_times[0]) == 0:
-                        continue
-                    for i_filter in range(len(mag_names)):
-                        if np.abs(dmag_arr_transpose[i_obj][i_filter][valid_times]).max() > dmag_cutoff:
-                            dmag_min = dmag_arr_transpose[i_obj][i_filter][valid_times].min()
-                            if q_m_dict[i_filter][i_obj] + dmag_min <= obs_mag_cutoff[i_filter]:
-                                keep_it = True
-                                break
-                    if keep_it:
-                        photometrically_valid_obj.append(i_obj)
-                photometrically_valid_obj = np.array(photometrically_valid_obj)
+                q_m_arr = np.array([q_m_dict[i_filter]
+                                    for i_filter in range(len(mag_names))]).transpose()
+                photometrically_valid_obj = _detectably_variable(dmag_arr_transpose, time_arr,
+                                                                 q_m_arr, dmag_cutoff,
+                                                                 obs_mag_cutoff)
 
                 del dmag_arr_transpose
                 gc.collect()
 
-                if np.abs(dmag_arr).max() < dmag_cutoff:
+                # i.e. np.abs(dmag_arr).max() < dmag_cutoff, without
+                # allocating np.abs(dmag_arr)
+                if np.maximum(dmag_arr.max(), -dmag_arr.min()) < dmag_cutoff:
                     continue
 
                 completely_valid = np.zeros(len(chunk), dtype=int)
@@ -1271,84 +1604,70 @@ class AlertDataGenerator(object):
                         n_rows_cached += length_of_chunk
 
                 completely_valid = np.where(completely_valid > 0)
+                valid_unq = np.asarray(unq[completely_valid]).astype(np.int64)
                 for i_filter in range(6):
-                    values = ((int(unq[completely_valid][i_q]),
-                               i_filter,
-                               q_f_dict[i_filter][completely_valid][i_q],
-                               q_snr_dict[i_filter][completely_valid][i_q])
-                              for i_q in range(len(completely_valid[0])))
-                    cursor.executemany('INSERT INTO quiescent_flux VALUES (?,?,?,?)', values)
-                    conn.commit()
-
-                values = ((int(unq[completely_valid][i_q]),
-                           q_ra[completely_valid][i_q],
-                           q_dec[completely_valid][i_q],
-                           q_pmra[completely_valid][i_q],
-                           q_pmdec[completely_valid][i_q],
-                           q_parallax[completely_valid][i_q],
-                           q_tai)
-                          for i_q in range(len(completely_valid[0])))
-
-                cursor.executemany('INSERT INTO baseline_astrometry VALUES (?,?,?,?,?,?,?)', values)
+                    backend.write_quiescent_flux({'uniqueId': valid_unq,
+                                                  'band': i_filter,
+                                                  'flux': np.asarray(q_f_dict[i_filter][completely_valid],
+                                                                     dtype=float),
+                                                  'snr': np.asarray(q_snr_dict[i_filter][completely_valid],
+                                                                    dtype=float)})
+
+                backend.write_baseline_astrometry({'uniqueId': valid_unq,
+                                                   'ra': np.asarray(q_ra[completely_valid], dtype=float),
+                                                   'dec': np.asarray(q_dec[completely_valid], dtype=float),
+                                                   'pmRA': np.asarray(q_pmra[completely_valid], dtype=float),
+                                                   'pmDec': np.asarray(q_pmdec[completely_valid], dtype=float),
+                                                   'parallax': np.asarray(q_parallax[completely_valid],
+                                                                          dtype=float),
+                                                   'TAI': float(q_tai)})
 
                 if n_rows_cached >= write_every:
-                    self.acquire_lock()
-                    with open(log_file_name, 'a') as out_file:
-                        out_file.write('%d is writing \n' % os.getpid())
-
-                        print('%d is writing' % os.getpid())
+                    self._log_progress(log_file_name, '%d is writing' % os.getpid())
 
-                    self.release_lock()
-
-                    n_rows += self._output_alert_data(conn, output_data_cache)
+                    n_rows += self._output_alert_data(backend, output_data_cache)
                     output_data_cache = {}
                     n_rows_cached = 0
 
+                    # commit everything up to and including this chunk
+                    journal.update(i_chunk=i_chunk, n_rows=n_rows, n_obj=n_obj,
+                                   chunk_digest=chunk_digest.hexdigest())
+                    backend.checkpoint(journal)
+
                     if n_rows > 0:
-                        self.acquire_lock()
-                        with open(log_file_name, 'a') as out_file:
-                            elapsed = (time.time()-t_before_obj)/3600.0
-                            elapsed_per = elapsed/n_rows
-                            rows_per_chunk = float(n_rows)/float(i_chunk)
-                            total_projection = 1000.0*rows_per_chunk*elapsed_per
-                            out_file.write('\n    %d n_obj %d %d trimmed %d\n' %
-                                           (this_pid, n_obj, n_actual_obj, n_htmid_trim))
-                            out_file.write('    elapsed %.2e hrs per row %.2e total %2e\n' %
-                                           (elapsed, elapsed_per, total_projection))
-                            out_file.write('    n_time_last %d; rows %d\n' % (n_time_last, n_rows))
-
-                            out_file.write('%d is done writing\n' % os.getpid())
-
-                            print('\n    %d n_obj %d %d trimmed %d' %
-                                  (this_pid, n_obj, n_actual_obj, n_htmid_trim))
-                            print('    elapsed %.2e hrs per row %.2e total %2e' %
-                                  (elapsed, elapsed_per, total_projection))
-                            print('    n_time_last %d; rows %d\n' % (n_time_last, n_rows))
-                            print('%d is done writing' % os.getpid())
-
-                        self.release_lock()
+                        elapsed = (time.time()-t_before_obj)/3600.0
+                        elapsed_per = elapsed/n_rows
+                        rows_per_chunk = float(n_rows)/float(i_chunk)
+                        total_projection = 1000.0*rows_per_chunk*elapsed_per
+                        msg = '\n    %d n_obj %d %d trimmed %d\n' % (this_pid, n_obj, n_actual_obj,
+                                                                    n_htmid_trim)
+                        msg += '    elapsed %.2e hrs per row %.2e total %2e\n' % (elapsed, elapsed_per,
+                                                                                   total_projection)
+                        msg += '    n_time_last %d; rows %d\n' % (n_time_last, n_rows)
+                        msg += '%d is done writing' % os.getpid()
+                        self._log_progress(log_file_name, msg)
+
+            if i_chunk < last_committed_chunk:
+                raise RuntimeError('Cannot resume htmid %d; the database returned %d chunks, '
+                                   'but %d were committed' % (htmid, i_chunk, last_committed_chunk))
 
             if len(output_data_cache) > 0:
-                n_rows += self._output_alert_data(conn, output_data_cache)
+                n_rows += self._output_alert_data(backend, output_data_cache)
                 output_data_cache = {}
 
-            print('htmid %d that took %.2e hours; n_obj %d n_rows %d' %
-                  (htmid, (time.time()-t_start)/3600.0, n_obj, n_rows))
+            journal.update(i_chunk=i_chunk, n_rows=n_rows, n_obj=n_obj,
+                           chunk_digest=chunk_digest.hexdigest())
+            backend.checkpoint(journal)
 
-            self.acquire_lock()
-            print("INDEXING %d" % htmid)
-            self.release_lock()
+            self._log_progress(log_file_name,
+                               'htmid %d that took %.2e hours; n_obj %d n_rows %d' %
+                               (htmid, (time.time()-t_start)/3600.0, n_obj, n_rows),
+                               to_file=False)
 
-            cursor.execute('CREATE INDEX unq_obs ON alert_data (uniqueId, obshistId)')
-            cursor.execute('CREATE INDEX unq_flux ON quiescent_flux (uniqueId, band)')
-            cursor.execute('CREATE INDEX obs ON metadata (obshistid)')
-            cursor.execute('CREATE INDEX unq_ast ON baseline_astrometry (uniqueId)')
-            conn.commit()
+            self._log_progress(log_file_name, "INDEXING %d" % htmid, to_file=False)
 
-            self.acquire_lock()
-            with open(log_file_name, 'a') as out_file:
-                out_file.write('done with htmid %d -- %e %d\n' %
-                               (htmid, (time.time()-t_start)/3600.0, n_obj))
-            self.release_lock()
+        # the backend indexes its output as the with block exits
+        self._log_progress(log_file_name, 'done with htmid %d -- %e %d' %
+                           (htmid, (time.time()-t_start)/3600.0, n_obj))
 
         return n_rows
@@ -8,7 +8,7 @@ try:
 except ImportError:
     pass
 
-from lsst.sims.catalogs.db import DBObject
+from lsst.sims.catUtils.utils import SqliteAlertDataBackend
 import os
 import numpy as np
 import json
@@ -204,7 +204,8 @@ class AvroAlertGenerator(object):
 
     def write_alerts(self, obshistid, data_dir, prefix_list,
                      htmid_list, out_dir, out_prefix,
-                     dmag_cutoff, lock=None, log_file_name=None):
+                     dmag_cutoff, lock=None, log_file_name=None,
+                     backend_class=None):
         """
         Write the alerts for an obsHistId to a properly formatted avro file.
 
@@ -213,8 +214,8 @@ class AvroAlertGenerator(object):
         obshistid is the integer uniquely identifying the OpSim pointing
         being simulated
 
-        data_dir is the directory containing the sqlite files created by
-        the AlertDataGenerator
+        data_dir is the directory containing the sqlite files (or other
+        output; see backend_class) created by the AlertDataGenerator
 
         prefix_list is a list of prefixes for those sqlite files.
 
@@ -236,8 +237,15 @@ class AvroAlertGenerator(object):
 
         log_file_name is the name of an optional text file to which progress is
         written.
+
+        backend_class is the AlertDataBackend class (not an instantiation)
+        with which the AlertDataGenerator wrote its output (see
+        alertDataBackends.py).  Defaults to SqliteAlertDataBackend.
         """
 
+        if backend_class is None:
+            backend_class = SqliteAlertDataBackend
+
         out_name = os.path.join(out_dir, '%s_%d.avro' % (out_prefix, obshistid))
         if os.path.exists(out_name):
             os.unlink(out_name)
@@ -245,46 +253,20 @@ class AvroAlertGenerator(object):
         with DataFileWriter(open(out_name, "wb"),
                             DatumWriter(), self._alert_schema) as data_writer:
 
-            diasource_query = 'SELECT alert.uniqueId, alert.xPix, alert.yPix, '
-            diasource_query += 'alert.chipNum, alert.dflux, alert.snr, alert.ra, alert.dec, '
-            diasource_query += 'meta.band, meta.TAI, quiescent.flux, quiescent.snr '
-            diasource_query += 'FROM alert_data as alert '
-            diasource_query += 'INNER JOIN metadata AS meta ON alert.obshistId=meta.obshistId '
-            diasource_query += 'INNER JOIN quiescent_flux AS quiescent ON quiescent.uniqueId=alert.uniqueID '
-            diasource_query += 'AND quiescent.band=meta.band '
-            diasource_query += 'WHERE alert.obshistId=%d ' % obshistid
-            diasource_query += 'ORDER BY alert.uniqueId'
-
-            diasource_dtype = np.dtype([('uniqueId', int), ('xPix', float), ('yPix', float),
-                                        ('chipNum', int), ('dflux', float), ('tot_snr', float),
-                                        ('ra', float), ('dec', float), ('band', int), ('TAI', float),
-                                        ('quiescent_flux', float), ('quiescent_snr', float)])
-
-            diaobject_query = 'SELECT uniqueId, ra, dec, TAI, pmRA, pmDec, parallax '
-            diaobject_query += 'FROM baseline_astrometry'
-
-            diaobject_dtype = np.dtype([('uniqueId', int), ('ra', float), ('dec', float),
-                                        ('TAI', float), ('pmRA', float), ('pmDec', float),
-                                        ('parallax', float)])
-
             t_start = time.time()
             alert_ct = 0
             for htmid in htmid_list:
                 for prefix in prefix_list:
-                    db_name = os.path.join(data_dir, '%s_%d_sqlite.db' % (prefix, htmid))
-                    if not os.path.exists(db_name):
-                        warnings.warn('%s does not exist' % db_name)
+                    backend = backend_class(data_dir, prefix, htmid)
+                    if not backend.exists():
+                        warnings.warn('%s does not exist' % backend.file_name)
                         continue
 
-                    db_obj = DBObject(db_name, driver='sqlite')
-
-                    diaobject_data = db_obj.execute_arbitrary(diaobject_query,
-                                                              dtype=diaobject_dtype)
+                    diaobject_data = backend.read_diaobjects()
 
                     diaobject_dict = self._create_objects(diaobject_data)
 
-                    diasource_data = db_obj.execute_arbitrary(diasource_query,
-                                                              dtype=diasource_dtype)
+                    diasource_data = backend.read_diasources(obshistid)
 
                     dmag = 2.5*np.log10(1.0+diasource_data['dflux']/diasource_data['quiescent_flux'])
                     valid_alerts = np.where(np.abs(dmag) >= dmag_cutoff)
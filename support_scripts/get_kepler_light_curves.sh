@@ -22,3 +22,6 @@ mv ${data_file} ${destination_dir}/${data_file}
 
 echo "\nThe md5 checksum for "${destination_dir}/${data_file}" should be"
 echo "be00df75b8980943849b3722e01cfc9b"
+
+echo "\nTo load the light curves without parsing the text file,"
+echo "run convertParametrizedLightCurves.py"
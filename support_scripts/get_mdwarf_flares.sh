@@ -22,3 +22,6 @@ mv ${data_file} ${destination_dir}/${data_file}
 
 echo "\nThe md5 checksum for "${destination_dir}/${data_file}" should be"
 echo "57fe2d68f012ba02fd36f00dcfccb3ae"
+
+echo "\nTo let worker processes share one memory-mapped copy of the"
+echo "light curves, run convertMLTlightCurves.py"
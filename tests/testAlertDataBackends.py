@@ -0,0 +1,281 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import lsst.utils.tests
+
+from lsst.sims.catUtils.utils import SqliteAlertDataBackend
+from lsst.sims.catUtils.utils import ParquetAlertDataBackend
+
+_pyarrow_is_installed = True
+try:
+    import pyarrow.parquet
+except ImportError:
+    _pyarrow_is_installed = False
+    pass
+
+
+ROOT = os.path.abspath(os.path.dirname(__file__))
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+class AlertDataBackendTestCase(unittest.TestCase):
+
+    longMessage = True
+
+    @classmethod
+    def setUpClass(cls):
+        cls.out_dir = tempfile.mkdtemp(dir=ROOT, prefix='alert_backend_output')
+
+        rng = np.random.RandomState(8812)
+        n_obj = 300
+        cls.obshistid_list = np.array([14, 3, 77, 9, 120])
+        cls.tai_list = 59580.0 + rng.random_sample(len(cls.obshistid_list))*100.0
+        cls.band_list = rng.randint(0, 6, size=len(cls.obshistid_list))
+
+        cls.unq = rng.choice(np.arange(10**6), size=n_obj, replace=False)
+        cls.quiescent_flux = rng.random_sample((6, n_obj))
+        cls.quiescent_snr = rng.random_sample((6, n_obj))*100.0
+        cls.astrometry = {}
+        for col_name in ('ra', 'dec', 'pmRA', 'pmDec', 'parallax'):
+            cls.astrometry[col_name] = rng.random_sample(n_obj)
+        cls.astrometry['TAI'] = 59580.0
+
+        # the alert data is written in several chunks of objects, with
+        # several pointings each; the last few objects have no quiescent
+        # flux and so should be dropped from the diasources
+        cls.chunk_list = []
+        for i_start in range(0, n_obj, 100):
+            for i_obs in rng.permutation(len(cls.obshistid_list)):
+                dexes = np.sort(rng.choice(np.arange(i_start, i_start+100), size=40,
+                                           replace=False))
+                columns = {}
+                columns['uniqueId'] = cls.unq[dexes]
+                columns['obshistId'] = cls.obshistid_list[i_obs]
+                columns['xPix'] = rng.random_sample(40)*4000.0
+                columns['yPix'] = rng.random_sample(40)*4000.0
+                columns['chipNum'] = rng.randint(0, 189, size=40)
+                columns['dflux'] = rng.normal(0.0, 1.0, size=40)
+                columns['snr'] = rng.random_sample(40)*100.0
+                columns['ra'] = rng.random_sample(40)*360.0
+                columns['dec'] = (rng.random_sample(40)-0.5)*180.0
+                cls.chunk_list.append((i_start, columns))
+        cls.n_obj_with_flux = n_obj-10
+
+    @classmethod
+    def tearDownClass(cls):
+        if os.path.exists(cls.out_dir):
+            shutil.rmtree(cls.out_dir)
+
+    def write_chunks(self, backend, i_start_list):
+        """
+        Write the test data of the chunks of objects starting
+        at i_start_list through backend
+        """
+        last_chunk = -1
+        for i_start, columns in self.chunk_list:
+            if i_start not in i_start_list:
+                continue
+            self.assertEqual(backend.write_alert_data(columns), 40)
+            if i_start == last_chunk:
+                continue
+            last_chunk = i_start
+            dexes = np.arange(i_start, min(i_start+100, self.n_obj_with_flux))
+            for i_filter in range(6):
+                backend.write_quiescent_flux({'uniqueId': self.unq[dexes],
+                                              'band': i_filter,
+                                              'flux': self.quiescent_flux[i_filter][dexes],
+                                              'snr': self.quiescent_snr[i_filter][dexes]})
+            astrometry = {'uniqueId': self.unq[dexes]}
+            for col_name in self.astrometry:
+                if col_name == 'TAI':
+                    astrometry[col_name] = self.astrometry[col_name]
+                else:
+                    astrometry[col_name] = self.astrometry[col_name][dexes]
+            backend.write_baseline_astrometry(astrometry)
+
+    def write_data(self, backend_class, prefix):
+        """
+        Write the test data through backend_class; return the backend
+        """
+        with backend_class(self.out_dir, prefix, 2214) as backend:
+            backend.write_metadata({'obshistId': self.obshistid_list,
+                                    'TAI': self.tai_list,
+                                    'band': self.band_list})
+            self.write_chunks(backend, (0, 100, 200))
+        return backend
+
+    def check_resume(self, backend_class, prefix):
+        """
+        Test that an output written through backend_class can be
+        resumed from its last checkpoint
+        """
+        backend = backend_class(self.out_dir, prefix, 2214)
+        self.assertIsNone(backend.read_journal())
+        backend.open()
+        backend.write_metadata({'obshistId': self.obshistid_list,
+                                'TAI': self.tai_list,
+                                'band': self.band_list})
+        self.write_chunks(backend, (0,))
+        backend.checkpoint({'i_chunk': 1, 'n_rows': 200})
+        self.write_chunks(backend, (100,))
+        # simulate the process dying before the next checkpoint
+        backend.close(finalize=False)
+        self.assertEqual(backend.read_journal(),
+                         {'i_chunk': 1, 'n_rows': 200, 'complete': False})
+
+        # the output cannot be created again
+        with self.assertRaises(RuntimeError):
+            with backend_class(self.out_dir, prefix, 2214):
+                pass
+
+        with backend_class(self.out_dir, prefix, 2214, resume=True) as resumed:
+            self.write_chunks(resumed, (100,))
+            resumed.checkpoint({'i_chunk': 2, 'n_rows': 400})
+            self.write_chunks(resumed, (200,))
+            resumed.checkpoint({'i_chunk': 3, 'n_rows': 600})
+
+        self.assertEqual(resumed.read_journal(),
+                         {'i_chunk': 3, 'n_rows': 600, 'complete': True})
+        return resumed
+
+    def check_output(self, backend, tai_precision):
+        """
+        Compare the diasources and diaobjects read by backend
+        with the test data
+        """
+        self.assertTrue(backend.exists())
+        has_flux = set(self.unq[:self.n_obj_with_flux])
+        for i_obs, obshistid in enumerate(self.obshistid_list):
+            control_rows = []
+            for i_start, columns in self.chunk_list:
+                if columns['obshistId'] != obshistid:
+                    continue
+                for i_row in range(40):
+                    unq = columns['uniqueId'][i_row]
+                    if unq not in has_flux:
+                        continue
+                    i_obj = np.where(self.unq == unq)[0][0]
+                    band = self.band_list[i_obs]
+                    control_rows.append((unq, columns['xPix'][i_row], columns['yPix'][i_row],
+                                         columns['chipNum'][i_row], columns['dflux'][i_row],
+                                         columns['snr'][i_row], columns['ra'][i_row],
+                                         columns['dec'][i_row], band,
+                                         self.quiescent_flux[band][i_obj],
+                                         self.quiescent_snr[band][i_obj]))
+            control_rows.sort()
+
+            diasources = backend.read_diasources(obshistid)
+            self.assertEqual(len(diasources), len(control_rows))
+            self.assertGreater(len(diasources), 0)
+            np.testing.assert_array_equal(diasources['uniqueId'],
+                                          np.sort(diasources['uniqueId']))
+            for row, control in zip(diasources, control_rows):
+                self.assertEqual(row['uniqueId'], control[0])
+                self.assertEqual(row['xPix'], control[1])
+                self.assertEqual(row['yPix'], control[2])
+                self.assertEqual(row['chipNum'], control[3])
+                self.assertEqual(row['dflux'], control[4])
+                self.assertEqual(row['tot_snr'], control[5])
+                self.assertEqual(row['ra'], control[6])
+                self.assertEqual(row['dec'], control[7])
+                self.assertEqual(row['band'], control[8])
+                self.assertEqual(row['quiescent_flux'], control[9])
+                self.assertEqual(row['quiescent_snr'], control[10])
+                self.assertAlmostEqual(row['TAI'], self.tai_list[i_obs], delta=tai_precision)
+
+        self.assertEqual(len(backend.read_diasources(999)), 0)
+
+        diaobjects = backend.read_diaobjects()
+        self.assertEqual(len(diaobjects), self.n_obj_with_flux)
+        np.testing.assert_array_equal(np.sort(diaobjects['uniqueId']),
+                                      np.sort(self.unq[:self.n_obj_with_flux]))
+        for row in diaobjects:
+            i_obj = np.where(self.unq == row['uniqueId'])[0][0]
+            for col_name in ('ra', 'dec', 'pmRA', 'pmDec', 'parallax'):
+                self.assertEqual(row[col_name], self.astrometry[col_name][i_obj])
+            self.assertEqual(row['TAI'], self.astrometry['TAI'])
+
+    def test_sqlite(self):
+        """
+        Test that SqliteAlertDataBackend reads back what it wrote
+        """
+        backend = self.write_data(SqliteAlertDataBackend, 'sqlite_test')
+        self.assertEqual(os.path.basename(backend.file_name), 'sqlite_test_2214_sqlite.db')
+        # the metadata table stores TAI to 5 decimal places
+        self.check_output(backend, 1.0e-5)
+        self.assertIsNone(backend.read_journal())
+
+    def test_sqlite_resume(self):
+        """
+        Test that SqliteAlertDataBackend can resume from a checkpoint
+        """
+        backend = self.check_resume(SqliteAlertDataBackend, 'sqlite_resume')
+        self.check_output(backend, 1.0e-5)
+
+        # an output that was already finalized can be resumed and
+        # finalized again
+        with SqliteAlertDataBackend(self.out_dir, 'sqlite_resume', 2214, resume=True) as resumed:
+            pass
+        self.assertEqual(resumed.read_journal(),
+                         {'i_chunk': 3, 'n_rows': 600, 'complete': True})
+        self.check_output(resumed, 1.0e-5)
+
+    @unittest.skipIf(not _pyarrow_is_installed, 'pyarrow is not installed')
+    def test_parquet(self):
+        """
+        Test that ParquetAlertDataBackend reads back what it wrote,
+        and that the alert data are sorted on obshistId
+        """
+        class SmallGroupBackend(ParquetAlertDataBackend):
+            alert_row_group_size = 50
+
+        backend = self.write_data(SmallGroupBackend, 'parquet_test')
+        self.assertEqual(os.path.basename(backend.file_name), 'parquet_test_2214_parquet')
+        self.assertEqual(sorted(os.listdir(backend.file_name)),
+                         ['alert_data.parquet', 'baseline_astrometry.parquet',
+                          'metadata.parquet', 'quiescent_flux.parquet'])
+
+        alert_file = pyarrow.parquet.ParquetFile(os.path.join(backend.file_name,
+                                                              'alert_data.parquet'))
+        self.assertGreater(alert_file.metadata.num_row_groups, 1)
+        obshistid = alert_file.read().column('obshistId').to_numpy()
+        np.testing.assert_array_equal(obshistid, np.sort(obshistid))
+
+        self.check_output(backend, 1.0e-10)
+
+        with self.assertRaises(RuntimeError):
+            with ParquetAlertDataBackend(self.out_dir, 'parquet_test', 2214):
+                pass
+
+    @unittest.skipIf(not _pyarrow_is_installed, 'pyarrow is not installed')
+    def test_parquet_resume(self):
+        """
+        Test that ParquetAlertDataBackend can resume from a checkpoint
+        """
+        backend = self.check_resume(ParquetAlertDataBackend, 'parquet_resume')
+        self.assertEqual(sorted(os.listdir(backend.file_name)),
+                         ['alert_data.parquet', 'baseline_astrometry.parquet',
+                          'journal.json', 'metadata.parquet', 'quiescent_flux.parquet'])
+        self.check_output(backend, 1.0e-10)
+
+    def test_missing_output(self):
+        """
+        Test that exists() is False before any output is written
+        """
+        self.assertFalse(SqliteAlertDataBackend(self.out_dir, 'nothing', 11).exists())
+        if _pyarrow_is_installed:
+            self.assertFalse(ParquetAlertDataBackend(self.out_dir, 'nothing', 11).exists())
+
+
+class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,137 @@
+import numpy as np
+import unittest
+import lsst.utils.tests
+
+from lsst.sims.catUtils.mixins import CounterRNG, philox4x64
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+class CounterRNGTestCase(unittest.TestCase):
+
+    longMessage = True
+
+    def test_philox_known_answers(self):
+        """
+        Test philox4x64 against the known answer test vectors
+        distributed with Random123
+        """
+        out = philox4x64(np.zeros(4, dtype=np.uint64),
+                         np.zeros(2, dtype=np.uint64))
+        np.testing.assert_array_equal(out,
+                                      np.array([0x16554d9eca36314c, 0xdb20fe9d672d0fdc,
+                                                0xd7e772cee186176b, 0x7e68b68aec7ba23b],
+                                               dtype=np.uint64))
+
+        out = philox4x64(np.array([0x243f6a8885a308d3, 0x13198a2e03707344,
+                                   0xa4093822299f31d0, 0x082efa98ec4e6c89], dtype=np.uint64),
+                         np.array([0x452821e638d01377, 0xbe5466cf34e90c6c], dtype=np.uint64))
+        np.testing.assert_array_equal(out,
+                                      np.array([0xa528f45403e61d95, 0x38c72dbd566e9788,
+                                                0xa5a1610e72fd18b5, 0x57bd43b5e52b7fe6],
+                                               dtype=np.uint64))
+
+    def test_numpy_philox(self):
+        """
+        Test that the streams of CounterRNG are those of np.random.Philox
+        """
+        rng = CounterRNG(seed=71)
+        for stream_id in (0, 17, 2**40+3):
+            key = rng.key('agn', stream_id)
+            bit_generator = np.random.Philox(key=int(key[0]) + (int(key[1]) << 64),
+                                             counter=2**256-1)
+            control = bit_generator.random_raw(4*37).reshape(37, 4)
+            test = rng.random_raw('agn', stream_id, np.arange(37))
+            np.testing.assert_array_equal(control, test)
+
+            uniform = rng.uniform('agn', stream_id, np.arange(37))
+            np.testing.assert_array_equal(uniform, (control[:, 0] >> np.uint64(11))/2.0**53)
+
+    def test_keys(self):
+        """
+        Test that the streams depend on the seed and the model name
+        """
+        draw_index = np.arange(100)
+        control = CounterRNG(seed=5).uniform('agn', 11, draw_index)
+        np.testing.assert_array_equal(control,
+                                      CounterRNG(seed=5).uniform('agn', 11, draw_index))
+        for other in (CounterRNG(seed=6).uniform('agn', 11, draw_index),
+                      CounterRNG(seed=5).uniform('sn', 11, draw_index),
+                      CounterRNG(seed=5).uniform('agn', 12, draw_index)):
+            self.assertGreater(np.abs(control-other).max(), 0.1)
+
+    def test_bulk_draws(self):
+        """
+        Test that drawing random numbers in bulk, in any order, gives
+        the same answers as drawing them one at a time from a stream
+        """
+        rng = CounterRNG(seed=3)
+        stream_id = np.array([9, 1, 2**33, 77])
+        draw_index = np.arange(50)
+        normal = rng.normal('agn', stream_id[:, None], draw_index[None, :])
+        self.assertEqual(normal.shape, (4, 50))
+
+        shuffled = np.random.RandomState(88).permutation(50)
+        np.testing.assert_array_equal(rng.normal('agn', stream_id[::-1, None],
+                                                 shuffled[None, :]),
+                                      normal[::-1][:, shuffled])
+
+        for i_stream, stream_id in enumerate(stream_id):
+            stream = rng.stream('agn', stream_id)
+            test = [stream.normal(0.0, 1.0) for ii in range(10)]
+            test += list(stream.normal(0.0, 1.0, size=40))
+            np.testing.assert_array_equal(test, normal[i_stream])
+
+        uniform = rng.uniform('sn', 4, 7, low=2.0, high=5.0)
+        stream = rng.stream('sn', 4)
+        stream.random_sample(7)
+        self.assertEqual(uniform, stream.uniform(2.0, 5.0))
+
+    def test_distributions(self):
+        """
+        Test the moments of the uniform and normal deviates
+        """
+        rng = CounterRNG(seed=12)
+        uniform = rng.uniform('test', np.arange(100)[:, None], np.arange(2000)[None, :])
+        self.assertGreaterEqual(uniform.min(), 0.0)
+        self.assertLess(uniform.max(), 1.0)
+        self.assertAlmostEqual(uniform.mean(), 0.5, delta=0.002)
+        self.assertAlmostEqual(uniform.var(), 1.0/12.0, delta=0.001)
+
+        normal = rng.normal('test', np.arange(100)[:, None], np.arange(2000)[None, :],
+                            loc=1.0, scale=2.0)
+        self.assertAlmostEqual(normal.mean(), 1.0, delta=0.02)
+        self.assertAlmostEqual(normal.std(), 2.0, delta=0.02)
+        self.assertAlmostEqual(np.mean(((normal-1.0)/2.0)**4), 3.0, delta=0.05)
+
+    def test_legacy(self):
+        """
+        Test that legacy mode reproduces np.random.RandomState
+        """
+        rng = CounterRNG(legacy=True)
+        self.assertTrue(rng.legacy)
+        normal = rng.normal('agn', np.array([[14], [3]]), np.arange(20)[None, :])
+        np.testing.assert_array_equal(normal[0], np.random.RandomState(14).normal(0.0, 1.0, 20))
+        np.testing.assert_array_equal(normal[1], np.random.RandomState(3).normal(0.0, 1.0, 20))
+
+        control = np.random.RandomState(8).uniform(1.0, 3.0, 6)
+        np.testing.assert_array_equal(rng.uniform('sn', 8, [5, 0, 2], low=1.0, high=3.0),
+                                      control[[5, 0, 2]])
+
+        stream = rng.stream('sn', 8)
+        self.assertIsInstance(stream, np.random.RandomState)
+        self.assertEqual(stream.uniform(1.0, 3.0), control[0])
+
+        with self.assertRaises(RuntimeError):
+            rng.random_raw('sn', 8, 0)
+
+
+class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -15,6 +15,11 @@ from lsst.utils.tests import getTempFilePath
 from lsst.sims.catalogs.db import CatalogDBObject
 from lsst.sims.catUtils.mixins import VariabilityStars
 from lsst.sims.catUtils.mixins import MLTflaringMixin
+from lsst.sims.catUtils.mixins import MLTLightCurveStore
+from lsst.sims.catUtils.mixins import convert_mlt_light_curves
+from lsst.sims.catUtils.mixins import create_variability_cache
+from lsst.sims.catUtils.mixins import get_mlt_dust_lookup
+import lsst.sims.catUtils.mixins.VariabilityMixin as VariabilityMixin
 from lsst.sims.catalogs.definitions import InstanceCatalog
 from lsst.sims.catUtils.mixins import PhotometryStars
 from lsst.sims.utils import ObservationMetaData
@@ -396,6 +401,16 @@ class MLT_flare_test_case(unittest.TestCase):
         self.assertEqual(delta_flux_single_time.shape, (6, n_obj))
         np.testing.assert_array_equal(delta_flux_single_time, delta_flux_vector[:,:,3])
 
+        # test writing into a caller-provided buffer
+        d_mag_out = np.zeros((6, n_obj, n_time), dtype=float)
+        delta_mag_buffer = mlt_obj.applyMLTflaring(valid_dex, params, mjd_arr,
+                                                   parallax=parallax,
+                                                   ebv=ebv,
+                                                   quiescent_mags=quiescent_mags,
+                                                   d_mag_out=d_mag_out)
+        self.assertIs(delta_mag_buffer, d_mag_out)
+        np.testing.assert_array_equal(d_mag_out, delta_mag_vector)
+
     def test_MLT_many_mjd_some_invalid(self):
         """
         This test will verify that applyMLTflaring responds properly when given
@@ -621,6 +636,98 @@ class MLT_flare_test_case(unittest.TestCase):
         np.testing.assert_array_equal(test_flux_vector[2],
                                       delta_flux_vector[1])
 
+    def test_mlt_memmap_store(self):
+        """
+        Test that MLT light curves converted into a memory-mapped
+        MLTLightCurveStore give the same flares as the .npz file.
+        """
+        store_dir = os.path.join(self.scratch_dir, 'test_mlt_lc_store')
+        self.assertEqual(convert_mlt_light_curves(self.mlt_lc_name, out_dir=store_dir),
+                         store_dir)
+        self.assertTrue(MLTLightCurveStore.is_store(store_dir))
+
+        store = MLTLightCurveStore(store_dir)
+        with np.load(self.mlt_lc_name) as npz_data:
+            self.assertEqual(sorted(store.files), sorted(npz_data.files))
+            for name in npz_data.files:
+                self.assertIsInstance(store[name], np.memmap)
+                np.testing.assert_array_equal(store[name], npz_data[name])
+        store.close()
+
+        rng = np.random.RandomState(812)
+        mjd_arr = rng.random_sample(13)*3653.3+59580.0
+        n_obj = 4
+        params = {'lc': np.array(['lc_1.txt', 'lc_1.txt', 'lc_2.txt', 'lc_2.txt']),
+                  't0': rng.random_sample(n_obj)*1000.0}
+        parallax = radiansFromArcsec(0.001*(rng.random_sample(n_obj)*10.0+1.0))
+        ebv = rng.random_sample(n_obj)
+        quiescent_mags = {'u': rng.random_sample(n_obj)*4.0+16.0,
+                          'g': rng.random_sample(n_obj)*4.0+16.0}
+
+        mlt_obj = MLTflaringMixin()
+        mlt_obj.photParams = PhotometricParameters()
+        mlt_obj.lsstBandpassDict = BandpassDict.loadTotalBandpassesFromFiles()
+        mlt_obj._actually_calculated_columns = ['delta_lsst_u', 'delta_lsst_g']
+        valid_dex = [np.arange(n_obj, dtype=int)]
+
+        mlt_obj._mlt_lc_file = self.mlt_lc_name
+        npz_cache = create_variability_cache()
+        control_dmag = mlt_obj.applyMLTflaring(valid_dex, params, mjd_arr,
+                                               parallax=parallax, ebv=ebv,
+                                               quiescent_mags=quiescent_mags,
+                                               variability_cache=npz_cache)
+
+        mlt_obj._mlt_lc_file = store_dir
+        store_cache = create_variability_cache()
+        test_dmag = mlt_obj.applyMLTflaring(valid_dex, params, mjd_arr,
+                                            parallax=parallax, ebv=ebv,
+                                            quiescent_mags=quiescent_mags,
+                                            variability_cache=store_cache)
+
+        self.assertIsInstance(store_cache['_MLT_LC_NPZ'], MLTLightCurveStore)
+        np.testing.assert_array_equal(test_dmag, control_dmag)
+        self.assertGreater(np.abs(test_dmag).max(), 0.0)
+
+        # flux grids are memory-mapped, not copied into the cache
+        self.assertGreater(len(store_cache['_MLT_LC_FLUX_CACHE']), 0)
+        for name in store_cache['_MLT_LC_FLUX_CACHE']:
+            self.assertIsInstance(store_cache['_MLT_LC_FLUX_CACHE'][name], np.memmap)
+
+        npz_cache['_MLT_LC_NPZ'].close()
+        store_cache['_MLT_LC_NPZ'].close()
+
+    def test_mlt_dust_lookup_cache(self):
+        """
+        Test that the MLT dust look up table is memoized and
+        stored on disk keyed by the bandpasses and temperature.
+        """
+        cache_dir = os.path.join(self.scratch_dir, 'dust_cache')
+        bp_dict = BandpassDict.loadTotalBandpassesFromFiles()
+        lookup = get_mlt_dust_lookup(bp_dict, cache_dir=cache_dir)
+        self.assertEqual(sorted(lookup.keys()), sorted(['ebv'] + list(bp_dict.keys())))
+        self.assertIs(get_mlt_dust_lookup(bp_dict, cache_dir=cache_dir), lookup)
+
+        cache_files = os.listdir(cache_dir)
+        self.assertEqual(len(cache_files), 1)
+
+        # dust extinction only ever dims the flares
+        for bp in bp_dict.keys():
+            self.assertAlmostEqual(lookup[bp][0], 1.0, 10)
+            self.assertTrue((np.diff(lookup[bp]) < 0.0).all())
+
+        # read the table back from disk
+        VariabilityMixin._MLT_DUST_LOOKUP_MEMO.clear()
+        reloaded = get_mlt_dust_lookup(bp_dict, cache_dir=cache_dir)
+        self.assertIsNot(reloaded, lookup)
+        for name in lookup:
+            np.testing.assert_array_equal(reloaded[name], lookup[name])
+
+        # a different temperature gets a different table
+        hot_lookup = get_mlt_dust_lookup(bp_dict, temperature=20000.0,
+                                         cache_dir=cache_dir)
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+        self.assertFalse(np.array_equal(hot_lookup['u'], lookup['u']))
+
     def test_mlt_clean_up(self):
         """
         Test that the MLT cache is correctly loaded after sims_clean_up is
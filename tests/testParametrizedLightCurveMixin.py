@@ -2,12 +2,16 @@ import unittest
 import tempfile
 import gzip
 import os
+import shutil
 import numpy as np
 
 import lsst.utils.tests
 
 from lsst.sims.catUtils.mixins import ParametrizedLightCurveMixin
 from lsst.sims.catUtils.mixins import VariabilityStars
+from lsst.sims.catUtils.mixins import ParametrizedLightCurveStore
+from lsst.sims.catUtils.mixins import convert_parametrized_light_curves
+from lsst.sims.catUtils.mixins import create_variability_cache
 from lsst.sims.catalogs.definitions import InstanceCatalog
 from lsst.sims.catalogs.db import fileDBObject
 from lsst.sims.utils import ObservationMetaData
@@ -99,6 +103,142 @@ class ParametrizedLightCurve_testCase(unittest.TestCase):
         if os.path.exists(lc_temp_file_name):
             os.unlink(lc_temp_file_name)
 
+    def test_calc_dmag_batch(self):
+        """
+        Test that evaluating many parametrized light curves at once
+        gives the same result as evaluating them one at a time with
+        _calc_dflux(), no matter how small the memory budget
+        """
+        lc_temp_file_name = tempfile.mktemp(prefix='test_calc_dmag_batch',
+                                            suffix='.txt')
+
+        rng = np.random.RandomState(61723)
+        n_c_list = [3, 8, 3, 20]
+        with open(lc_temp_file_name, 'w') as out_file:
+            out_file.write('# a header\n')
+            for i_lc, n_c in enumerate(n_c_list):
+                out_file.write('kplr%d_lc.txt 100 1.0e+02 %d ' % (991000000+i_lc, n_c))
+                for i_c in range(n_c):
+                    out_file.write('%e ' % (1.0/(i_c+1)))
+                out_file.write('%e ' % (100.0+rng.random_sample()*100.0))
+                for i_c in range(n_c):
+                    out_file.write('%.15e %.15e %.15e %.15e %.15e ' %
+                                   (rng.random_sample()*5.0,
+                                    (rng.random_sample()-0.5)*2.0,
+                                    (rng.random_sample()-0.5)*0.1,
+                                    rng.random_sample()*20.0,
+                                    rng.random_sample()*100.0))
+                out_file.write('\n')
+
+        kp = ParametrizedLightCurveMixin()
+        variability_cache = create_variability_cache()
+        kp.load_parametrized_light_curves(lc_temp_file_name,
+                                          variability_cache=variability_cache)
+
+        n_obj = 25
+        lc_id_arr = 991000000 + rng.randint(0, len(n_c_list), size=n_obj)
+        lc_time = rng.random_sample((n_obj, 17))*3000.0
+
+        d_mag_truth = np.zeros((n_obj, 17))
+        for i_obj in range(n_obj):
+            q_flux, d_flux = kp._calc_dflux(lc_id_arr[i_obj], lc_time[i_obj],
+                                            variability_cache=variability_cache)
+            d_mag_truth[i_obj] = -2.5*np.log10(1.0+d_flux/q_flux)
+
+        for max_bytes in (None, 2000, 1):
+            d_mag = kp._calc_dmag_batch(lc_id_arr, lc_time, variability_cache,
+                                        max_bytes=max_bytes)
+            np.testing.assert_array_equal(d_mag, d_mag_truth)
+
+        # the 'recurrence' kernel should stay within its documented
+        # accuracy bound on a uniform time grid (and fall back to the
+        # 'direct' kernel on the non-uniform one above)
+        d_mag = kp._calc_dmag_batch(lc_id_arr, lc_time, variability_cache,
+                                    kernel='recurrence')
+        np.testing.assert_array_equal(d_mag, d_mag_truth)
+
+        expmjd = 59580.0 + np.arange(300)*0.0173
+        for lc_id in np.unique(lc_id_arr):
+            model = variability_cache['_PARAMETRIZED_LC_MODELS'][lc_id]
+            bound = ((np.abs(model['a'])+np.abs(model['b'])) *
+                     ((2*kp.parametrized_lc_reanchor+4)*2.0**-52 +
+                      model['omega']*8.0*2.0**-52*expmjd.max())).sum()
+
+            q_flux, d_flux = kp._calc_dflux(lc_id, expmjd, kernel='direct',
+                                            variability_cache=variability_cache)
+            q_flux, d_flux_rec = kp._calc_dflux(lc_id, expmjd, kernel='recurrence',
+                                                variability_cache=variability_cache)
+            self.assertLess(np.abs(d_flux_rec-d_flux).max(), bound)
+
+        with self.assertRaises(RuntimeError):
+            kp._calc_dmag_batch(lc_id_arr, lc_time, variability_cache,
+                                kernel='not_a_kernel')
+
+        if os.path.exists(lc_temp_file_name):
+            os.unlink(lc_temp_file_name)
+
+    def test_binary_store(self):
+        """
+        Test that light curve models converted into the binary
+        format by convert_parametrized_light_curves() give the same
+        fluxes as the text file they were converted from
+        """
+        scratch_dir = tempfile.mkdtemp(prefix='test_binary_store')
+        lc_temp_file_name = os.path.join(scratch_dir, 'lc_params.txt.gz')
+
+        rng = np.random.RandomState(88123)
+        n_c_list = [7, 1, 12]
+        tag_list = [990000002, 990000000, 990000001]
+        with gzip.open(lc_temp_file_name, 'w') as out_file:
+            out_file.write(b'# a header\n')
+            for tag, n_c in zip(tag_list, n_c_list):
+                out_file.write(b'kplr%d_lc.txt 100 1.0e+02 %d ' % (tag, n_c))
+                for i_c in range(n_c):
+                    out_file.write(b'%e ' % (1.0/(i_c+1)))
+                out_file.write(b'%e ' % (100.0+rng.random_sample()*100.0))
+                for i_c in range(n_c):
+                    out_file.write(b'%.15e %.15e %.15e %.15e %.15e ' %
+                                   (rng.random_sample()*5.0,
+                                    (rng.random_sample()-0.5)*2.0,
+                                    (rng.random_sample()-0.5)*0.1,
+                                    rng.random_sample()*20.0,
+                                    rng.random_sample()*100.0))
+                out_file.write(b'\n')
+
+        kp = ParametrizedLightCurveMixin()
+        text_cache = create_variability_cache()
+        kp.load_parametrized_light_curves(lc_temp_file_name,
+                                          variability_cache=text_cache)
+
+        store_dir = convert_parametrized_light_curves(lc_temp_file_name)
+        self.assertEqual(store_dir, os.path.join(scratch_dir, 'lc_params'))
+
+        store = ParametrizedLightCurveStore(store_dir)
+        self.assertEqual(len(store), 3)
+        np.testing.assert_array_equal(store.tag, np.sort(tag_list))
+        np.testing.assert_array_equal(np.diff(store.offsets), [1, 12, 7])
+        np.testing.assert_array_equal(store.lookup([990000001, 5]), [1, -1])
+
+        # the converted directory should be found next to the text file
+        store_cache = create_variability_cache()
+        kp.load_parametrized_light_curves(lc_temp_file_name,
+                                          variability_cache=store_cache)
+        self.assertEqual(len(store_cache['_PARAMETRIZED_LC_MODELS']), 0)
+        self.assertEqual(len(store_cache['_PARAMETRIZED_LC_STORES']), 1)
+
+        expmjd = rng.random_sample(50)*200.0
+        for tag in tag_list:
+            text_q, text_d = kp._calc_dflux(tag, expmjd, variability_cache=text_cache)
+            store_q, store_d = kp._calc_dflux(tag, expmjd, variability_cache=store_cache)
+            self.assertEqual(text_q, store_q)
+            np.testing.assert_array_equal(text_d, store_d)
+
+        # loading the same light curves twice is an error
+        with self.assertRaises(RuntimeError):
+            kp.load_parametrized_light_curves(store_dir, variability_cache=text_cache)
+
+        shutil.rmtree(scratch_dir)
+
     def test_applyParametrizedLightCurve_singleExpmjd(self):
         """
         test applyParametrizedLightCurve on a single expmjd value
@@ -164,6 +164,88 @@ class StellarVariability_at_many_times_case(unittest.TestCase):
                                      msg='failed on obj %d; band %d; time %d' % (i_star, i_band, i_time))
 
 
+    def test_Cepheid_shared_templates(self):
+        """
+        Test that applyStdPeriodic gives the same answer when several
+        objects (passed as lists of parameters) share a light curve
+        template as when every object is evaluated on its own
+        """
+        rng = np.random.RandomState(6612)
+        lc_files = ['cepheid_lc/classical_longPer_specfile',
+                    'cepheid_lc/classical_medPer_specfile',
+                    'cepheid_lc/popII_shortPer_specfile']
+        lc_period = [60.0, 15.0, 2.5]
+        n_obj = 12
+        i_file_list = rng.randint(0, len(lc_files), size=n_obj)
+        params = {}
+        params['lcfile'] = [lc_files[ii] for ii in i_file_list]
+        params['period'] = [lc_period[ii] for ii in i_file_list]
+        params['t0'] = list(rng.random_sample(n_obj)*1000.0+48000.0)
+        self.assertGreater(n_obj, len(np.unique(i_file_list)))
+
+        array_params = {}
+        for key in params:
+            array_params[key] = np.array(params[key])
+
+        mjd_arr = rng.random_sample(10)*3653.3+59580.0
+        valid_dexes = [np.array([0, 1, 2, 3, 5, 7, 8, 9, 11])]
+
+        dmag_vector = self.star_var.applyCepheid(valid_dexes, params, mjd_arr)
+        self.assertEqual(dmag_vector.shape, (6, n_obj, len(mjd_arr)))
+        np.testing.assert_array_equal(dmag_vector,
+                                      self.star_var.applyCepheid(valid_dexes,
+                                                                 array_params,
+                                                                 mjd_arr))
+
+        for i_obj in range(n_obj):
+            if i_obj not in valid_dexes[0]:
+                np.testing.assert_array_equal(dmag_vector[:, i_obj, :], 0.0)
+                continue
+            dmag_single = self.star_var.applyCepheid([np.array([i_obj])], params, mjd_arr)
+            np.testing.assert_array_equal(dmag_vector[:, i_obj, :],
+                                          dmag_single[:, i_obj, :])
+
+    def test_StdPeriodic_max_dmag(self):
+        """
+        Test the |delta magnitude| bounds of the models evaluated by
+        applyStdPeriodic when their parameters are passed as lists
+        """
+        rng = np.random.RandomState(1181)
+        n_obj = 8
+        valid_dexes = [np.array([0, 1, 3, 4, 6, 7])]
+        mjd_arr = rng.random_sample(2000)*3653.3+59580.0
+
+        rrly_files = ['rrly_lc/RRc/959802_per.txt',
+                      'rrly_lc/RRab/98874_per.txt']
+        rrly_params = {}
+        rrly_params['filename'] = [rrly_files[ii % 2] for ii in range(n_obj)]
+        rrly_params['tStartMjd'] = list(rng.random_sample(n_obj)*1000.0+40000.0)
+
+        cepheid_params = {}
+        cepheid_params['lcfile'] = ['cepheid_lc/classical_longPer_specfile']*n_obj
+        cepheid_params['period'] = [60.0]*n_obj
+        cepheid_params['t0'] = list(rng.random_sample(n_obj)*1000.0+48000.0)
+
+        for apply_method, max_method, params in \
+            ((self.star_var.applyRRly, self.star_var.maxDmagRRly, rrly_params),
+             (self.star_var.applyCepheid, self.star_var.maxDmagCepheid, cepheid_params)):
+
+            array_params = {}
+            for key in params:
+                array_params[key] = np.array(params[key])
+
+            max_dmag = max_method(valid_dexes, params)
+            self.assertEqual(max_dmag.shape, (n_obj,))
+            np.testing.assert_array_equal(max_dmag, max_method(valid_dexes, array_params))
+
+            dmag = apply_method(valid_dexes, params, mjd_arr)
+            for i_obj in range(n_obj):
+                if i_obj in valid_dexes[0]:
+                    self.assertGreater(max_dmag[i_obj], 0.0)
+                    self.assertLessEqual(np.abs(dmag[:, i_obj, :]).max(), max_dmag[i_obj])
+                else:
+                    self.assertEqual(max_dmag[i_obj], 0.0)
+
     def test_Cepeheid_many(self):
         rng = np.random.RandomState(8123)
         params = {}
@@ -338,6 +420,38 @@ class StellarVariability_at_many_times_case(unittest.TestCase):
                     self.assertEqual(dmag_test[i_band][i_obj],
                                      dmag_vector[i_band][i_obj][i_time])
 
+    def test_MicroLens_window(self):
+        """
+        Test that applyMicrolens only neglects the parts of events
+        more than microlens_window_factor*that from their peaks
+        """
+        rng = np.random.RandomState(99125)
+        n_obj = 50
+        that = rng.random_sample(n_obj)*40.0+40.0
+        umin = rng.random_sample(n_obj)
+        params = {}
+        params['that'] = that
+        params['umin'] = umin
+        params['t0'] = rng.random_sample(n_obj)*20000.0+50000.0
+
+        mjd_arr = rng.random_sample(200)*3653.3+59580.0
+        valid_dexes = [np.arange(n_obj, dtype=int)]
+        dmag_vector = self.star_var.applyMicrolens(valid_dexes, params, mjd_arr)
+
+        epochs = mjd_arr[None, :]-params['t0'][:, None]
+        u = np.sqrt(umin[:, None]**2 + (2.0*epochs/that[:, None])**2)
+        dmag_control = -2.5*np.log10((u**2+2.0)/(u*np.sqrt(u**2+4.0)))
+
+        k_window = self.star_var.microlens_window_factor
+        outside = np.abs(epochs) > k_window*that[:, None]
+        self.assertGreater(outside.sum(), 0)
+        self.assertGreater((~outside).sum(), 0)
+        for i_band in range(6):
+            np.testing.assert_array_equal(dmag_vector[i_band][outside], 0.0)
+            np.testing.assert_array_equal(dmag_vector[i_band][~outside],
+                                          dmag_control[~outside])
+        self.assertLess(np.abs(dmag_control[outside]).max(),
+                        2.2/(2.0*k_window)**4)
 
     def test_Amcvn_many(self):
         rng = np.random.RandomState(71242)
@@ -374,8 +488,11 @@ class StellarVariability_at_many_times_case(unittest.TestCase):
             dmag_old = applyAmcvn_original(valid_dexes, params,mjd)
             for i_obj in range(n_obj):
                 for i_band in range(6):
-                    self.assertEqual(dmag_test[i_band][i_obj],
-                                     dmag_old[i_band][i_obj])
+                    # applyAmcvn sums the bursts analytically, so it
+                    # only agrees with the original loop to round-off
+                    self.assertAlmostEqual(dmag_test[i_band][i_obj],
+                                           dmag_old[i_band][i_obj],
+                                           delta=1.0e-10*max(1.0, np.abs(dmag_old[i_band][i_obj])))
                     self.assertEqual(dmag_test[i_band][i_obj],
                                      dmag_vector[i_band][i_obj][i_time])
 
@@ -420,12 +537,59 @@ class StellarVariability_at_many_times_case(unittest.TestCase):
                 for i_band in range(6):
                     if i_obj not in(1,5,6):
                         self.assertEqual(dmag_test[i_band][i_obj], 0.0)
-                    self.assertEqual(dmag_test[i_band][i_obj],
-                                     dmag_old[i_band][i_obj])
+                    # applyAmcvn sums the bursts analytically, so it
+                    # only agrees with the original loop to round-off
+                    self.assertAlmostEqual(dmag_test[i_band][i_obj],
+                                           dmag_old[i_band][i_obj],
+                                           delta=1.0e-10*max(1.0, np.abs(dmag_old[i_band][i_obj])))
                     self.assertEqual(dmag_test[i_band][i_obj],
                                      dmag_vector[i_band][i_obj][i_time])
 
 
+    def test_Amcvn_many_during_bursts(self):
+        """
+        Test applyAmcvn at epochs during which only some of the bursts
+        have begun to contribute
+        """
+        rng = np.random.RandomState(88123)
+        n_obj = 30
+        doesBurst = rng.randint(0, 2, size=n_obj)
+        doesBurst[:3] = 1
+        burst_freq = rng.randint(10, 400, size=n_obj)
+        burst_freq[0] = 4000  # only one burst
+        burst_scale = rng.random_sample(n_obj)*200.0+20.0
+        amp_burst = rng.random_sample(n_obj)*8.0
+        color_excess_during_burst = rng.random_sample(n_obj)*0.2-0.4
+        amplitude = rng.random_sample(n_obj)*0.2
+        period = rng.random_sample(n_obj)*200.0
+        params = {}
+        params['does_burst'] = doesBurst
+        params['burst_freq'] = burst_freq
+        params['burst_scale'] = burst_scale
+        params['amp_burst'] = amp_burst
+        params['color_excess_during_burst'] = color_excess_during_burst
+        params['amplitude'] = amplitude
+        params['period'] = period
+        params['t0'] = 59580.0-rng.random_sample(n_obj)*1000.0
+
+        mjd_arr = rng.random_sample(100)*4500.0+59580.0
+        n_time = len(mjd_arr)
+
+        valid_dexes = [np.arange(n_obj, dtype=int)]
+
+        dmag_vector = self.star_var.applyAmcvn(valid_dexes, params, mjd_arr)
+        self.assertEqual(dmag_vector.shape, (6, n_obj, n_time))
+        for i_time, mjd in enumerate(mjd_arr):
+            dmag_test = self.star_var.applyAmcvn(valid_dexes, params, mjd)
+            dmag_old = applyAmcvn_original(valid_dexes, params, mjd)
+            for i_obj in range(n_obj):
+                for i_band in range(6):
+                    self.assertAlmostEqual(dmag_test[i_band][i_obj],
+                                           dmag_old[i_band][i_obj],
+                                           delta=1.0e-10*max(1.0, np.abs(dmag_old[i_band][i_obj])))
+                    self.assertEqual(dmag_test[i_band][i_obj],
+                                     dmag_vector[i_band][i_obj][i_time])
+
     def test_BHMicrolens_many(self):
         rng = np.random.RandomState(5132)
         params = {}
@@ -484,6 +648,38 @@ class StellarVariability_at_many_times_case(unittest.TestCase):
                     self.assertEqual(dmag_test[i_band][i_obj],
                                      dmag_vector[i_band][i_obj][i_time])
 
+    def test_BHMicrolens_cache(self):
+        """
+        Test that applyBHMicrolens gives the same answer whether or not
+        its light curves come from variabilityLcCache
+        """
+        rng = np.random.RandomState(771)
+        lc_files = ['microlens/bh_binary_source/lc_14_25_75_8000_0_0.05_316',
+                    'microlens/bh_binary_source/lc_14_25_4000_8000_0_phi1.09_0.005_100',
+                    'microlens/bh_binary_source/lc_14_25_75_8000_0_tets2.09_0.005_316']
+        n_obj = 10
+        params = {}
+        params['filename'] = [lc_files[ii] for ii in rng.randint(0, len(lc_files), size=n_obj)]
+        params['t0'] = list(rng.random_sample(n_obj)*10.0+59580.0)
+        mjd_arr = rng.random_sample(12)*4.0+59590.0
+        valid_dexes = [np.array([0, 2, 3, 4, 6, 7, 9])]
+
+        uncached_var = StellarVariabilityModels()
+        uncached_var.initializeVariability(doCache=False)
+        dmag_control = uncached_var.applyBHMicrolens(valid_dexes, params, mjd_arr)
+        self.assertEqual(len(uncached_var.variabilityLcCache), 0)
+
+        cached_var = StellarVariabilityModels()
+        cached_var.initializeVariability(doCache=True)
+        dmag_first = cached_var.applyBHMicrolens(valid_dexes, params, mjd_arr)
+        n_files = len(np.unique(np.array(params['filename'])[valid_dexes[0]]))
+        self.assertEqual(len(cached_var.variabilityLcCache), n_files)
+        dmag_second = cached_var.applyBHMicrolens(valid_dexes, params, mjd_arr)
+
+        self.assertGreater(np.abs(dmag_control).max(), 0.0)
+        np.testing.assert_array_equal(dmag_first, dmag_control)
+        np.testing.assert_array_equal(dmag_second, dmag_control)
+
 
 class AgnVariability_at_many_times_case(unittest.TestCase):
     """
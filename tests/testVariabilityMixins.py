@@ -5,6 +5,7 @@ import unittest
 import numpy as np
 import sqlite3
 import json
+import pickle
 import tempfile
 import shutil
 import lsst.utils.tests
@@ -19,6 +20,11 @@ from lsst.sims.catUtils.mixins import ExtraGalacticVariabilityModels
 from lsst.sims.catUtils.utils import TestVariabilityMixin
 
 from lsst.sims.catUtils.mixins import Variability
+from lsst.sims.catUtils.mixins import VariabilityParamTable
+from lsst.sims.catUtils.mixins import register_variability_model
+from lsst.sims.catUtils.mixins import LightCurveCache
+from lsst.sims.catUtils.mixins import LightCurveCacheBudget
+from lsst.sims.catUtils.mixins import create_variability_cache
 
 VARIABILITY_DB = 'VariabilityTestDatabase.db'
 ROOT = os.path.abspath(os.path.dirname(__file__))
@@ -606,6 +612,251 @@ class VariabilityTest(unittest.TestCase):
 
         self.assertEqual(n_mags, 6*n_obj*n_time)
 
+    def testVariabilityParamTable(self):
+        """
+        Verify that passing a VariabilityParamTable into applyVariability
+        gives the same result as passing in the varParamStr it was built
+        from, and that the table groups the objects by method correctly.
+        """
+        makeHybridTable(database=self.variability_db)
+        hybrid_db = hybridDB(database=self.variability_db)
+        hybrid_cat = StellarVariabilityCatalogWithTest(hybrid_db, obs_metadata=self.obs_metadata,
+                                                       column_outputs=['varParamStr'])
+        varparams = []
+        for line in hybrid_cat.iter_catalog():
+            varparams.append(line[-1])
+        varparams = np.array(varparams)
+
+        param_table = VariabilityParamTable(varparams)
+        self.assertEqual(len(param_table), len(varparams))
+        self.assertEqual(param_table.method_names, ['applyCepheid', 'testVar'])
+
+        n_valid = 0
+        for method_name in param_table.method_names:
+            for ix in param_table.dexes[method_name][0]:
+                n_valid += 1
+                self.assertEqual(json.loads(varparams[ix])['varMethodName'], method_name)
+                self.assertEqual(param_table.params[method_name]['period'][ix],
+                                 json.loads(varparams[ix])['pars']['period'])
+        self.assertEqual(n_valid, len(np.where(varparams != 'None')[0]))
+
+        # parameters are None for objects not using the method
+        not_test = np.ones(len(varparams), dtype=bool)
+        not_test[param_table.dexes['testVar']] = False
+        for period in param_table.params['testVar']['period'][not_test]:
+            self.assertIsNone(period)
+
+        rng = np.random.RandomState(1183)
+        mjd_arr = rng.random_sample(9)*3653.0+59580.0
+
+        control_cat = StellarVariabilityCatalogWithTest(hybrid_db, obs_metadata=self.obs_metadata)
+        control_dmag = control_cat.applyVariability(list(varparams), expmjd=mjd_arr)
+
+        test_cat = StellarVariabilityCatalogWithTest(hybrid_db, obs_metadata=self.obs_metadata)
+        test_dmag = test_cat.applyVariability(param_table, expmjd=mjd_arr)
+        np.testing.assert_array_equal(test_dmag, control_dmag)
+
+        # the parsed table is cached on the catalog and reused for
+        # other views of the same array
+        test_dmag = test_cat.applyVariability(varparams, expmjd=mjd_arr)
+        np.testing.assert_array_equal(test_dmag, control_dmag)
+        cached_table = test_cat._variability_param_table_cache[2]
+        test_dmag = test_cat.applyVariability(varparams[:], expmjd=mjd_arr)
+        np.testing.assert_array_equal(test_dmag, control_dmag)
+        self.assertIs(test_cat._variability_param_table_cache[2], cached_table)
+
+    def testIterVariability(self):
+        """
+        Test that the blocks yielded by iter_variability reassemble into
+        the output of applyVariability, however small the blocks are.
+        """
+        makeHybridTable(database=self.variability_db)
+        hybrid_db = hybridDB(database=self.variability_db)
+        hybrid_cat = StellarVariabilityCatalogWithTest(hybrid_db, obs_metadata=self.obs_metadata,
+                                                       column_outputs=['varParamStr'])
+        varparams = []
+        for line in hybrid_cat.iter_catalog():
+            varparams.append(line[-1])
+        varparams = np.array(varparams)
+
+        rng = np.random.RandomState(815)
+        mjd_arr = rng.random_sample(23)*3653.0+59580.0
+
+        cat = StellarVariabilityCatalogWithTest(hybrid_db, obs_metadata=self.obs_metadata)
+        control_dmag = cat.applyVariability(varparams, expmjd=mjd_arr)
+
+        # applyVariability can write into an existing buffer
+        d_mag_out = np.ones(control_dmag.shape)
+        test_dmag = cat.applyVariability(varparams, expmjd=mjd_arr, d_mag_out=d_mag_out)
+        self.assertIs(test_dmag, d_mag_out)
+        np.testing.assert_array_equal(d_mag_out, control_dmag)
+        with self.assertRaises(RuntimeError):
+            cat.applyVariability(varparams, expmjd=mjd_arr, d_mag_out=np.zeros((6, 2)))
+
+        n_obj = len(varparams)
+        for max_bytes in (None, 48*n_obj*5, 48*7):
+            test_dmag = np.zeros(control_dmag.shape)
+            n_seen = np.zeros(control_dmag.shape[1:], dtype=int)
+            n_blocks = 0
+            for obj_slice, time_slice, d_mag in cat.iter_variability(varparams, mjd_arr,
+                                                                     max_bytes=max_bytes):
+                self.assertLessEqual(d_mag.nbytes, max(max_bytes or d_mag.nbytes, 48))
+                test_dmag[:, obj_slice, time_slice] = d_mag
+                n_seen[obj_slice, time_slice] += 1
+                n_blocks += 1
+            np.testing.assert_array_equal(test_dmag, control_dmag)
+            np.testing.assert_array_equal(n_seen, 1)
+            if max_bytes is not None:
+                self.assertGreater(n_blocks, 1)
+
+    def testVariabilityBands(self):
+        """
+        Test that applyVariability can calculate a subset of the bands
+        in a reduced precision dtype.
+        """
+        makeHybridTable(database=self.variability_db)
+        hybrid_db = hybridDB(database=self.variability_db)
+        hybrid_cat = StellarVariabilityCatalogWithTest(hybrid_db, obs_metadata=self.obs_metadata,
+                                                       column_outputs=['varParamStr'])
+        varparams = []
+        for line in hybrid_cat.iter_catalog():
+            varparams.append(line[-1])
+        varparams = np.array(varparams)
+
+        rng = np.random.RandomState(2231)
+        mjd_arr = rng.random_sample(11)*3653.0+59580.0
+
+        cat = StellarVariabilityCatalogWithTest(hybrid_db, obs_metadata=self.obs_metadata)
+        control_dmag = cat.applyVariability(varparams, expmjd=mjd_arr)
+
+        for bands in ('r', 'zg', ['u', 'y', 'i']):
+            band_dexes = ['ugrizy'.index(bp) for bp in bands]
+            test_dmag = cat.applyVariability(varparams, expmjd=mjd_arr, bands=bands)
+            np.testing.assert_array_equal(test_dmag, control_dmag[band_dexes])
+
+            test_dmag = cat.applyVariability(varparams, expmjd=mjd_arr[4], bands=bands)
+            np.testing.assert_array_equal(test_dmag, control_dmag[band_dexes, :, 4])
+
+        test_dmag = cat.applyVariability(varparams, expmjd=mjd_arr, bands='gi',
+                                         dtype=np.float32)
+        self.assertEqual(test_dmag.dtype, np.float32)
+        np.testing.assert_allclose(test_dmag, control_dmag[[1, 3]], rtol=1.0e-6, atol=1.0e-6)
+
+        for obj_slice, time_slice, d_mag in cat.iter_variability(varparams, mjd_arr, bands='gi',
+                                                                 dtype=np.float32,
+                                                                 max_bytes=200):
+            self.assertEqual(d_mag.dtype, np.float32)
+            np.testing.assert_array_equal(d_mag, test_dmag[:, obj_slice, time_slice])
+
+        with self.assertRaises(RuntimeError):
+            cat.applyVariability(varparams, expmjd=mjd_arr, bands='rx')
+
+    def testMethodRegistry(self):
+        """
+        Test that the registry of variability models is built when the
+        catalog class is defined, and that models registered with
+        register_variability_model are available to all catalogs.
+        """
+        self.assertIn('testVar', StellarVariabilityCatalogWithTest._methodRegistry)
+        self.assertIn('applyCepheid', StellarVariabilityCatalogWithTest._methodRegistry)
+        self.assertNotIn('testVar', StellarVariabilityCatalog._methodRegistry)
+        with self.assertRaises(TypeError):
+            StellarVariabilityCatalog._methodRegistry['testVar'] = None
+
+        def registry_test_model(catalog, valid_dexes, params, expmjd,
+                                variability_cache=None):
+            if len(params) == 0:
+                return np.array([[], [], [], [], [], []])
+            dmag = np.zeros((6, catalog.num_variable_obj(params)))
+            for ix in valid_dexes[0]:
+                dmag[:, ix] = params['amp'][ix]*np.sin(expmjd)
+            return dmag
+
+        register_variability_model('registryTestModel', registry_test_model)
+
+        # registering the same model twice is harmless; registering a
+        # different model under the same key is an error
+        register_variability_model('registryTestModel', registry_test_model)
+        with self.assertRaises(RuntimeError):
+            register_variability_model('registryTestModel', lambda *args: None)
+
+        makeHybridTable(database=self.variability_db)
+        hybrid_db = hybridDB(database=self.variability_db)
+        cat = StellarVariabilityCatalog(hybrid_db, obs_metadata=self.obs_metadata)
+        varparams = [json.dumps({'m': 'registryTestModel', 'p': {'amp': 1.5}}),
+                     'None',
+                     json.dumps({'m': 'registryTestModel', 'p': {'amp': 0.5}})]
+        dmag = cat.applyVariability(varparams, expmjd=60000.0)
+        for i_band in range(6):
+            self.assertAlmostEqual(dmag[i_band][0], 1.5*np.sin(60000.0), 10)
+            self.assertEqual(dmag[i_band][1], 0.0)
+            self.assertAlmostEqual(dmag[i_band][2], 0.5*np.sin(60000.0), 10)
+
+    def testMaxAbsDmag(self):
+        """
+        Test that the bounds returned by max_abs_dmag are never exceeded
+        and that applyVariability with a dmag_cutoff only skips objects
+        which could not have varied by that much.
+        """
+        rng = np.random.RandomState(7123)
+        n_obj = 200
+        varparams = []
+        for i_obj in range(n_obj):
+            if i_obj % 3 == 0:
+                varparams.append(json.dumps({'m': 'applyMicrolens',
+                                             'p': {'that': rng.random_sample()*50.0+10.0,
+                                                   'umin': rng.random_sample()*5.0+0.05,
+                                                   't0': 60000.0+rng.random_sample()*20.0}}))
+            elif i_obj % 3 == 1:
+                varparams.append(json.dumps({'m': 'applyAmcvn',
+                                             'p': {'does_burst': int(rng.randint(0, 2)),
+                                                   'burst_freq': int(rng.randint(10, 150)),
+                                                   'burst_scale': 115.0,
+                                                   'amp_burst': rng.random_sample()*0.5,
+                                                   'color_excess_during_burst': rng.random_sample()*0.2-0.4,
+                                                   'amplitude': rng.random_sample()*0.01,
+                                                   'period': rng.random_sample()*0.1,
+                                                   't0': 59950.0+rng.random_sample()*20.0}}))
+            else:
+                varparams.append('None')
+
+        makeHybridTable(database=self.variability_db)
+        hybrid_db = hybridDB(database=self.variability_db)
+        cat = StellarVariabilityCatalog(hybrid_db, obs_metadata=self.obs_metadata)
+
+        mjd_arr = 59950.0 + np.arange(0.0, 100.0, 0.05)
+        control_dmag = cat.applyVariability(varparams, expmjd=mjd_arr)
+        max_dmag = cat.max_abs_dmag(varparams)
+        self.assertEqual(max_dmag.shape, (n_obj,))
+        np.testing.assert_array_less(np.abs(control_dmag).max(axis=(0, 2)), max_dmag+1.0e-10)
+        self.assertTrue(np.all(max_dmag[2::3] == 0.0))
+
+        # the microlensing bound is reached at t0
+        self.assertLess(np.abs(np.abs(control_dmag[0][::3]).max(axis=1)/max_dmag[::3]-1.0).max(), 0.01)
+
+        dmag_cutoff = 0.3
+        self.assertGreater(len(np.where(max_dmag < dmag_cutoff)[0]), n_obj//3)
+        self.assertGreater(len(np.where(max_dmag >= dmag_cutoff)[0]), 0)
+        test_dmag = cat.applyVariability(varparams, expmjd=mjd_arr, dmag_cutoff=dmag_cutoff)
+        self.assertEqual(test_dmag.shape, control_dmag.shape)
+        for i_obj in range(n_obj):
+            if max_dmag[i_obj] >= dmag_cutoff:
+                np.testing.assert_array_equal(test_dmag[:, i_obj], control_dmag[:, i_obj])
+            else:
+                np.testing.assert_array_equal(test_dmag[:, i_obj], 0.0)
+
+        # drop_objects leaves the table's shape alone
+        param_table = VariabilityParamTable(varparams)
+        dropped_table = param_table.drop_objects(np.arange(0, n_obj, 2))
+        self.assertEqual(len(dropped_table), n_obj)
+        for method_name in dropped_table.method_names:
+            np.testing.assert_array_equal(dropped_table.dexes[method_name][0] % 2, 1)
+            for i_obj in dropped_table.dexes[method_name][0]:
+                self.assertEqual(dropped_table.params[method_name]['t0'][i_obj],
+                                 param_table.params[method_name]['t0'][i_obj])
+            for i_obj in range(0, n_obj, 2):
+                self.assertIsNone(dropped_table.params[method_name]['t0'][i_obj])
+
     def testRRlyrae(self):
         cat_name = os.path.join(self.scratch_dir, 'rrlyTestCatalog.dat')
         makeRRlyTable(database=self.variability_db)
@@ -717,6 +968,152 @@ class VariabilityTest(unittest.TestCase):
             os.unlink(cat_name)
 
 
+class LightCurveCacheTest(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        """
+        Test that LightCurveCache evicts the least recently used
+        entries to stay within its memory budget and keeps count
+        of hits, misses and evictions.
+        """
+        arr_size = np.zeros(100, dtype=float).nbytes
+        cache = LightCurveCache(max_bytes=3*arr_size)
+        cache['a'] = np.zeros(100, dtype=float)
+        cache['b'] = {'splines': np.ones(100, dtype=float), 'period': 2.0}
+        cache['c'] = np.ones(50, dtype=float)
+        self.assertEqual(len(cache), 3)
+        self.assertLessEqual(cache.nbytes, 3*arr_size)
+
+        # touch 'a' so that 'b' is the least recently used entry
+        np.testing.assert_array_equal(cache['a'], np.zeros(100))
+        cache['d'] = np.ones(100, dtype=float)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertIn('d', cache)
+        self.assertEqual(cache.evictions, 1)
+        self.assertLessEqual(cache.nbytes, 3*arr_size)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+        # an entry bigger than the whole budget is still stored,
+        # but pushes everything else out
+        cache['e'] = np.zeros(1000, dtype=float)
+        self.assertEqual(cache.keys(), ['e'])
+        self.assertEqual(cache.evictions, 4)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.nbytes, 0)
+
+        # an unbounded cache never evicts
+        cache = LightCurveCache(max_bytes=None)
+        for ii in range(20):
+            cache[ii] = np.zeros(1000)
+        self.assertEqual(len(cache), 20)
+        self.assertEqual(cache.evictions, 0)
+
+    def test_shared_budget(self):
+        """
+        Test that LightCurveCaches sharing a LightCurveCacheBudget
+        stay within it together, evicting the least recently used
+        entries of any of them
+        """
+        arr_size = np.zeros(100, dtype=float).nbytes
+        budget = LightCurveCacheBudget(max_bytes=3*arr_size)
+        cache_1 = LightCurveCache(budget=budget)
+        cache_2 = LightCurveCache(budget=budget)
+        self.assertEqual(cache_1.max_bytes, 3*arr_size)
+
+        cache_1['a'] = np.zeros(100, dtype=float)
+        cache_2['a'] = np.zeros(100, dtype=float)
+        cache_1['b'] = np.zeros(100, dtype=float)
+        self.assertEqual(budget.nbytes, cache_1.nbytes+cache_2.nbytes)
+        self.assertLessEqual(budget.nbytes, 3*arr_size)
+
+        # touch cache_1['a'] so that cache_2['a'] is the least recently used
+        cache_1['a']
+        cache_2['c'] = np.zeros(100, dtype=float)
+        self.assertEqual(cache_1.keys(), ['b', 'a'])
+        self.assertEqual(cache_2.keys(), ['c'])
+        self.assertEqual(cache_1.evictions, 0)
+        self.assertEqual(cache_2.evictions, 1)
+        self.assertLessEqual(budget.nbytes, 3*arr_size)
+
+        cache_1['d'] = np.zeros(100, dtype=float)
+        self.assertEqual(cache_1.keys(), ['a', 'd'])
+        self.assertEqual(cache_1.evictions, 1)
+
+        # clearing a cache, or deleting it, returns its memory to the budget
+        cache_1.clear()
+        self.assertEqual(budget.nbytes, arr_size)
+        del cache_2
+        self.assertEqual(budget.nbytes, 0)
+
+        # the caches of a variability cache share one budget
+        var_cache = create_variability_cache(lc_cache_budget=budget)
+        self.assertIs(var_cache['_MLT_LC_FLUX_CACHE'].budget, budget)
+        self.assertIs(var_cache['_PARAMETRIZED_LC_COEFF_CACHE'].budget, budget)
+
+        # by default, so do the caches of every Variability instance
+        # and variability cache in the process
+        var_1 = Variability()
+        var_1.initializeVariability()
+        var_2 = Variability()
+        var_2.initializeVariability()
+        self.assertIs(var_1.variabilityLcCache.budget,
+                      var_2.variabilityLcCache.budget)
+        self.assertIs(create_variability_cache()['_MLT_LC_TIME_CACHE'].budget,
+                      var_1.variabilityLcCache.budget)
+
+    def test_pickle(self):
+        """
+        Test that LightCurveCaches (and variability caches containing
+        them) survive being pickled, e.g. to be sent to another process
+        """
+        arr_size = np.zeros(100, dtype=float).nbytes
+        budget = LightCurveCacheBudget(max_bytes=3*arr_size)
+        cache_1 = LightCurveCache(budget=budget)
+        cache_2 = LightCurveCache(budget=budget)
+        cache_1['a'] = np.zeros(100, dtype=float)
+        cache_1['b'] = np.ones(100, dtype=float)
+        cache_2['a'] = np.arange(100, dtype=float)
+        cache_1['a']
+        self.assertIsNone(cache_2.get('b'))
+
+        new_1, new_2 = pickle.loads(pickle.dumps((cache_1, cache_2)))
+        self.assertEqual(new_1.keys(), ['b', 'a'])
+        self.assertEqual(new_2.keys(), ['a'])
+        np.testing.assert_array_equal(new_1['b'], cache_1['b'])
+        np.testing.assert_array_equal(new_2['a'], cache_2['a'])
+        self.assertEqual(new_2.misses, 1)
+
+        # the unpickled caches still share a budget, but not the original one
+        self.assertIs(new_1.budget, new_2.budget)
+        self.assertIsNot(new_1.budget, budget)
+        self.assertEqual(new_1.max_bytes, 3*arr_size)
+        self.assertEqual(new_1.budget.nbytes, new_1.nbytes+new_2.nbytes)
+        self.assertEqual(budget.nbytes, cache_1.nbytes+cache_2.nbytes)
+
+        # new_1['a'] is now the least recently used entry of the new budget
+        new_2['c'] = np.zeros(100, dtype=float)
+        self.assertEqual(new_1.keys(), ['b'])
+        self.assertIn('a', cache_1)
+
+        # a variability cache keeps sharing the process-wide budget
+        var_cache = create_variability_cache()
+        var_cache['_MLT_LC_TIME_CACHE']['lc'] = np.zeros(100, dtype=float)
+        new_var_cache = pickle.loads(pickle.dumps(var_cache))
+        new_time_cache = new_var_cache['_MLT_LC_TIME_CACHE']
+        self.assertIs(new_time_cache.budget, Variability.variability_lc_cache_budget)
+        self.assertIs(new_var_cache['_LC_CACHE_BUDGET'], Variability.variability_lc_cache_budget)
+        np.testing.assert_array_equal(new_time_cache['lc'], np.zeros(100))
+        var_cache['_MLT_LC_TIME_CACHE'].clear()
+        new_time_cache.clear()
+
+
 class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
     pass
 
@@ -1,14 +1,34 @@
 import numpy as np
+import json
 import unittest
 import lsst.utils.tests
 
 from lsst.sims.catUtils.mixins import VariabilityAGN
+from lsst.sims.catUtils.mixins import CounterRNG
+from lsst.sims.catUtils.mixins.VariabilityMixin import _simulate_agn_batch
 
 
 def setup_module(module):
     lsst.utils.tests.init()
 
 
+class SparseAgnCatalog(VariabilityAGN):
+    """
+    A stand-in for an InstanceCatalog of AGN simulated with
+    the sparse random walk
+    """
+
+    _agn_sparse_walk = True
+
+    def __init__(self, redshift):
+        self._redshift = redshift
+
+    def column_by_name(self, column_name):
+        if column_name != 'redshift':
+            raise RuntimeError('no column %s' % column_name)
+        return self._redshift
+
+
 class AgnModelTestCase(unittest.TestCase):
 
     longMessage = True
@@ -241,6 +261,8 @@ class AgnModelTestCase(unittest.TestCase):
         agn_obj = VariabilityAGN()
         agn_obj_2 = VariabilityAGN()
         agn_obj_2._agn_threads = 4
+        # shut down the worker processes even if the test fails
+        self.addCleanup(agn_obj_2.close_agn_pool)
         self.assertEqual(agn_obj._agn_threads, 1)
         self.assertNotEqual(agn_obj._agn_threads, agn_obj_2._agn_threads)
 
@@ -280,6 +302,277 @@ class AgnModelTestCase(unittest.TestCase):
 
         np.testing.assert_array_equal(dmag_control, dmag_threaded)
 
+    def test_batch_simulation(self):
+        """
+        Test that simulating a batch of AGN at once gives exactly the
+        same light curves as simulating them one at a time
+        """
+        agn_obj = VariabilityAGN()
+        rng = np.random.RandomState(8812)
+        n_agn = 17
+        tau_arr = rng.random_sample(n_agn)*10.0+1.0
+        time_dilation_arr = rng.random_sample(n_agn)*2.0+1.1
+        sf_u_arr = rng.random_sample(n_agn)*2.0+0.1
+        seed_arr = rng.randint(2, high=100, size=n_agn)
+
+        mjd_list = [61923.5,
+                    59580.0+rng.random_sample(13)*2000.0,
+                    np.sort(59580.0+rng.random_sample(13)*2000.0)]
+
+        for mjd in mjd_list:
+            control = np.array([agn_obj._simulate_agn(mjd, tau, dilation, sf_u, seed)
+                                for tau, dilation, sf_u, seed in
+                                zip(tau_arr, time_dilation_arr, sf_u_arr, seed_arr)])
+
+            # use a small max_bytes to force the walk to be simulated
+            # in many blocks
+            for max_bytes in (2**26, 2000):
+                test = _simulate_agn_batch(mjd, agn_obj._agn_walk_start_date,
+                                           tau_arr, time_dilation_arr,
+                                           sf_u_arr, seed_arr,
+                                           max_bytes=max_bytes)
+
+                np.testing.assert_array_equal(control, test)
+
+    def test_pooled_simulation(self):
+        """
+        Test that simulating AGN with the worker pool gives exactly the
+        same light curves as simulating them in this process, whether or
+        not the pool already exists and however many workers it has
+        """
+        agn_obj = VariabilityAGN()
+        self.addCleanup(agn_obj.close_agn_pool)
+        rng = np.random.RandomState(4471)
+        n_agn = 37
+        tau_arr = rng.random_sample(n_agn)*10.0+1.0
+        time_dilation_arr = rng.random_sample(n_agn)*2.0+1.1
+        sf_u_arr = rng.random_sample(n_agn)*2.0+0.1
+        seed_arr = rng.randint(2, high=100000, size=n_agn)
+
+        mjd_list = [61923.5, 59580.0+rng.random_sample(13)*2000.0]
+
+        for variability_rng in (agn_obj.variability_rng, CounterRNG(seed=81)):
+            agn_obj.variability_rng = variability_rng
+            for mjd in mjd_list:
+                control = _simulate_agn_batch(mjd, agn_obj._agn_walk_start_date,
+                                              tau_arr, time_dilation_arr,
+                                              sf_u_arr, seed_arr,
+                                              rng=variability_rng)
+                for n_threads in (2, 2, 3):
+                    agn_obj._agn_threads = n_threads
+                    test = agn_obj._pooled_simulate_agn(mjd, tau_arr,
+                                                        time_dilation_arr,
+                                                        sf_u_arr, seed_arr)
+                    self.assertEqual(agn_obj._agn_pool_size, n_threads)
+                    np.testing.assert_array_equal(control, test)
+
+        agn_obj.close_agn_pool()
+        self.assertIsNone(agn_obj._agn_pool)
+
+    def test_counter_rng(self):
+        """
+        Test that, when the AGN draw their random walks from a counter-based
+        CounterRNG, the light curve of each AGN does not depend on which
+        other AGN or dates are simulated with it, on batching or on threading
+        """
+        agn_obj = VariabilityAGN()
+        agn_obj.variability_rng = CounterRNG(seed=17)
+        self.assertTrue(VariabilityAGN.variability_rng.legacy)
+
+        rng = np.random.RandomState(5512)
+        n_agn = 13
+        redshift = rng.random_sample(n_agn)*2.0+0.1
+        agn_params = {}
+        agn_params['agn_tau'] = rng.random_sample(n_agn)*10.0+1.0
+        for bp in 'ugrizy':
+            agn_params['agn_sf%s' % bp] = rng.random_sample(n_agn)*2.0+0.1
+        agn_params['seed'] = rng.randint(2, high=100000, size=n_agn)
+        mjd = 59580.0+rng.random_sample(11)*2000.0
+
+        all_agn = [np.arange(n_agn, dtype=int)]
+        dmag_control = agn_obj.applyAgn(all_agn, agn_params, mjd,
+                                        redshift=redshift)
+
+        # a different realization from the legacy random walks
+        dmag_legacy = VariabilityAGN().applyAgn(all_agn, agn_params, mjd,
+                                                redshift=redshift)
+        self.assertGreater(np.abs(dmag_control-dmag_legacy).max(), 0.01)
+
+        # a subset of the AGN and of the dates in a different order
+        subset = [np.array([11, 2, 7])]
+        mjd_subset = mjd[[9, 3, 4]]
+        dmag_subset = agn_obj.applyAgn(subset, agn_params, mjd_subset,
+                                       redshift=redshift)
+        np.testing.assert_array_equal(dmag_subset[:, subset[0], :],
+                                      dmag_control[:, subset[0], :][:, :, [9, 3, 4]])
+
+        # one AGN at a time, in small blocks
+        for i_agn in range(n_agn):
+            control = agn_obj._simulate_agn(mjd, agn_params['agn_tau'][i_agn],
+                                            1.0+redshift[i_agn],
+                                            agn_params['agn_sfu'][i_agn],
+                                            agn_params['seed'][i_agn])
+            np.testing.assert_array_equal(control, dmag_control[0][i_agn])
+
+        test = _simulate_agn_batch(mjd, agn_obj._agn_walk_start_date,
+                                   agn_params['agn_tau'], 1.0+redshift,
+                                   agn_params['agn_sfu'], agn_params['seed'],
+                                   max_bytes=2000, rng=agn_obj.variability_rng)
+        np.testing.assert_array_equal(test, dmag_control[0])
+
+        agn_obj._agn_threads = 3
+        self.addCleanup(agn_obj.close_agn_pool)
+        dmag_threaded = agn_obj.applyAgn(all_agn, agn_params, mjd,
+                                         redshift=redshift)
+        np.testing.assert_array_equal(dmag_threaded, dmag_control)
+
+    def test_sparse_walk(self):
+        """
+        Test that the light curves produced by sampling the AGN random walk
+        only at the observation dates are statistically equivalent to those
+        produced by simulating the walk on a dense time grid
+        """
+        agn_dense = VariabilityAGN()
+        agn_sparse = VariabilityAGN()
+        agn_sparse._agn_sparse_walk = True
+        self.assertFalse(agn_dense._agn_sparse_walk)
+
+        rng = np.random.RandomState(771)
+        n_agn = 1000
+        agn_params = {}
+        agn_params['seed'] = np.arange(n_agn, dtype=int)+11
+        agn_params['agn_tau'] = 20.0*np.ones(n_agn)
+        agn_params['agn_sfu'] = 1.5*np.ones(n_agn)
+        for bp in 'grizy':
+            agn_params['agn_sf%s' % bp] = rng.random_sample(n_agn)+0.5
+
+        redshift = 0.3*np.ones(n_agn)
+        time_dilation = 1.3
+
+        # space the observations well apart relative to the time step of
+        # the dense random walk (tau/100), which linearly interpolates
+        # between its steps
+        mjd = 59580.0+np.arange(60)*17.3
+        rng.shuffle(mjd)
+
+        dmag_dense = agn_dense.applyAgn([np.arange(n_agn, dtype=int)],
+                                        agn_params, mjd, redshift=redshift)
+        dmag_sparse = agn_sparse.applyAgn([np.arange(n_agn, dtype=int)],
+                                          agn_params, mjd, redshift=redshift)
+
+        self.assertEqual(dmag_sparse.shape, (6, n_agn, len(mjd)))
+        for i_bp, bp in enumerate('grizy'):
+            np.testing.assert_allclose(dmag_sparse[i_bp+1],
+                                       dmag_sparse[0]*agn_params['agn_sf%s' % bp][:, None]/1.5,
+                                       rtol=1.0e-12)
+
+        # the sparse walk must actually be a different realization
+        self.assertGreater(np.abs(dmag_dense[0]-dmag_sparse[0]).max(), 0.1)
+
+        # compare the ensemble mean and variance at each epoch
+        for dmag in (dmag_dense[0], dmag_sparse[0]):
+            stdev = dmag.std(axis=0)
+            np.testing.assert_allclose(stdev, 1.5/np.sqrt(2.0), rtol=0.1)
+            self.assertLess(np.abs(dmag.mean(axis=0)).max(), 5.0*stdev.max()/np.sqrt(n_agn))
+
+        # compare the structure functions of the two sets of light curves
+        # at several time lags
+        sorted_dex = np.argsort(mjd)
+        dense_sorted = dmag_dense[0][:, sorted_dex]
+        sparse_sorted = dmag_sparse[0][:, sorted_dex]
+        for lag in (1, 2, 5, 20):
+            delta_t = 17.3*lag/time_dilation
+            sf_th = 1.5*np.sqrt(1.0-np.exp(-delta_t/20.0))
+            sf_dense = np.sqrt(np.mean((dense_sorted[:, lag:]-dense_sorted[:, :-lag])**2))
+            sf_sparse = np.sqrt(np.mean((sparse_sorted[:, lag:]-sparse_sorted[:, :-lag])**2))
+            self.assertLess(np.abs(1.0-sf_dense/sf_th), 0.05)
+            self.assertLess(np.abs(1.0-sf_sparse/sf_th), 0.05)
+            self.assertLess(np.abs(1.0-sf_sparse/sf_dense), 0.05)
+
+    def test_sparse_walk_split(self):
+        """
+        Test that the sparse AGN light curves do not depend on which
+        dates are requested together
+        """
+        rng = np.random.RandomState(4412)
+        n_agn = 20
+        agn_params = {}
+        agn_params['seed'] = rng.randint(0, 2**30, size=n_agn)
+        agn_params['agn_tau'] = rng.random_sample(n_agn)*300.0+5.0
+        agn_params['agn_sfu'] = rng.random_sample(n_agn)+0.5
+        for bp in 'grizy':
+            agn_params['agn_sf%s' % bp] = rng.random_sample(n_agn)+0.5
+        redshift = rng.random_sample(n_agn)*3.0
+        valid_dexes = [np.arange(n_agn, dtype=int)]
+
+        mjd = 59580.0+rng.random_sample(40)*3653.0
+        mjd[5] = mjd[4]+0.001
+
+        for variability_rng in (CounterRNG(legacy=True), CounterRNG(seed=17)):
+            agn_obj = VariabilityAGN()
+            agn_obj._agn_sparse_walk = True
+            agn_obj.variability_rng = variability_rng
+
+            full = agn_obj.applyAgn(valid_dexes, agn_params, mjd, redshift=redshift)
+            self.assertGreater(np.abs(full).min(axis=1).max(), 0.0)
+            for i_split in (1, 20, 39):
+                early = agn_obj.applyAgn(valid_dexes, agn_params, mjd[:i_split],
+                                         redshift=redshift)
+                late = agn_obj.applyAgn(valid_dexes, agn_params, mjd[i_split:],
+                                        redshift=redshift)
+                np.testing.assert_array_equal(early, full[:, :, :i_split])
+                np.testing.assert_array_equal(late, full[:, :, i_split:])
+
+            shuffled = rng.permutation(len(mjd))
+            np.testing.assert_array_equal(agn_obj.applyAgn(valid_dexes, agn_params,
+                                                           mjd[shuffled], redshift=redshift),
+                                          full[:, :, shuffled])
+
+            single = agn_obj.applyAgn(valid_dexes, agn_params, mjd[11], redshift=redshift)
+            np.testing.assert_array_equal(single, full[:, :, 11])
+
+    def test_iter_variability_sparse_walk(self):
+        """
+        Test that iter_variability reproduces applyVariability for
+        the sparse AGN random walk when the dates are split into blocks
+        """
+        rng = np.random.RandomState(6623)
+        n_agn = 15
+        varparams = []
+        for i_agn in range(n_agn):
+            if i_agn % 4 == 3:
+                varparams.append('None')
+                continue
+            agn_params = {'seed': int(rng.randint(0, 2**30)),
+                          'agn_tau': rng.random_sample()*300.0+5.0}
+            for bp in 'ugrizy':
+                agn_params['agn_sf%s' % bp] = rng.random_sample()+0.5
+            varparams.append(json.dumps({'m': 'applyAgn', 'p': agn_params}))
+        varparams = np.array(varparams)
+        redshift = rng.random_sample(n_agn)*3.0
+        mjd = 59580.0+rng.random_sample(30)*3653.0
+
+        class TimeCoupledAgnCatalog(SparseAgnCatalog):
+            variability_time_coupled_models = frozenset(['applyAgn'])
+
+        for cat_class in (SparseAgnCatalog, TimeCoupledAgnCatalog):
+            cat = cat_class(redshift)
+            control = cat.applyVariability(varparams, expmjd=mjd)
+            self.assertGreater(np.abs(control).max(), 0.0)
+
+            for max_bytes in (48*n_agn*7, 48*3):
+                test = np.zeros(control.shape)
+                time_block_starts = set()
+                for obj_slice, time_slice, d_mag in cat.iter_variability(varparams, mjd,
+                                                                         max_bytes=max_bytes):
+                    test[:, obj_slice, time_slice] = d_mag
+                    time_block_starts.add(time_slice.start)
+                    if cat_class is TimeCoupledAgnCatalog:
+                        self.assertEqual(time_slice, slice(0, len(mjd)))
+                np.testing.assert_array_equal(test, control)
+                if cat_class is SparseAgnCatalog:
+                    self.assertGreater(len(time_block_starts), 1)
+
 
 class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
     pass
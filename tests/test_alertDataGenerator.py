@@ -18,6 +18,9 @@ from lsst.sims.catUtils.utils import ObservationMetaDataGenerator
 from lsst.sims.catUtils.utils import AlertStellarVariabilityCatalog
 from lsst.sims.catUtils.utils import AlertDataGenerator
 from lsst.sims.catUtils.utils import StellarAlertDBObjMixin
+from lsst.sims.catUtils.utils import SqliteAlertDataBackend
+from lsst.sims.catUtils.utils.alertDataGenerator import _photometrically_variable
+from lsst.sims.catUtils.utils.alertDataGenerator import _detectably_variable
 
 from lsst.sims.utils import applyProperMotion
 from lsst.sims.utils import ModifiedJulianDate
@@ -344,6 +347,105 @@ class AlertDataGeneratorTestCase(unittest.TestCase):
                                             dmag_cutoff=dmag_cutoff,
                                             log_file_name=log_file_name)
 
+        # verify that alert_data_from_htmid_list produces the same output
+        # using a pool of worker processes
+        pool_output_dir = tempfile.mkdtemp(dir=ROOT, prefix='alert_gen_pool_output')
+        pool_log_file_name = os.path.join(pool_output_dir, 'pool_log.txt')
+        n_rows_dict = alert_gen.alert_data_from_htmid_list(alert_gen.htmid_list,
+                                                           StarAlertTestDBObj,
+                                                           dbobj_kwargs={'database': self.star_db_name,
+                                                                         'driver': 'sqlite'},
+                                                           n_processes=2,
+                                                           photometry_class=TestAlertsVarCat,
+                                                           output_prefix='alert_test',
+                                                           output_dir=pool_output_dir,
+                                                           dmag_cutoff=dmag_cutoff,
+                                                           log_file_name=pool_log_file_name)
+
+        self.assertEqual(set(n_rows_dict), set(alert_gen.htmid_list))
+        with open(pool_log_file_name, 'r') as in_file:
+            pool_log = in_file.read()
+        for htmid in alert_gen.htmid_list:
+            self.assertIn('done with htmid %d' % htmid, pool_log)
+            control_name = os.path.join(self.output_dir, 'alert_test_%d_sqlite.db' % htmid)
+            test_name = os.path.join(pool_output_dir, 'alert_test_%d_sqlite.db' % htmid)
+            for table_name in ('alert_data', 'metadata', 'quiescent_flux', 'baseline_astrometry'):
+                query = 'SELECT * FROM %s' % table_name
+                with sqlite3.connect(control_name) as conn:
+                    control_rows = sorted(conn.execute(query).fetchall())
+                with sqlite3.connect(test_name) as conn:
+                    test_rows = sorted(conn.execute(query).fetchall())
+                self.assertEqual(test_rows, control_rows)
+                if table_name == 'alert_data':
+                    self.assertEqual(n_rows_dict[htmid], len(test_rows))
+        shutil.rmtree(pool_output_dir)
+
+        # verify that an interrupted simulation can be resumed
+        # from its last checkpoint
+        resume_output_dir = tempfile.mkdtemp(dir=ROOT, prefix='alert_gen_resume_output')
+        resume_kwargs = {'photometry_class': TestAlertsVarCat,
+                         'output_prefix': 'alert_test',
+                         'output_dir': resume_output_dir,
+                         'dmag_cutoff': dmag_cutoff,
+                         'chunk_size': 1,
+                         'write_every': 1,
+                         'log_file_name': os.path.join(resume_output_dir, 'resume_log.txt')}
+
+        n_writes = [0]
+
+        def interrupted_output(backend, data_cache):
+            n_writes[0] += 1
+            if n_writes[0] > 1:
+                raise RuntimeError('simulated interruption')
+            return AlertDataGenerator._output_alert_data(alert_gen, backend, data_cache)
+
+        htmid = alert_gen.htmid_list[0]
+        alert_gen._output_alert_data = interrupted_output
+        with self.assertRaises(RuntimeError):
+            alert_gen.alert_data_from_htmid(htmid, star_db, **resume_kwargs)
+        del alert_gen._output_alert_data
+
+        backend = SqliteAlertDataBackend(resume_output_dir, 'alert_test', htmid)
+        journal = backend.read_journal()
+        self.assertFalse(journal['complete'])
+        self.assertGreater(journal['i_chunk'], 0)
+
+        with self.assertRaises(RuntimeError):
+            bad_kwargs = dict(resume_kwargs)
+            bad_kwargs['dmag_cutoff'] = 2.0*dmag_cutoff
+            alert_gen.alert_data_from_htmid(htmid, star_db, resume=True, **bad_kwargs)
+
+        # the simulation cannot be resumed if the database
+        # returns the objects in a different order
+        class ReversedStarAlertTestDBObj(StarAlertTestDBObj):
+
+            def query_columns_htmid(self, **kwargs):
+                chunk_list = list(StarAlertTestDBObj.query_columns_htmid(self, **kwargs))
+                return chunk_list[::-1]
+
+        reversed_db = ReversedStarAlertTestDBObj(database=self.star_db_name, driver='sqlite')
+        with self.assertRaises(RuntimeError):
+            alert_gen.alert_data_from_htmid(htmid, reversed_db, resume=True, **resume_kwargs)
+        self.assertEqual(backend.read_journal(), journal)
+
+        n_rows = alert_gen.alert_data_from_htmid(htmid, star_db, resume=True, **resume_kwargs)
+        self.assertTrue(backend.read_journal()['complete'])
+        control_name = os.path.join(self.output_dir, 'alert_test_%d_sqlite.db' % htmid)
+        for table_name in ('alert_data', 'metadata', 'quiescent_flux', 'baseline_astrometry'):
+            query = 'SELECT * FROM %s' % table_name
+            with sqlite3.connect(control_name) as conn:
+                control_rows = sorted(conn.execute(query).fetchall())
+            with sqlite3.connect(backend.file_name) as conn:
+                test_rows = sorted(conn.execute(query).fetchall())
+            self.assertEqual(test_rows, control_rows)
+            if table_name == 'alert_data':
+                self.assertEqual(n_rows, len(test_rows))
+
+        # resuming a complete output does nothing
+        self.assertEqual(alert_gen.alert_data_from_htmid(htmid, star_db, resume=True,
+                                                         **resume_kwargs), n_rows)
+        shutil.rmtree(resume_output_dir)
+
         dummy_sed = Sed()
 
         bp_dict = BandpassDict.loadTotalBandpassesFromFiles()
@@ -519,6 +621,127 @@ class AlertDataGeneratorTestCase(unittest.TestCase):
         self.assertLess(len(obshistid_unqid_simulated_set), n_total_observations)
         self.assertGreater(n_tot_ast_simulated, 0)
 
+    def test_output_alert_data(self):
+        """
+        Test that _output_alert_data writes every cached row, with the
+        right types and units, and returns the number of rows written
+        """
+        rng = np.random.RandomState(6623)
+        data_cache = {}
+        control_rows = []
+        for i_tag, obshistid in enumerate((11, 4, 11, 97)):
+            n_obj = 20*i_tag
+            cache = {}
+            cache['uniqueId'] = rng.randint(0, 2**40, size=n_obj)
+            cache['xPix'] = rng.random_sample(n_obj)*4000.0
+            cache['yPix'] = rng.random_sample(n_obj)*4000.0
+            cache['chipNum'] = rng.randint(0, 189, size=n_obj)
+            cache['flux'] = rng.random_sample(n_obj)
+            cache['dflux'] = rng.normal(0.0, 1.0, size=n_obj)
+            cache['SNR'] = rng.random_sample(n_obj)*100.0
+            cache['raICRS'] = rng.random_sample(n_obj)*2.0*np.pi
+            cache['decICRS'] = (rng.random_sample(n_obj)-0.5)*np.pi
+            data_cache['%d_%d' % (obshistid, i_tag)] = cache
+            for i_obj in range(n_obj):
+                control_rows.append((int(cache['uniqueId'][i_obj]), obshistid,
+                                     cache['xPix'][i_obj], cache['yPix'][i_obj],
+                                     int(cache['chipNum'][i_obj]),
+                                     cache['dflux'][i_obj], cache['SNR'][i_obj],
+                                     np.degrees(cache['raICRS'][i_obj]),
+                                     np.degrees(cache['decICRS'][i_obj])))
+
+        alert_gen = AlertDataGenerator(testing=True)
+        out_dir = tempfile.mkdtemp(dir=ROOT, prefix='output_alert_data')
+        with SqliteAlertDataBackend(out_dir, 'test_output', 12) as backend:
+            self.assertEqual(alert_gen._output_alert_data(backend, data_cache),
+                             len(control_rows))
+            self.assertEqual(alert_gen._output_alert_data(backend, {}), 0)
+
+        with sqlite3.connect(backend.file_name) as conn:
+            rows = conn.execute('SELECT * FROM alert_data').fetchall()
+
+        self.assertEqual(len(rows), len(control_rows))
+        for row, control in zip(rows, control_rows):
+            self.assertIsInstance(row[0], int)
+            self.assertIsInstance(row[4], int)
+            self.assertEqual(row, control)
+
+        del alert_gen
+        gc.collect()
+        if os.path.exists(out_dir):
+            shutil.rmtree(out_dir)
+
+
+class PhotometricFilterTestCase(unittest.TestCase):
+    """
+    Test the vectorized photometric filters of AlertDataGenerator
+    against the per-object loops they replaced
+    """
+
+    def setUp(self):
+        rng = np.random.RandomState(8123)
+        self.n_obj = 60
+        self.n_time = 11
+        self.dmag_cutoff = 0.005
+        self.obs_mag_cutoff = (23.68, 24.89, 24.43, 24.0, 24.45, 22.60)
+        self.dmag_arr = rng.normal(0.0, 0.01, size=(self.n_time, 6, self.n_obj))
+        # some objects do not vary at all
+        self.dmag_arr[:, :, rng.random_sample(self.n_obj) < 0.3] = 0.0
+        # NaN in one band at one time, in one band at all times
+        # and in every band at every time
+        self.dmag_arr[3, 2, 0] = np.nan
+        self.dmag_arr[:, 4, 1] = np.nan
+        self.dmag_arr[:, :, 2] = np.nan
+        self.dmag_arr_transpose = self.dmag_arr.transpose(2, 1, 0)
+
+        self.time_arr = np.where(rng.random_sample((self.n_obj, self.n_time)) < 0.4, 1, -1)
+        # some objects are never detected
+        self.time_arr[5:8] = -1
+        self.time_arr[0:3] = 1
+        self.q_m_arr = rng.uniform(22.0, 25.5, size=(self.n_obj, 6))
+
+    def test_photometrically_variable(self):
+        """
+        Test _photometrically_variable against the loop that was
+        in _filter_on_photometry_then_chip_name
+        """
+        control = []
+        for i_obj in range(self.n_obj):
+            for i_filter in range(6):
+                if np.abs(self.dmag_arr_transpose[i_obj][i_filter]).max() >= self.dmag_cutoff:
+                    control.append(i_obj)
+                    break
+
+        test = _photometrically_variable(self.dmag_arr, self.dmag_cutoff)
+        self.assertIn(0, control)
+        self.assertIn(1, control)
+        self.assertNotIn(2, control)
+        np.testing.assert_array_equal(test[0], np.array(control, dtype=int))
+
+    def test_detectably_variable(self):
+        """
+        Test _detectably_variable against the loop that was in
+        alert_data_from_htmid
+        """
+        control = []
+        for i_obj in range(self.n_obj):
+            valid_times = np.where(self.time_arr[i_obj] > 0)
+            if len(valid_times[0]) == 0:
+                continue
+            for i_filter in range(6):
+                dmag = self.dmag_arr_transpose[i_obj][i_filter][valid_times]
+                if np.abs(dmag).max() > self.dmag_cutoff:
+                    if self.q_m_arr[i_obj][i_filter] + dmag.min() <= self.obs_mag_cutoff[i_filter]:
+                        control.append(i_obj)
+                        break
+
+        test = _detectably_variable(self.dmag_arr_transpose, self.time_arr,
+                                    self.q_m_arr, self.dmag_cutoff,
+                                    self.obs_mag_cutoff)
+        self.assertGreater(len(control), 0)
+        self.assertNotIn(2, control)
+        np.testing.assert_array_equal(test, np.array(control, dtype=int))
+
 
 class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
     pass